@@ -3,73 +3,171 @@
 Analyseur d'altitude pour la détection de segments sous altitude minimale
 """
 
-from qgis.core import QgsGeometry, QgsPointXY, QgsMessageLog, Qgis, QgsProject
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+from qgis.core import (QgsPointXY, QgsMessageLog, Qgis, QgsProject, QgsFeatureRequest,
+                       QgsGeometry, QgsVectorLayer, QgsFeature, QgsField)
+from qgis.PyQt.QtCore import QMetaType
 from qgis.PyQt.QtWidgets import QProgressDialog, QApplication, QMessageBox
 from qgis.PyQt.QtCore import Qt
 
+from .geometry_arrays import geometry_to_arrays, arrays_to_geometry
 from .visualization.map_capture import MapCapturer
 
 
+@dataclass
+class LowAltitudeGroup:
+    """Groupe de segments consécutifs sous l'altitude minimale"""
+    number: int
+    segment_count: int
+    min_z: float
+    distance: float
+    start_point: QgsPointXY
+    end_point: QgsPointXY
+    geometry: QgsGeometry
+    features: List[int] = field(default_factory=list)
+
+
 class AltitudeAnalyzer:
     """Classe dédiée à l'analyse des segments d'altitude"""
     
+    # Les segments d'altitude moyenne inférieure ou égale sont ignorés
+    IGNORED_ALTITUDE = 30
+    # Distance maximale entre la fin d'un segment et le début du suivant
+    CONTINUITY_TOLERANCE = 0.001
+    # Champs de la couche des groupes (mode détection seule)
+    GROUP_FIELDS = ("groupe", "nb_segments", "alt_min", "distance")
+    
     def __init__(self, iface):
         self.iface = iface
-        self.group_count = 0
     
-    def analyze_segments(self, source_layer, min_altitude, buffer_size, capture_folder):
+    def analyze_segments(self, source_layer, min_altitude, progress_callback=None):
         """
-        Analyse les segments et génère les captures pour ceux sous l'altitude minimale
+        Détecte les groupes de segments consécutifs sous l'altitude minimale
+        
+        Phase de détection seule : aucun appel à l'interface ni rendu, peut
+        être exécutée dans une tâche de fond. Les captures sont générées
+        ensuite par capture_groups, éventuellement pour une partie des groupes.
         
         Args:
             source_layer: Couche source à analyser
             min_altitude: Altitude minimale de référence
+            progress_callback: Callback de progression (value, maximum) (optionnel)
+            
+        Returns:
+            list: Liste des groupes détectés (LowAltitudeGroup)
+        """
+        fids, coords, part_offsets, feature_parts = self._load_features(
+            source_layer, progress_callback
+        )
+        if not fids:
+            return []
+        return self._detect_groups(fids, coords, part_offsets, feature_parts, min_altitude)
+    
+    def capture_groups(self, groups, buffer_size, capture_folder):
+        """
+        Génère les captures des groupes détectés (thread principal)
+        
+        Args:
+            groups: Groupes (LowAltitudeGroup) renvoyés par analyze_segments ou groups_from_layer
             buffer_size: Taille du buffer pour les captures
             capture_folder: Dossier de destination des captures
             
         Returns:
             list: Liste des segments détectés (count, min_z, captured_path, distance)
         """
-        # Vérifier la correspondance des CRS avant de commencer
-
-        if not self._check_crs_compatibility(source_layer):
-            raise ValueError("CRS de la couche source ne correspond pas au CRS du projet.")
-
         capturer = MapCapturer(self.iface, capture_folder)
         low_segments = []
-        self.group_count = 0
-        
-        # État du groupe courant
-        group_state = self._init_group_state()
-        
 
-        progress = QProgressDialog("Traitement en cours...", "Annuler", 0, 100, self.iface.mainWindow())
+        progress = QProgressDialog("Génération des captures...", "Annuler", 0, len(groups), self.iface.mainWindow())
         progress.setWindowTitle("Progression")
-        progress.setWindowModality(Qt.WindowModal)  # Bloque l'accès à QGIS pendant le traitement
+        progress.setWindowModality(Qt.WindowModal)  # Bloque l'accès à QGIS pendant les captures
         progress.show()
-        total = source_layer.featureCount()
 
-        for i, feature in enumerate(source_layer.getFeatures()):
-            z_avg = self._get_feature_altitude(feature)
-            if z_avg is None or z_avg <= 30:
-                continue
-                
-            if z_avg < min_altitude:
-                self._process_low_altitude_segment(
-                    feature, z_avg, group_state, capturer, buffer_size, low_segments
-                )
-            else:
-                self._finalize_current_group(group_state, capturer, buffer_size, low_segments)
-            progress.setValue( int((i/total) * 100) )
-            QApplication.processEvents()  # Permet à QGIS de rester réactif
+        for i, group in enumerate(groups):
+            self._capture_group(group, capturer, buffer_size, low_segments)
+            progress.setValue(i + 1)
+            QApplication.processEvents()  # Une fois par groupe seulement
             if progress.wasCanceled():
                 break
         progress.close()
-        # Finaliser le dernier groupe si nécessaire
-        self._finalize_current_group(group_state, capturer, buffer_size, low_segments)
         return low_segments
     
-    def _check_crs_compatibility(self, source_layer):
+    def create_group_layer(self, groups, crs, name):
+        """
+        Crée une couche vectorielle des groupes détectés (une entité par groupe)
+        
+        Args:
+            groups: Groupes renvoyés par analyze_segments
+            crs: Système de coordonnées de la couche analysée
+            name: Nom de la couche
+            
+        Returns:
+            QgsVectorLayer: Couche mémoire MultiLineStringZ (champs GROUP_FIELDS)
+        """
+        layer = QgsVectorLayer(f"MultiLineStringZ?crs={crs.authid()}", name, "memory")
+        provider = layer.dataProvider()
+        provider.addAttributes([
+            QgsField("groupe", QMetaType.Int),
+            QgsField("nb_segments", QMetaType.Int),
+            QgsField("alt_min", QMetaType.Double),
+            QgsField("distance", QMetaType.Double)
+        ])
+        layer.updateFields()
+        
+        features = []
+        for group in groups:
+            feature = QgsFeature(layer.fields())
+            feature.setGeometry(group.geometry)
+            feature.setAttributes([group.number, group.segment_count,
+                                   group.min_z, group.distance])
+            features.append(feature)
+        provider.addFeatures(features)
+        layer.updateExtents()
+        return layer
+    
+    def is_group_layer(self, layer):
+        """Indique si une couche a été créée par create_group_layer"""
+        names = layer.fields().names()
+        return all(name in names for name in self.GROUP_FIELDS)
+    
+    def groups_from_layer(self, layer, selected_only=True):
+        """
+        Relit les groupes d'une couche créée par create_group_layer
+        
+        Args:
+            layer: Couche des groupes
+            selected_only: Ne relire que les entités sélectionnées (toutes s'il n'y en a pas)
+            
+        Returns:
+            list: Groupes (LowAltitudeGroup) triés par numéro
+        """
+        if selected_only and layer.selectedFeatureCount():
+            features = layer.selectedFeatures()
+        else:
+            features = layer.getFeatures()
+        
+        groups = []
+        for feature in features:
+            geom = feature.geometry()
+            if geom.isEmpty():
+                continue
+            # Les parties sont dans l'ordre du parcours : premier et dernier sommets
+            vertices, _ = geometry_to_arrays(geom)
+            groups.append(LowAltitudeGroup(
+                number=feature["groupe"],
+                segment_count=feature["nb_segments"],
+                min_z=feature["alt_min"],
+                distance=feature["distance"],
+                start_point=QgsPointXY(vertices[0, 0], vertices[0, 1]),
+                end_point=QgsPointXY(vertices[-1, 0], vertices[-1, 1]),
+                geometry=QgsGeometry(geom)
+            ))
+        return sorted(groups, key=lambda group: group.number)
+    
+    def check_crs_compatibility(self, source_layer):
         """
         Vérifie que le CRS de la couche correspond au CRS du projet
         
@@ -111,138 +209,176 @@ class AltitudeAnalyzer:
         
         return True
     
-    def _init_group_state(self):
-        """Initialise l'état d'un nouveau groupe"""
-        return {
-            'features': [],
-            'min_z': float('inf'),
-            'merged_geom': None,
-            'start_point': None,
-            'end_point': None,
-            'distance': 0.0
-        }
-    
-    def _get_feature_altitude(self, feature):
+    def _load_features(self, source_layer, progress_callback=None):
         """
-        Calcule l'altitude moyenne d'une feature
+        Lit les coordonnées de toutes les entités non vides dans des tableaux
         
         Args:
-            feature: Feature à analyser
+            source_layer: Couche source à analyser
+            progress_callback: Callback de progression (value, maximum) (optionnel)
             
         Returns:
-            float or None: Altitude moyenne ou None si pas de données Z
+            tuple: (fids, coords (N, 3), part_offsets, feature_parts) où
+            feature_parts donne l'indice de la première partie de chaque
+            entité suivi du nombre de parties
         """
-        geom = feature.geometry()
-        if geom.isEmpty():
-            return None
-            
-        vertices = list(geom.vertices())
-        if not vertices:
-            return None
-            
-        z_values = [v.z() for v in vertices if v.is3D()]
-        return sum(z_values) / len(z_values) if z_values else None
+        fids, coords, part_offsets, feature_parts = [], [], [0], [0]
+        if progress_callback:
+            progress_callback(0, source_layer.featureCount())
+        for i, feature in enumerate(source_layer.getFeatures(QgsFeatureRequest().setNoAttributes())):
+            if progress_callback:
+                progress_callback(i, None)
+            geom = feature.geometry()
+            if geom.isEmpty():
+                continue
+            vertices, offsets = geometry_to_arrays(geom)
+            fids.append(feature.id())
+            coords.append(vertices)
+            part_offsets.extend(offsets[1:] + part_offsets[-1])
+            feature_parts.append(len(part_offsets) - 1)
+        
+        if not fids:
+            return fids, np.empty((0, 3)), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        return (fids, np.concatenate(coords), np.array(part_offsets, dtype=np.int64),
+                np.array(feature_parts, dtype=np.int64))
     
-    def _process_low_altitude_segment(self, feature, z_avg, group_state, capturer, buffer_size, low_segments):
+    def _detect_groups(self, fids, coords, part_offsets, feature_parts, min_altitude):
         """
-        Traite un segment sous l'altitude minimale
+        Détecte en une passe vectorisée les groupes de segments consécutifs sous l'altitude minimale
+        
+        Les segments sans altitude ou d'altitude moyenne inférieure ou égale
+        à IGNORED_ALTITUDE sont ignorés. Un segment sous l'altitude minimale
+        prolonge le groupe du segment retenu précédent si celui-ci est aussi
+        sous l'altitude minimale et si ses extrémités se touchent ; un
+        segment au-dessus clôt le groupe.
         
         Args:
-            feature: Feature du segment
-            z_avg: Altitude moyenne du segment
-            group_state: État du groupe courant
-            capturer: Instance de MapCapturer
-            buffer_size: Taille du buffer
-            low_segments: Liste des segments détectés
+            fids, coords, part_offsets, feature_parts: Voir _load_features
+            min_altitude: Altitude minimale de référence
+            
+        Returns:
+            list: Liste des groupes détectés (LowAltitudeGroup)
         """
-        geom = feature.geometry()
-        vertices = list(geom.vertices())
-        segment_start = QgsPointXY(vertices[0].x(), vertices[0].y())
+        feature_offsets = part_offsets[feature_parts]
+        first_vertex, last_vertex = feature_offsets[:-1], feature_offsets[1:] - 1
         
-        # Vérifier la continuité avec le groupe précédent
-        if not self._is_consecutive_segment(segment_start, group_state['end_point']):
-            self._finalize_current_group(group_state, capturer, buffer_size, low_segments)
+        # Altitude moyenne de chaque entité, sans les Z manquants
+        z = coords[:, 2]
+        known = ~np.isnan(z)
+        z_sum = np.add.reduceat(np.where(known, z, 0.0), first_vertex)
+        z_count = np.add.reduceat(known.astype(np.int64), first_vertex)
+        z_avg = np.full(len(z_sum), np.nan)
+        np.divide(z_sum, z_count, out=z_avg, where=z_count > 0)
         
-        # Ajouter au groupe actuel
-        if not group_state['features']:
-            group_state.update({
-                'merged_geom': QgsGeometry(geom),
-                'start_point': segment_start,
-                'distance': geom.length()
-            })
-        else:
-            group_state['merged_geom'] = group_state['merged_geom'].combine(geom)
-            group_state['distance'] += geom.length()
-            
-        group_state.update({
-            'end_point': QgsPointXY(vertices[-1].x(), vertices[-1].y()),
-            'min_z': min(group_state['min_z'], z_avg)
-        })
-        group_state['features'].append(feature.id())
+        # Longueur 2D de chaque entité, sans les sauts entre parties
+        steps = np.zeros(len(coords))
+        steps[1:] = np.hypot(*np.diff(coords[:, :2], axis=0).T)
+        steps[part_offsets[:-1]] = 0.0
+        length = np.add.reduceat(steps, first_vertex)
+        
+        # Entités retenues : altitude connue au-dessus du seuil ignoré (NaN exclus)
+        kept = np.flatnonzero(z_avg > self.IGNORED_ALTITUDE)
+        if kept.size == 0:
+            return []
+        z_avg, length = z_avg[kept], length[kept]
+        start_xy = coords[first_vertex[kept], :2]
+        end_xy = coords[last_vertex[kept], :2]
+        low = z_avg < min_altitude
+        
+        # Un segment bas rejoint le précédent si celui-ci est bas et le touche
+        joined = np.zeros(len(kept), dtype=bool)
+        gap = np.hypot(*(start_xy[1:] - end_xy[:-1]).T)
+        joined[1:] = low[1:] & low[:-1] & (gap <= self.CONTINUITY_TOLERANCE)
+        
+        # Bornes des groupes (membres contigus) : un segment bas non rattaché ouvre
+        # un groupe, qui se termine avant le segment suivant non rattaché
+        opens = np.flatnonzero(low & ~joined)
+        closes = np.flatnonzero(low & ~np.append(joined[1:], False)) + 1
+        min_z = np.minimum.reduceat(np.where(low, z_avg, np.inf), opens)
+        distance = np.add.reduceat(np.where(low, length, 0.0), opens)
+        
+        kept_fids = np.asarray(fids)[kept]
+        groups = []
+        for number, (start, end, group_min_z, group_distance) in enumerate(
+                zip(opens, closes, min_z, distance), 1):
+            groups.append(LowAltitudeGroup(
+                number=number,
+                segment_count=int(end - start),
+                min_z=float(group_min_z),
+                distance=float(group_distance),
+                start_point=QgsPointXY(*start_xy[start]),
+                end_point=QgsPointXY(*end_xy[end - 1]),
+                geometry=self._group_geometry(coords, part_offsets, feature_parts,
+                                              kept[start:end]),
+                features=kept_fids[start:end].tolist()
+            ))
+        return groups
     
-    def _is_consecutive_segment(self, segment_start, previous_end, tolerance=0.001):
+    def _group_geometry(self, coords, part_offsets, feature_parts, members):
         """
-        Vérifie si un segment est consécutif au précédent
+        Assemble la géométrie d'un groupe en une seule MultiLineStringZ
+        
+        Les parties de toutes les entités du groupe sont rassemblées telles
+        quelles (sans fusion ni noeuds), en un temps proportionnel au nombre
+        de sommets du groupe.
         
         Args:
-            segment_start: Point de début du segment courant
-            previous_end: Point de fin du segment précédent
-            tolerance: Tolérance pour la distance (défaut: 0.001)
+            coords, part_offsets, feature_parts: Voir _load_features
+            members: Indices des entités du groupe
             
         Returns:
-            bool: True si les segments sont consécutifs
+            QgsGeometry: Géométrie multiple du groupe
         """
-        if not previous_end:
-            return True
-            
-        distance = ((segment_start.x() - previous_end.x()) ** 2 + 
-                   (segment_start.y() - previous_end.y()) ** 2) ** 0.5
-        return distance <= tolerance
+        parts = self._concatenated_ranges(feature_parts[members], feature_parts[members + 1])
+        part_starts, part_ends = part_offsets[parts], part_offsets[parts + 1]
+        vertices = self._concatenated_ranges(part_starts, part_ends)
+        offsets = np.concatenate(([0], np.cumsum(part_ends - part_starts)))
+        return arrays_to_geometry(coords[vertices], offsets, multi=True)
     
-    def _finalize_current_group(self, group_state, capturer, buffer_size, low_segments):
+    @staticmethod
+    def _concatenated_ranges(starts, ends):
+        """Concatène les intervalles [starts[i], ends[i]) en un seul tableau d'indices"""
+        counts = ends - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    
+    def _capture_group(self, group, capturer, buffer_size, low_segments):
         """
-        Finalise et sauvegarde le groupe courant
+        Génère la capture d'un groupe détecté
         
         Args:
-            group_state: État du groupe à finaliser
+            group: Groupe à capturer
             capturer: Instance de MapCapturer
             buffer_size: Taille du buffer
             low_segments: Liste des segments détectés
         """
-        if not group_state['features']:
-            return
-            
-        self.group_count += 1
-        distance_text = f"{group_state['distance']:.0f}m"
-        filename = f"groupe_{self.group_count}_alt{group_state['min_z']:.0f}m_{distance_text}.png"
+        # Numéro de détection : les captures faites plus tard gardent le même nom
+        distance_text = f"{group.distance:.0f}m"
+        filename = f"groupe_{group.number}_alt{group.min_z:.0f}m_{distance_text}.png"
         
         try:
             captured_path = capturer.capture_segment_with_markers(
-                group_state['merged_geom'], 
-                group_state['start_point'], 
-                group_state['end_point'],
+                group.geometry, 
+                group.start_point, 
+                group.end_point,
                 distance_text, 
                 buffer_size=buffer_size, 
-                min_altitude=group_state['min_z'], 
+                min_altitude=group.min_z, 
                 filename=filename
             )
             
             if captured_path:
                 low_segments.append((
-                    len(group_state['features']), 
-                    group_state['min_z'], 
+                    group.segment_count, 
+                    group.min_z, 
                     captured_path, 
-                    group_state['distance']
+                    group.distance
                 ))
                 
         except Exception as e:
             QgsMessageLog.logMessage(
-                f"Erreur capture groupe {self.group_count}: {str(e)}", 
+                f"Erreur capture groupe {group.number}: {str(e)}", 
                 level=Qgis.Warning
             )
-        
-        # Réinitialiser l'état du groupe
-        group_state.update(self._init_group_state())
     
     def format_results_message(self, low_segments, min_altitude, capture_folder):
         """
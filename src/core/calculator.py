@@ -4,57 +4,155 @@ Calcul d'altitude relative pour les polylignes
 """
 
 from qgis.core import (QgsProject, QgsVectorLayer, QgsFeature,
-                      QgsGeometry, QgsField, QgsFields, QgsWkbTypes, QgsMessageLog, Qgis, QgsPoint, QgsCoordinateTransform)
+                      QgsGeometry, QgsField, QgsFields, QgsWkbTypes, QgsMessageLog, Qgis, QgsCoordinateTransform,
+                      QgsVectorDataProvider, QgsApplication)
 from qgis.PyQt.QtCore import QMetaType
-import processing
+from collections import deque
+import math
+import os
 import numpy as np
 
+from .dem_sampler import DemSampler
+from .dem_pyramid import DemPyramid
+from .dem_catalog import DemCatalog
+from .parallel import create_process_pool, chunk_bounds
+from .result_cache import AltitudeResultCache
+from .terrain_store import TerrainProfileStore
+from .sampling_kernels import (relative_altitudes, relative_altitude_chunk,
+                               densify_counts, densify_parts, point_batches,
+                               clearance_statistics, interpolation_pixels,
+                               threshold_classes)
+from .tasks import TaskCanceledError
+from .geometry_arrays import (geometry_to_arrays, arrays_to_geometry,
+                              transform_coords, wkb_layout)
+
 
 def replace_z(geom: QgsGeometry, new_z: np.ndarray) -> QgsGeometry:
     """
     Remplace les valeurs Z d'une géométrie par celles données dans new_z.
-    Fonctionne pour LineStringZ et PolygonZ simples.
+    Fonctionne pour LineStringZ, MultiLineStringZ et PolygonZ (ainsi que
+    MultiPolygonZ) : les Z sont écrits directement dans une copie du WKB.
     
     Parameters
     ----------
     geom : QgsGeometry
         Géométrie d'entrée (doit avoir des Z).
     new_z : np.ndarray
-        Tableau 1D avec les nouvelles altitudes (même nombre de sommets).
+        Tableau 1D avec les nouvelles altitudes, dans l'ordre des sommets
+        de toutes les parties.
     
     Returns
     -------
     QgsGeometry
         Nouvelle géométrie avec Z remplacés.
     """
-    g = geom.constGet()
-    verts = list(g.vertices())
+    buf = bytearray(geom.asWkb())
+    endian, _, has_z, has_m, runs = wkb_layout(buf)
+    if not has_z:
+        raise NotImplementedError(f"replace_z non implémenté pour {geom.wkbType()}")
 
-    if len(verts) != len(new_z):
-        raise ValueError(f"Nombre de sommets ({len(verts)}) != taille de new_z ({len(new_z)})")
+    num_vertices = sum(count for _, count in runs)
+    if num_vertices != len(new_z):
+        raise ValueError(f"Nombre de sommets ({num_vertices}) != taille de new_z ({len(new_z)})")
 
-    # Reconstruire les points avec les nouveaux Z
-    new_points = [QgsPoint(v.x(), v.y(), float(z)) for v, z in zip(verts, new_z)]
+    # Écrire les nouveaux Z partie par partie, directement dans le tampon
+    dims = 3 + has_m
+    dtype = np.dtype(endian + "f8")
+    start = 0
+    for pos, count in runs:
+        values = np.frombuffer(buf, dtype=dtype, count=count * dims, offset=pos)
+        values.reshape(count, dims)[:, 2] = new_z[start:start + count]
+        start += count
 
-    if g.wkbType() in (QgsWkbTypes.LineStringZ, QgsWkbTypes.LineString25D):
-        return QgsGeometry.fromPolyline(new_points)
-    elif g.wkbType() in (QgsWkbTypes.PolygonZ, QgsWkbTypes.Polygon25D):
-        return QgsGeometry.fromPolygonXY([new_points])
-    elif g.wkbType() in (QgsWkbTypes.MultiLineStringZ, QgsWkbTypes.MultiLineString25D):
-        raise NotImplementedError("""Le plugin ne fonctionne pas pour les MultiLineStringZ, veuillez convertir votre couche en LineStringZ avec l'outil "De morceaux multiples à morceaux uniques" de QGIS.""")
-    else:
-        raise NotImplementedError(f"replace_z non implémenté pour {g.wkbType()}")
+    new_geom = QgsGeometry()
+    new_geom.fromWkb(bytes(buf))
+    return new_geom
 
 
 class AltitudeCalculator:
-    def __init__(self):
-        pass
+    # Champs ajoutés par le calcul
+    ALTITUDE_FIELDS = ("alt_sol", "alt_relative")
+    # Champs ajoutés par le profil densifié : hauteur minimale et moyenne
+    # au-dessus du sol, distance du point le plus bas depuis le début de la trace
+    PROFILE_FIELDS = ("alt_rel_min", "alt_rel_moy", "dist_alt_min")
+    # Champs ajoutés par le couloir latéral : hauteur minimale au-dessus du
+    # point le plus haut du couloir, distance de ce point depuis le début de la trace
+    CORRIDOR_FIELDS = ("alt_rel_couloir", "dist_couloir_min")
+    # Champ ajouté par l'évaluation du seuil : 1 si la trace passe sous le seuil
+    THRESHOLD_FIELDS = ("sous_seuil",)
+
+    def __init__(self, tile_size=512, tile_cache_mb=256, batch_size=5000, workers=1,
+                 use_cache=False, cache_path=None, cache_max_mb=256):
+        """
+        Initialise le calculateur
+
+        Args:
+            tile_size: Taille des tuiles lues dans le MNT (pixels)
+            tile_cache_mb: Mémoire maximale du cache de tuiles MNT (Mo)
+            batch_size: Nombre d'entités écrites par lot dans le fournisseur
+            workers: Nombre de processus de calcul (1 = calcul en série)
+            use_cache: Réutiliser les résultats des entités déjà calculées
+            cache_path: Fichier du cache de résultats (défaut : profil QGIS)
+            cache_max_mb: Taille maximale du cache de résultats (Mo)
+        """
+        self.tile_size = tile_size
+        self.tile_cache_mb = tile_cache_mb
+        self.batch_size = batch_size
+        self.workers = workers
+        self.use_cache = use_cache
+        self.cache_path = cache_path or os.path.join(
+            QgsApplication.qgisSettingsDirPath(), "analyse_survol", "cache_altitudes.sqlite"
+        )
+        self.cache_max_mb = cache_max_mb
+        
+        # Stockage des altitudes du sol (dossier de fichiers .npy), désactivé par défaut
+        self.terrain_store_path = None
+        self.store_terrain_profiles = False
+        
+        # Profil densifié à la résolution du MNT (hauteur minimale réelle), désactivé par défaut
+        self.profile_clearance = False
+        
+        # Demi-largeur du couloir latéral (unités du CRS du MNT), 0 = désactivé
+        self.corridor_radius = 0.0
+        
+        # Évaluation du seuil d'altitude minimale sur pyramide min/max, 0 = désactivée
+        self.clearance_threshold = 0.0
+        self.pyramid_factor = 16
+        self.pyramid_dir = os.path.join(
+            QgsApplication.qgisSettingsDirPath(), "analyse_survol", "pyramides"
+        )
+        
+        # Nombre maximal de tuiles ouvertes simultanément pour un MNT en dossier de tuiles
+        self.max_open_tiles = 32
+        
+        # Nombre maximal de points densifiés traités par lot (profils, couloir, seuil)
+        self.max_profile_points = 4000000
+        
+        # Rayon maximal du couloir en pixels du MNT (bordure lue autour de chaque tuile)
+        self.max_corridor_pixels = 256
+
+    def output_field_names(self):
+        """Noms des champs ajoutés par le calcul selon les options choisies"""
+        names = self.ALTITUDE_FIELDS
+        if self.profile_clearance:
+            names += self.PROFILE_FIELDS
+        if self.corridor_radius > 0:
+            names += self.CORRIDOR_FIELDS
+        if self.clearance_threshold > 0:
+            names += self.THRESHOLD_FIELDS
+        return names
 
-    def create_output_layer(self, source_layer, output_crs=None):
+    def _output_field(self, name):
+        """Crée la définition d'un champ ajouté par le calcul"""
+        if name in self.THRESHOLD_FIELDS:
+            return QgsField(name, QMetaType.Type.Int)
+        return QgsField(name, QMetaType.Type.Double)
+
+    def create_output_layer(self, source_layer, output_crs=None, progress_callback=None):
         """Créer une nouvelle couche de sortie"""
         # Créer une couche en mémoire
         geom_type = source_layer.geometryType()
-        if geom_type == QgsWkbTypes.LineGeometry:
+        if geom_type == QgsWkbTypes.LineGeometry and not QgsWkbTypes.isMultiType(source_layer.wkbType()):
             geom_string = "LineStringZ"
         else:
             geom_string = "MultiLineStringZ"
@@ -77,8 +175,8 @@ class AltitudeCalculator:
             new_fields.append(field)
             
         # Champs pour les altitudes
-        new_fields.append(QgsField("alt_sol", QMetaType.Type.Double))
-        new_fields.append(QgsField("alt_relative", QMetaType.Type.Double))
+        for name in self.output_field_names():
+            new_fields.append(self._output_field(name))
         
         output_layer.dataProvider().addAttributes(new_fields)
         output_layer.updateFields()
@@ -93,26 +191,56 @@ class AltitudeCalculator:
                 QgsProject.instance()
             )
         
-        # Copier les features
+        # Copier les features par lots : attributs recopiés en bloc,
+        # géométries reprojetées par lot puis écrites dans le fournisseur
+        provider = output_layer.dataProvider()
+        output_fields = output_layer.fields()
+        empty_altitudes = [None] * (output_fields.count() - fields.count())
         features = []
-        for feature in source_layer.getFeatures():
-            new_feature = QgsFeature(output_layer.fields())
-            
-            # Copier et transformer la géométrie si nécessaire
-            geom = feature.geometry()
-            if transform:
-                geom.transform(transform)
-            new_feature.setGeometry(geom)
-            
-            # Copier les attributs existants
-            for field in source_layer.fields():
-                new_feature[field.name()] = feature[field.name()]
-                
+        if progress_callback:
+            progress_callback(0, source_layer.featureCount())
+        for i, feature in enumerate(source_layer.getFeatures()):
+            if progress_callback:
+                progress_callback(i, None)
+            new_feature = QgsFeature(output_fields)
+            new_feature.setAttributes(feature.attributes() + empty_altitudes)
+            new_feature.setGeometry(feature.geometry())
             features.append(new_feature)
             
-        output_layer.dataProvider().addFeatures(features)
+            if len(features) >= self.batch_size:
+                self._add_features(provider, features, transform)
+            
+        self._add_features(provider, features, transform)
+        output_layer.updateExtents()
         return output_layer
     
+    def _add_features(self, provider, features, transform=None):
+        """
+        Reprojette un lot d'entités en un seul appel puis l'ajoute au fournisseur
+        
+        Args:
+            provider: Fournisseur de données de la couche de sortie
+            features: Liste d'entités à ajouter (vidée après écriture)
+            transform: QgsCoordinateTransform à appliquer (optionnel)
+        """
+        if transform:
+            batch = [f for f in features if not f.geometry().isEmpty()]
+            arrays = [geometry_to_arrays(f.geometry()) for f in batch]
+            if arrays:
+                # Regrouper toutes les coordonnées du lot pour une seule transformation
+                coords = transform_coords(np.concatenate([c for c, _ in arrays]), transform)
+                start = 0
+                for feature, (part_coords, offsets) in zip(batch, arrays):
+                    end = start + len(part_coords)
+                    feature.setGeometry(arrays_to_geometry(
+                        coords[start:end], offsets, feature.geometry().isMultipart()
+                    ))
+                    start = end
+        
+        if features and not provider.addFeatures(features)[0]:
+            raise RuntimeError("Échec de l'ajout des entités à la couche de sortie")
+        features.clear()
+    
     def add_altitude_fields(self, layer):
         """Ajouter les champs d'altitude à une couche existante"""
         provider = layer.dataProvider()
@@ -120,102 +248,602 @@ class AltitudeCalculator:
         # Vérifier si les champs existent déjà
         field_names = [field.name() for field in layer.fields()]
         
-        new_fields = []
-        if "alt_sol" not in field_names:
-            new_fields.append(QgsField("alt_sol", QMetaType.Type.Double))
-        if "alt_relative" not in field_names:
-            new_fields.append(QgsField("alt_relative", QMetaType.Type.Double))
+        new_fields = [self._output_field(name)
+                      for name in self.output_field_names()
+                      if name not in field_names]
             
         if new_fields:
             provider.addAttributes(new_fields)
             layer.updateFields()
 
     def calculate_relative_altitudes(self, mnt_layer, polyline_layer, 
-                                   altitude_field, use_z_coordinate, progress_callback=None):
-        """Calculer les altitudes relatives pour chaque polyligne"""
+                                   altitude_field, use_z_coordinate, progress_callback=None,
+                                   sampling_method="nearest"):
+        """
+        Calculer les altitudes relatives pour chaque polyligne
+        
+        La couche n'est pas modifiée : les résultats sont écrits ensuite par
+        write_altitude_results, dans le thread propriétaire de la couche.
+        
+        Args:
+            mnt_layer: Couche raster du MNT (RasterSnapshot depuis une tâche) ou dossier de tuiles
+            polyline_layer: Couche des polylignes, ou LayerSnapshot d'une couche du projet
+            altitude_field, use_z_coordinate: Source de l'altitude de vol
+            progress_callback: Callback de progression (optionnel)
+            sampling_method: Méthode d'échantillonnage du MNT
+            
+        Returns:
+            tuple: (succès, message d'erreur, résultats ou None)
+        """
         try:
-            # Étape 1: Utiliser l'outil Draper pour obtenir les altitudes du terrain
+            # MNT fourni sous forme de dossier de tuiles
+            if isinstance(mnt_layer, str):
+                mnt_layer = DemCatalog.open(mnt_layer, self.max_open_tiles)
+            
+            # Étape 1: Échantillonner le MNT sous tous les sommets, tuile par tuile
             if progress_callback:
-                progress_callback(0, 0)  # Mode indéterminé pendant le drapage
+                progress_callback(0, 0)  # Mode indéterminé pendant l'échantillonnage
             
-            drape_result = processing.run("native:setzfromraster", {
-                'INPUT': polyline_layer,
-                'RASTER': mnt_layer,
-                'BAND': 1,
-                'NODATA': 0,
-                'SCALE': 1,
-                'OUTPUT': 'TEMPORARY_OUTPUT'
-            })
+            sampler = DemSampler(
+                mnt_layer,
+                method=sampling_method,
+                tile_size=self.tile_size,
+                max_cache_bytes=self.tile_cache_mb * 1024 * 1024
+            )
+            transform = None
+            if polyline_layer.crs() != sampler.crs:
+                transform = QgsCoordinateTransform(
+                    polyline_layer.crs(),
+                    sampler.crs,
+                    QgsProject.instance()
+                )
             
-            draped_layer = drape_result['OUTPUT']
+            features = []
+            vertex_arrays = []
+            part_arrays = []
+            for feature in polyline_layer.getFeatures():
+                geom = feature.geometry()
+                if geom.isEmpty():
+                    continue
+                vertices, parts = geometry_to_arrays(geom)
+                features.append(feature)
+                vertex_arrays.append(vertices)
+                part_arrays.append(parts)
             
-            # Étape 2: Calculer les altitudes relatives
-            if progress_callback:
-                progress_callback(0, polyline_layer.featureCount())
-
-            polyline_layer.startEditing()
+            if not features:
+                return True, None, None
             
-            # Créer des dictionnaires pour mapper les features
-            original_features = {f.id(): f for f in polyline_layer.getFeatures()}
-            draped_features = {f.id(): f for f in draped_layer.getFeatures()}
+            offsets = np.cumsum([0] + [len(v) for v in vertex_arrays])
+            vertices = np.concatenate(vertex_arrays)
             
-            # Note: La transformation de coordonnées est déjà gérée lors de la création de la couche de sortie
+            # Parties de chaque entité : les profils densifiés ne relient pas les parties entre elles
+            feature_parts = np.cumsum([0] + [len(parts) - 1 for parts in part_arrays])
+            part_offsets = np.concatenate(
+                [parts[:-1] + start for parts, start in zip(part_arrays, offsets[:-1])]
+                + [offsets[-1:]]
+            ).astype(np.int64)
             
-            for i, original_feature in enumerate(polyline_layer.getFeatures()):
-                if progress_callback:
-                    progress_callback(i, None)
+            alt_sol = np.empty(len(features))
+            alt_relative = np.empty(len(features))
+            new_z = np.empty(len(vertices))
+            missing = np.ones(len(features), dtype=bool)
+            
+            # Coordonnées de tous les sommets dans le CRS du MNT, utiles au stockage du terrain
+            terrain_xyz = None
+            if (self.terrain_store_path or self.profile_clearance
+                    or self.corridor_radius > 0 or self.clearance_threshold > 0):
+                terrain_xyz = transform_coords(vertices, transform) if transform else vertices
+            
+            # Réutiliser les résultats des entités déjà calculées
+            cache = None
+            try:
+                if self.use_cache:
+                    cache = AltitudeResultCache(self.cache_path, self.cache_max_mb)
+                    fingerprint = cache.dem_fingerprint(
+                        mnt_layer, sampler.reader.band, sampling_method,
+                        sampler.nodata_value, polyline_layer.crs()
+                    )
+                    keys = [cache.feature_key(fingerprint, f.geometry()) for f in features]
+                    cached = cache.get_many(keys)
+                    for i, key in enumerate(keys):
+                        hit = cached.get(key)
+                        if hit is not None and len(hit[2]) == offsets[i + 1] - offsets[i]:
+                            alt_sol[i], alt_relative[i], new_z[offsets[i]:offsets[i + 1]] = hit
+                            missing[i] = False
                 
-                fid = original_feature.id()
-                if fid not in draped_features:
-                    continue
-                    
-                draped_feature = draped_features[fid]
+                # Calculer l'altitude relative des autres entités : Z_absolu - Z_sol
+                if missing.any():
+                    counts = np.diff(offsets)
+                    vertex_mask = np.repeat(missing, counts)
+                    sub_vertices = vertices[vertex_mask]
+                    sub_offsets = np.concatenate(([0], np.cumsum(counts[missing])))
+                    if terrain_xyz is not None:
+                        sample_xyz = terrain_xyz[vertex_mask]
+                    else:
+                        sample_xyz = transform_coords(sub_vertices, transform) if transform else sub_vertices
+                    (alt_sol[missing], alt_relative[missing],
+                     new_z[vertex_mask]) = self._compute_altitudes(
+                        sampler, sub_vertices[:, 2], sample_xyz, sub_offsets, progress_callback
+                    )
                 
-                # Récupérer les coordonnées
-                orig_vertices = np.array([[v.x(), v.y(), v.z()] for v in original_feature.geometry().constGet().vertices()])
-                drape_vertices = np.array([[v.x(), v.y(), v.z()] for v in draped_feature.geometry().constGet().vertices()])
+                    if cache:
+                        cache.put_many(
+                            (keys[i], alt_sol[i], alt_relative[i], new_z[offsets[i]:offsets[i + 1]])
+                            for i in np.flatnonzero(missing)
+                        )
                 
-                if orig_vertices.shape[0] != drape_vertices.shape[0]:
+                if cache:
                     QgsMessageLog.logMessage(
-                        f"Nombre de sommets différent pour feature {fid}", 
-                        level=Qgis.Critical
+                        f"Altitudes relatives : {int((~missing).sum())} entité(s) reprise(s) du cache, "
+                        f"{int(missing.sum())} calculée(s)",
+                        level=Qgis.Info
                     )
-                    continue
-                
-                # Calculer l'altitude relative : Z_absolu - Z_sol
-                altitude_sol = np.mean(drape_vertices[:, 2])
-                altitude_absolue = np.mean(orig_vertices[:, 2])
-                altitude_relative = altitude_absolue - altitude_sol
-                
-                # Mettre à jour les champs
-                polyline_layer.changeAttributeValue(
-                    fid, 
-                    polyline_layer.fields().indexFromName("alt_sol"), 
-                    float(altitude_sol)
+            finally:
+                # Connexion SQLite libérée même en cas d'erreur ou d'annulation
+                if cache:
+                    cache.close()
+            
+            if isinstance(mnt_layer, DemCatalog):
+                QgsMessageLog.logMessage(
+                    f"Catalogue MNT : {sampler.reader.provider.tiles_opened} tuile(s) ouverte(s) "
+                    f"sur {len(mnt_layer.tiles)}",
+                    level=Qgis.Info
                 )
-                polyline_layer.changeAttributeValue(
-                    fid, 
-                    polyline_layer.fields().indexFromName("alt_relative"), 
-                    float(altitude_relative)
+            
+            # Conserver les altitudes du sol échantillonnées pour les autres outils
+            terrain_profile = None
+            if self.terrain_store_path:
+                terrain_profile = self._write_terrain_store(
+                    sampler, mnt_layer, polyline_layer, [f.id() for f in features],
+                    terrain_xyz, offsets, part_offsets, feature_parts,
+                    vertices[:, 2] - new_z, sampling_method
                 )
-                
-                # Mettre à jour la géométrie avec les Z relatifs
-                new_z = orig_vertices[:, 2] - drape_vertices[:, 2]
-                new_geom = replace_z(original_feature.geometry(), new_z)
-                
-                polyline_layer.changeGeometry(fid, new_geom)
             
-            polyline_layer.commitChanges()
+            # Hauteur au-dessus du sol le long des segments (entre les sommets)
+            profile_stats = None
+            corridor_stats = None
+            threshold_flags = None
+            if self.profile_clearance or self.corridor_radius > 0 or self.clearance_threshold > 0:
+                profile_xyz = terrain_xyz.copy()
+                profile_xyz[:, 2] = vertices[:, 2]
+            if self.profile_clearance:
+                # Les profils du stockage reprennent les points échantillonnés par ce calcul
+                profile_stats = self._compute_clearance_profiles(
+                    sampler, profile_xyz, part_offsets, feature_parts, progress_callback,
+                    terrain_profile
+                )
+            elif terrain_profile is not None:
+                self._fill_terrain_profile(sampler, terrain_xyz, part_offsets, feature_parts,
+                                           terrain_profile)
+            if terrain_profile is not None:
+                terrain_profile[0].flush()
+                del terrain_profile
             
+            # Hauteur au-dessus du point le plus haut d'un couloir autour de la trace
+            if self.corridor_radius > 0:
+                corridor_sampler = self._corridor_sampler(mnt_layer, sampler)
+                minimum, _, worst_distance = self._compute_clearance_profiles(
+                    corridor_sampler, profile_xyz, part_offsets, feature_parts, progress_callback
+                )
+                corridor_stats = (minimum, worst_distance)
+            
+            # Passages sous le seuil : pyramide min/max, pleine résolution seulement si besoin
+            if self.clearance_threshold > 0:
+                threshold_flags = self._classify_threshold(
+                    mnt_layer, sampler, profile_xyz, part_offsets, feature_parts,
+                    self.clearance_threshold, progress_callback
+                )
+            
+            # Étape 2: Préparer les altitudes relatives, écrites ensuite par write_altitude_results
             if progress_callback:
-                progress_callback(polyline_layer.featureCount(), None)
+                progress_callback(0, len(features))
+            attributes = {"alt_sol": alt_sol, "alt_relative": alt_relative}
+            if profile_stats is not None:
+                attributes.update(zip(self.PROFILE_FIELDS, profile_stats))
+            if corridor_stats is not None:
+                attributes.update(zip(self.CORRIDOR_FIELDS, corridor_stats))
+            if threshold_flags is not None:
+                attributes[self.THRESHOLD_FIELDS[0]] = threshold_flags
+            
+            # Géométries avec les Z relatifs
+            geometries = []
+            for i, original_feature in enumerate(features):
+                if progress_callback:
+                    progress_callback(i, None)
+                geometries.append(replace_z(
+                    original_feature.geometry(), new_z[offsets[i]:offsets[i + 1]]
+                ))
             
-            return True, None
+            results = {
+                "fids": [f.id() for f in features],
+                "attributes": attributes,
+                "geometries": geometries,
+            }
+            return True, None, results
             
+        except TaskCanceledError:
+            raise
         except Exception as e:
             QgsMessageLog.logMessage(f"Erreur lors du calcul: {str(e)}", 
                                    level=Qgis.Critical)
-            return False, str(e)
+            return False, str(e), None
+
+    def write_altitude_results(self, layer, results, progress_callback=None):
+        """
+        Écrit dans la couche les résultats de calculate_relative_altitudes
+        
+        À appeler dans le thread propriétaire de la couche (la tâche pour une
+        couche qu'elle a créée). Une couche du projet modifiée sur place est
+        écrite par lots depuis le thread principal avec iter_altitude_writes.
+        
+        Args:
+            layer: Couche à modifier (champs d'altitude déjà ajoutés)
+            results: Résultats renvoyés par calculate_relative_altitudes
+            progress_callback: Callback de progression (optionnel)
+        """
+        for written, total in self.iter_altitude_writes(layer, results):
+            if progress_callback:
+                progress_callback(written, total)
+
+    def iter_altitude_writes(self, layer, results, batch_size=None):
+        """
+        Écrit les résultats directement dans le fournisseur, un lot à chaque itération
+        
+        Permet à l'appelant de rendre la main à la boucle d'événements entre
+        deux lots (écriture sur place depuis le thread principal).
+        
+        Args:
+            layer: Couche à modifier (champs d'altitude déjà ajoutés)
+            results: Résultats renvoyés par calculate_relative_altitudes
+            batch_size: Nombre d'entités par lot (défaut : self.batch_size)
+            
+        Yields:
+            tuple: (entités écrites, nombre total d'entités)
+        """
+        if not results:
+            return
+        
+        provider = layer.dataProvider()
+        required = QgsVectorDataProvider.ChangeAttributeValues | QgsVectorDataProvider.ChangeGeometries
+        if (provider.capabilities() & required) != required:
+            raise ValueError("Le fournisseur de la couche ne permet pas la modification des entités")
+        
+        fields = layer.fields()
+        columns = [
+            (fields.indexFromName(name), values, int if name in self.THRESHOLD_FIELDS else float)
+            for name, values in results["attributes"].items()
+        ]
+        fids = results["fids"]
+        geometries = results["geometries"]
+        batch_size = batch_size or self.batch_size
+        
+        for start in range(0, len(fids), batch_size):
+            end = min(start + batch_size, len(fids))
+            attribute_changes = {
+                fids[i]: {idx: cast(values[i]) for idx, values, cast in columns}
+                for i in range(start, end)
+            }
+            geometry_changes = dict(zip(fids[start:end], geometries[start:end]))
+            self._write_changes(provider, attribute_changes, geometry_changes)
+            yield end, len(fids)
+        
+        layer.updateExtents()
+
+    def _write_terrain_store(self, sampler, mnt_layer, polyline_layer, fids, xy, offsets,
+                             part_offsets, feature_parts, ground_z, sampling_method):
+        """
+        Enregistre les altitudes du sol par sommet et prépare les profils densifiés
+        
+        Les profils (densifiés à la résolution du MNT, partie par partie) sont
+        remplis par lots par _compute_clearance_profiles, qui échantillonne
+        déjà ces points, ou à défaut par _fill_terrain_profile.
+        
+        Returns:
+            tuple: (fichier des profils mappé en mémoire, début du profil de
+            chaque entité), ou None si les profils ne sont pas enregistrés
+        """
+        step = min(sampler.reader.xres, sampler.reader.yres)
+        metadata = {
+            "layer": polyline_layer.name(),
+            "layer_source": polyline_layer.source(),
+            "dem_source": mnt_layer.source(),
+            "band": sampler.reader.band,
+            "crs": sampler.crs.authid(),
+            "sampling_method": sampling_method,
+            "nodata_value": sampler.nodata_value,
+            "profile_step": step if self.store_terrain_profiles else None,
+        }
+        TerrainProfileStore.write(self.terrain_store_path, metadata, fids, offsets, xy, ground_z)
+        if not self.store_terrain_profiles:
+            return None
+        
+        feature_points = self._densified_counts(xy, part_offsets, feature_parts, step)
+        profile_offsets = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(feature_points, out=profile_offsets[1:])
+        profile = TerrainProfileStore.create_profile(self.terrain_store_path, profile_offsets)
+        return profile, profile_offsets
+
+    def _fill_terrain_profile(self, sampler, xy, part_offsets, feature_parts, terrain_profile):
+        """Échantillonne les profils densifiés du stockage (profil de hauteur désactivé)"""
+        step = min(sampler.reader.xres, sampler.reader.yres)
+        for start, end, points, distance, _ in self._densified_batches(
+                xy[:, :2], part_offsets, feature_parts, step):
+            ground = sampler.sample(points[:, 0], points[:, 1])
+            self._store_profile_batch(terrain_profile, start, end, points, distance, ground)
+
+    @staticmethod
+    def _store_profile_batch(terrain_profile, start, end, points, distance, ground):
+        """Écrit les profils d'un lot d'entités dans le stockage du terrain"""
+        profile, profile_offsets = terrain_profile
+        rows = slice(profile_offsets[start], profile_offsets[end])
+        profile[rows, 0] = distance
+        profile[rows, 1:3] = points[:, :2]
+        profile[rows, 3] = ground
+
+    def _corridor_sampler(self, mnt_layer, sampler):
+        """
+        Crée l'échantillonneur du MNT filtré par maximum pour le couloir latéral
+        
+        Le couloir est approché par une fenêtre carrée de côté
+        2 * corridor_radius (arrondi au pixel supérieur). Les tuiles filtrées
+        sont calculées une seule fois par calcul et gardées en cache. Le rayon
+        est limité à max_corridor_pixels pixels du MNT : au-delà, chaque tuile
+        filtrée demanderait la lecture d'une bordure démesurée.
+        
+        Args:
+            mnt_layer: Couche raster du MNT
+            sampler: DemSampler du MNT (méthode et paramètres repris)
+            
+        Returns:
+            DemSampler: Échantillonneur du MNT filtré
+        """
+        resolution = min(sampler.reader.xres, sampler.reader.yres)
+        radius = math.ceil(self.corridor_radius / resolution)
+        if radius > self.max_corridor_pixels:
+            radius = self.max_corridor_pixels
+            QgsMessageLog.logMessage(
+                f"Couloir latéral limité à {radius * resolution:g} m "
+                f"({radius} pixels du MNT) au lieu de {self.corridor_radius:g} m",
+                level=Qgis.Warning
+            )
+        return DemSampler(
+            mnt_layer,
+            band=sampler.reader.band,
+            method=sampler.method,
+            nodata_value=sampler.nodata_value,
+            tile_size=self.tile_size,
+            max_cache_bytes=self.tile_cache_mb * 1024 * 1024,
+            max_filter_radius=radius
+        )
+
+    def _compute_clearance_profiles(self, sampler, xyz, part_offsets, feature_parts,
+                                    progress_callback=None, terrain_profile=None):
+        """
+        Calcule la hauteur au-dessus du sol le long des segments de chaque entité
+        
+        Les segments sont densifiés à la résolution du MNT (Z de l'aéronef
+        interpolé entre les sommets) puis tous les points d'un lot sont
+        échantillonnés en un seul appel.
+        
+        Args:
+            sampler: DemSampler du MNT
+            xyz: Coordonnées des sommets dans le CRS du MNT, Z absolu de l'aéronef
+            part_offsets: Indices de début de chaque partie suivis du nombre de sommets
+            feature_parts: Première partie de chaque entité suivie du nombre de parties
+            progress_callback: Callback de progression (optionnel)
+            terrain_profile: Profils du stockage du terrain à remplir avec les
+                points échantillonnés (voir _write_terrain_store, optionnel)
+            
+        Returns:
+            tuple: (minimum, moyenne, distance du point le plus bas) par entité
+        """
+        step = min(sampler.reader.xres, sampler.reader.yres)
+        num_features = len(feature_parts) - 1
+        minimum = np.empty(num_features)
+        mean = np.empty(num_features)
+        worst_distance = np.empty(num_features)
+        if progress_callback:
+            progress_callback(0, num_features)
+        
+        for start, end, points, distance, point_offsets in self._densified_batches(
+                xyz, part_offsets, feature_parts, step):
+            ground = sampler.sample(points[:, 0], points[:, 1])
+            if terrain_profile is not None:
+                self._store_profile_batch(terrain_profile, start, end, points, distance, ground)
+            clearance = points[:, 2] - ground
+            (minimum[start:end], mean[start:end],
+             worst_distance[start:end]) = clearance_statistics(clearance, distance, point_offsets)
+            if progress_callback:
+                progress_callback(end, None)
+        
+        return minimum, mean, worst_distance
+
+    def _classify_threshold(self, mnt_layer, sampler, xyz, part_offsets, feature_parts,
+                            threshold, progress_callback=None):
+        """
+        Détermine les entités dont la trace passe sous un seuil de hauteur
+        
+        Les segments sont densifiés à la résolution du MNT et chaque point
+        est d'abord encadré par la pyramide min/max : les points sûrement
+        au-dessus ou sûrement sous le seuil sont classés sans lire le MNT.
+        Seuls les points dont l'encadrement contient le seuil, dans des
+        entités encore sans dépassement, sont échantillonnés à pleine résolution.
+        
+        Args:
+            mnt_layer: Couche raster du MNT
+            sampler: DemSampler du MNT à pleine résolution
+            xyz: Coordonnées des sommets dans le CRS du MNT, Z absolu de l'aéronef
+            part_offsets: Indices de début de chaque partie suivis du nombre de sommets
+            feature_parts: Première partie de chaque entité suivie du nombre de parties
+            threshold: Hauteur minimale au-dessus du sol
+            progress_callback: Callback de progression (optionnel)
+            
+        Returns:
+            np.ndarray: Booléen par entité, vrai si la trace passe sous le seuil
+        """
+        reader = sampler.reader
+        fingerprint = AltitudeResultCache.dem_fingerprint(
+            mnt_layer, reader.band, f"pyramide{self.pyramid_factor}",
+            sampler.nodata_value, sampler.crs
+        )
+        pyramid = DemPyramid(reader, os.path.join(self.pyramid_dir, fingerprint.hex()),
+                             self.pyramid_factor, sampler.nodata_value)
+        
+        step = min(reader.xres, reader.yres)
+        num_features = len(feature_parts) - 1
+        below = np.zeros(num_features, dtype=bool)
+        num_points = 0
+        num_refined = 0
+        if progress_callback:
+            progress_callback(0, num_features)
+        
+        for start, end, points, _, point_offsets in self._densified_batches(
+                xyz, part_offsets, feature_parts, step):
+            feature = np.repeat(np.arange(start, end), np.diff(point_offsets))
+            
+            # Encadrement du sol sur tous les pixels lus par l'interpolation
+            col, row = sampler.pixel_coordinates(points[:, 0], points[:, 1])
+            rows, cols = interpolation_pixels(col, row, sampler.method)
+            ground_min, ground_max = pyramid.bounds(rows, cols)
+            ground_min = ground_min.reshape(-1, len(points)).min(axis=0)
+            ground_max = ground_max.reshape(-1, len(points)).max(axis=0)
+            
+            z = points[:, 2]
+            surely_below, uncertain = threshold_classes(z, ground_min, ground_max, threshold)
+            below[feature[surely_below]] = True
+            
+            # Affiner uniquement les cas incertains des entités encore conformes
+            uncertain = np.flatnonzero(uncertain & ~below[feature])
+            if uncertain.size:
+                ground = sampler.sample(points[uncertain, 0], points[uncertain, 1])
+                below[feature[uncertain[z[uncertain] - ground < threshold]]] = True
+            
+            num_points += len(points)
+            num_refined += uncertain.size
+            if progress_callback:
+                progress_callback(end, None)
+        
+        pyramid.flush()
+        QgsMessageLog.logMessage(
+            f"Seuil de {threshold} m : {num_refined} point(s) sur {num_points} "
+            f"rééchantillonné(s) à pleine résolution, {pyramid.blocks_read} bloc(s) "
+            f"de pyramide calculé(s)",
+            level=Qgis.Info
+        )
+        return below
+
+    def _densified_counts(self, xyz, part_offsets, feature_parts, step):
+        """Nombre de points densifiés de chaque entité, voir _densified_batches"""
+        counts, _ = densify_counts(xyz, part_offsets, step)
+        return np.add.reduceat(counts, part_offsets[feature_parts[:-1]])
+
+    def _densified_batches(self, xyz, part_offsets, feature_parts, step, feature_points=None):
+        """
+        Densifie les entités par lots d'au plus max_profile_points points
+        
+        Les parties d'une entité multiple sont densifiées séparément : aucun
+        point n'est placé entre deux parties.
+        
+        Args:
+            xyz: Coordonnées des sommets dans le CRS du MNT
+            part_offsets: Indices de début de chaque partie suivis du nombre de sommets
+            feature_parts: Première partie de chaque entité suivie du nombre de parties
+            step: Pas de densification
+            feature_points: Nombre de points densifiés par entité (calculé si absent)
+            
+        Yields:
+            tuple: (première entité, dernière entité + 1, points, distance,
+            début des points de chaque entité du lot suivi du total)
+        """
+        if feature_points is None:
+            feature_points = self._densified_counts(xyz, part_offsets, feature_parts, step)
+        for start, end in point_batches(feature_points, self.max_profile_points):
+            first_part, last_part = feature_parts[start], feature_parts[end]
+            first, last = part_offsets[first_part], part_offsets[last_part]
+            points, distance, point_offsets = densify_parts(
+                xyz[first:last], part_offsets[first_part:last_part + 1] - first,
+                feature_parts[start:end + 1] - first_part, step
+            )
+            yield start, end, points, distance, point_offsets
+
+    def _compute_altitudes(self, sampler, z, sample_xyz, offsets, progress_callback=None):
+        """
+        Calcule les altitudes relatives d'un ensemble d'entités, en série ou en parallèle
+        
+        Returns:
+            tuple: (alt_sol, alt_relative, new_z), voir relative_altitudes
+        """
+        if self.workers > 1 and len(offsets) > 2:
+            return self._compute_parallel(sampler, z, sample_xyz, offsets, progress_callback)
+        ground_z = sampler.sample(sample_xyz[:, 0], sample_xyz[:, 1])
+        return relative_altitudes(z, ground_z, offsets)
+
+    def _compute_parallel(self, sampler, z, sample_xyz, offsets, progress_callback=None):
+        """
+        Calcule les altitudes relatives par lots d'entités dans un pool de processus
+        
+        Chaque lot est transmis sous forme de tableaux (sommets et tuiles du MNT
+        qu'il traverse). Les résultats sont réassemblés dans l'ordre des entités
+        et sont identiques à ceux du calcul en série.
+        
+        Args:
+            sampler: DemSampler du MNT
+            z: Altitudes absolues de tous les sommets
+            sample_xyz: Coordonnées des sommets dans le CRS du MNT
+            offsets: Indices de début de chaque entité suivis du nombre de sommets
+            progress_callback: Callback de progression (optionnel)
+            
+        Returns:
+            tuple: (alt_sol, alt_relative, new_z), voir relative_altitudes
+        """
+        col, row = sampler.pixel_coordinates(sample_xyz[:, 0], sample_xyz[:, 1])
+        chunks = chunk_bounds(offsets, self.workers * 4)
+        if progress_callback:
+            progress_callback(0, len(chunks))
+        
+        results = []
+        with create_process_pool(self.workers) as pool:
+            pending = deque()
+            try:
+                for start, end in chunks:
+                    first, last = offsets[start], offsets[end]
+                    chunk_col, chunk_row = col[first:last], row[first:last]
+                    pending.append(pool.submit(
+                        relative_altitude_chunk,
+                        z[first:last], chunk_col, chunk_row, offsets[start:end + 1] - first,
+                        sampler.tiles_for_points(chunk_col, chunk_row), sampler.grid,
+                        sampler.method, sampler.nodata_value
+                    ))
+                    # Limiter le nombre de lots (et donc de tuiles) en mémoire
+                    if len(pending) >= self.workers * 2:
+                        results.append(pending.popleft().result())
+                        if progress_callback:
+                            progress_callback(len(results), None)
+                while pending:
+                    results.append(pending.popleft().result())
+                    if progress_callback:
+                        progress_callback(len(results), None)
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+    def _write_changes(self, provider, attribute_changes, geometry_changes):
+        """
+        Applique un lot de modifications au fournisseur puis vide les lots
+        
+        Args:
+            provider: Fournisseur de données de la couche
+            attribute_changes: Dictionnaire {fid: {index_champ: valeur}}
+            geometry_changes: Dictionnaire {fid: QgsGeometry}
+        """
+        if attribute_changes and not provider.changeAttributeValues(attribute_changes):
+            raise RuntimeError("Échec de l'écriture des attributs d'altitude")
+        if geometry_changes and not provider.changeGeometryValues(geometry_changes):
+            raise RuntimeError("Échec de l'écriture des géométries")
+        attribute_changes.clear()
+        geometry_changes.clear()
 
     def get_z_coordinate_from_geometry(self, geometry):
         """Extraire la coordonnée Z moyenne d'une géométrie polyligne"""
@@ -227,18 +855,14 @@ class AltitudeCalculator:
             if not QgsWkbTypes.hasZ(geometry.wkbType()):
                 return None
                 
-            z_values = []
-            
-            # Parcourir tous les sommets de la géométrie
-            vertices = geometry.vertices()
-            while vertices.hasNext():
-                vertex = vertices.next()
-                if vertex.is3D() and not vertex.isEmpty():
-                    z_values.append(vertex.z())
+            # Lire tous les sommets d'un coup et ignorer les Z manquants
+            vertices, _ = geometry_to_arrays(geometry)
+            z_values = vertices[:, 2]
+            z_values = z_values[~np.isnan(z_values)]
             
             # Retourner la moyenne des valeurs Z
-            if z_values:
-                return sum(z_values) / len(z_values)
+            if z_values.size:
+                return float(z_values.mean())
             else:
                 return None
                 
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Catalogue de tuiles MNT (ex. dalles RGE ALTI) utilisé comme un seul MNT
+
+Les emprises des tuiles d'un dossier sont indexées une fois puis
+enregistrées dans le dossier (catalogue_mnt.json) ; seules les tuiles
+ajoutées ou modifiées sont relues lors des ouvertures suivantes. Les
+tuiles ne sont ouvertes qu'au moment où un bloc de pixels les traverse,
+et le nombre de fichiers ouverts simultanément est limité.
+
+Toutes les tuiles doivent partager le même CRS, la même résolution et
+une grille de pixels alignée.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+from qgis.core import (QgsRasterLayer, QgsRectangle, QgsSpatialIndex,
+                       QgsCoordinateReferenceSystem, QgsMessageLog, Qgis)
+
+from .dem_sampler import block_to_array
+
+
+class DemCatalog:
+    """
+    Ensemble de tuiles raster vu comme une grille unique
+
+    Le catalogue s'utilise à la place d'une couche raster MNT (crs, source,
+    dataProvider...) et se lit par blocs de pixels de la grille globale.
+    """
+
+    INDEX_FILE = "catalogue_mnt.json"
+    EXTENSIONS = (".tif", ".tiff", ".asc", ".img", ".bil")
+
+    def __init__(self, folder, tiles, max_open=32):
+        """
+        Initialise le catalogue à partir d'un index déjà construit
+
+        Args:
+            folder: Dossier des tuiles
+            tiles: Liste des descriptions de tuiles (voir build_index)
+            max_open: Nombre maximal de tuiles ouvertes simultanément
+        """
+        if not tiles:
+            raise ValueError(f"Aucune tuile MNT trouvée dans {folder}")
+        self.folder = folder
+        self.tiles = tiles
+        self.max_open = max_open
+
+        first = tiles[0]
+        self._crs = QgsCoordinateReferenceSystem(first["crs"])
+        self.xres = (first["extent"][2] - first["extent"][0]) / first["width"]
+        self.yres = (first["extent"][3] - first["extent"][1]) / first["height"]
+        for tile in tiles:
+            xres = (tile["extent"][2] - tile["extent"][0]) / tile["width"]
+            yres = (tile["extent"][3] - tile["extent"][1]) / tile["height"]
+            if (tile["crs"] != first["crs"] or not np.isclose(xres, self.xres)
+                    or not np.isclose(yres, self.yres)):
+                raise ValueError(
+                    f"La tuile {tile['file']} n'a pas le CRS ou la résolution des autres tuiles"
+                )
+
+        # Grille globale couvrant toutes les tuiles
+        extents = np.array([tile["extent"] for tile in tiles])
+        self.xmin = extents[:, 0].min()
+        self.ymax = extents[:, 3].max()
+        self.width = int(round((extents[:, 2].max() - self.xmin) / self.xres))
+        self.height = int(round((self.ymax - extents[:, 1].min()) / self.yres))
+
+        # Position de chaque tuile dans la grille globale (col0, row0, largeur, hauteur)
+        self.windows = np.column_stack((
+            np.round((extents[:, 0] - self.xmin) / self.xres),
+            np.round((self.ymax - extents[:, 3]) / self.yres),
+            [tile["width"] for tile in tiles],
+            [tile["height"] for tile in tiles],
+        )).astype(np.int64)
+
+        self.index = QgsSpatialIndex()
+        for i, (col0, row0, width, height) in enumerate(self.windows):
+            self.index.addFeature(i, QgsRectangle(col0, row0, col0 + width, row0 + height))
+
+        self._providers = OrderedDict()
+        self.tiles_opened = 0
+
+    @classmethod
+    def open(cls, folder, max_open=32):
+        """
+        Ouvre le catalogue d'un dossier, en construisant ou mettant à jour son index
+
+        Args:
+            folder: Dossier contenant les tuiles
+            max_open: Nombre maximal de tuiles ouvertes simultanément
+
+        Returns:
+            DemCatalog: Catalogue prêt à l'emploi
+        """
+        return cls(folder, cls.build_index(folder), max_open)
+
+    @classmethod
+    def build_index(cls, folder):
+        """
+        Indexe l'emprise des tuiles d'un dossier
+
+        L'index enregistré est réutilisé pour les fichiers dont la taille et
+        la date de modification n'ont pas changé.
+
+        Args:
+            folder: Dossier contenant les tuiles
+
+        Returns:
+            list: Dictionnaires {file, size, mtime, crs, extent, width, height}
+        """
+        index_path = os.path.join(folder, cls.INDEX_FILE)
+        known = {}
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                known = {tile["file"]: tile for tile in json.load(f)["tiles"]}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        tiles = []
+        changed = False
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(cls.EXTENSIONS):
+                continue
+            stat = os.stat(os.path.join(folder, name))
+            tile = known.get(name)
+            if tile is None or tile["size"] != stat.st_size or tile["mtime"] != stat.st_mtime_ns:
+                tile = cls._describe_tile(folder, name, stat)
+                changed = True
+                if tile is None:
+                    continue
+            tiles.append(tile)
+        changed = changed or len(tiles) != len(known)
+
+        if changed:
+            try:
+                with open(index_path, "w", encoding="utf-8") as f:
+                    json.dump({"tiles": tiles}, f, indent=1)
+            except OSError as e:
+                QgsMessageLog.logMessage(f"Index du catalogue MNT non enregistré : {str(e)}",
+                                         level=Qgis.Warning)
+        return tiles
+
+    @staticmethod
+    def _describe_tile(folder, name, stat):
+        """Lit l'emprise et la taille d'une tuile (None si illisible)"""
+        layer = QgsRasterLayer(os.path.join(folder, name), name, "gdal")
+        if not layer.isValid():
+            QgsMessageLog.logMessage(f"Tuile MNT ignorée (illisible) : {name}",
+                                     level=Qgis.Warning)
+            return None
+        extent = layer.extent()
+        return {
+            "file": name,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "crs": layer.crs().authid(),
+            "extent": [extent.xMinimum(), extent.yMinimum(),
+                       extent.xMaximum(), extent.yMaximum()],
+            "width": layer.width(),
+            "height": layer.height(),
+        }
+
+    # Interface commune avec les couches raster et leurs fournisseurs
+
+    def crs(self):
+        return self._crs
+
+    def name(self):
+        return os.path.basename(os.path.normpath(self.folder))
+
+    def source(self):
+        """Dossier suivi d'une empreinte de l'index (change si une tuile change)"""
+        description = json.dumps(self.tiles, sort_keys=True).encode("utf-8")
+        return f"{self.folder}|{hashlib.blake2b(description, digest_size=8).hexdigest()}"
+
+    def dataProvider(self):
+        return self
+
+    def clone(self):
+        """Nouveau catalogue partageant l'index, avec ses propres fichiers ouverts"""
+        return DemCatalog(self.folder, self.tiles, self.max_open)
+
+    def extent(self):
+        return QgsRectangle(self.xmin, self.ymax - self.height * self.yres,
+                            self.xmin + self.width * self.xres, self.ymax)
+
+    def xSize(self):
+        return self.width
+
+    def ySize(self):
+        return self.height
+
+    def read_array(self, band, row0, col0, nrows, ncols):
+        """
+        Lit un bloc de pixels de la grille globale
+
+        Args:
+            band: Numéro de bande
+            row0, col0: Premier pixel du bloc dans la grille globale
+            nrows, ncols: Taille du bloc
+
+        Returns:
+            np.ndarray: Tableau (nrows, ncols), NaN hors tuiles ou sur nodata
+        """
+        values = np.full((nrows, ncols), np.nan)
+        # Rectangle légèrement réduit pour ne pas retenir les tuiles seulement contiguës
+        query = QgsRectangle(col0 + 0.5, row0 + 0.5, col0 + ncols - 0.5, row0 + nrows - 0.5)
+        for i in sorted(self.index.intersects(query)):
+            tile_col, tile_row, width, height = (int(v) for v in self.windows[i])
+            top, left = max(row0, tile_row), max(col0, tile_col)
+            bottom = min(row0 + nrows, tile_row + height)
+            right = min(col0 + ncols, tile_col + width)
+            if bottom <= top or right <= left:
+                continue
+
+            rect = QgsRectangle(
+                self.xmin + left * self.xres, self.ymax - bottom * self.yres,
+                self.xmin + right * self.xres, self.ymax - top * self.yres
+            )
+            block = self._provider(i).block(band, rect, right - left, bottom - top)
+            tile_values = block_to_array(block)
+            target = values[top - row0:bottom - row0, left - col0:right - col0]
+            # Les pixels nodata d'une tuile ne masquent pas ceux d'une tuile voisine
+            np.copyto(target, tile_values, where=~np.isnan(tile_values))
+        return values
+
+    def _provider(self, i):
+        """Ouvre une tuile à la demande en limitant le nombre de fichiers ouverts"""
+        provider = self._providers.get(i)
+        if provider is not None:
+            self._providers.move_to_end(i)
+            return provider
+
+        layer = QgsRasterLayer(os.path.join(self.folder, self.tiles[i]["file"]),
+                               self.tiles[i]["file"], "gdal")
+        if not layer.isValid():
+            raise RuntimeError(f"Impossible d'ouvrir la tuile MNT {self.tiles[i]['file']}")
+        provider = layer.dataProvider().clone()
+        self.tiles_opened += 1
+
+        self._providers[i] = provider
+        while len(self._providers) > self.max_open:
+            self._providers.popitem(last=False)
+        return provider
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Pyramide min/max d'un MNT pour l'évaluation rapide d'un seuil d'altitude
+
+Chaque cellule de la pyramide contient l'altitude minimale et maximale
+d'un bloc de factor x factor pixels du MNT. Les cellules sont calculées
+par blocs, à la demande, puis conservées sur disque (fichiers .npy
+mappés en mémoire) : les calculs suivants sur le même MNT ne relisent
+que les tuiles nécessaires à l'affinage. Un bloc de cellules correspond
+exactement à une tuile du lecteur, lue au travers de son cache.
+
+Contenu du dossier :
+    metadata.json   Dimensions du MNT, taille des tuiles et facteur de réduction
+    min.npy         Altitude minimale par cellule
+    max.npy         Altitude maximale par cellule
+    built.npy       Blocs de cellules déjà calculés
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .sampling_kernels import block_extrema
+
+
+class DemPyramid:
+    """Niveau réduit min/max d'un MNT, rempli à la demande"""
+
+    METADATA_FILE = "metadata.json"
+
+    def __init__(self, reader, path, factor=16, nodata_value=0.0):
+        """
+        Ouvre (ou crée) la pyramide d'un MNT
+
+        Args:
+            reader: DemTileReader du MNT à pleine résolution
+            path: Dossier de la pyramide (propre au MNT et à nodata_value)
+            factor: Nombre de pixels du MNT par côté de cellule (diviseur de
+                la taille des tuiles du lecteur)
+            nodata_value: Altitude utilisée pour les pixels nodata
+        """
+        if reader.tile_size % factor:
+            raise ValueError(f"Le facteur de la pyramide ({factor}) doit diviser "
+                             f"la taille des tuiles ({reader.tile_size})")
+        self.reader = reader
+        self.path = path
+        self.factor = factor
+        self.nodata_value = nodata_value
+        self.blocks_read = 0
+
+        # Bloc de cellules calculé depuis une tuile du MNT
+        self.block_cells = reader.tile_size // factor
+        shape = (-(-reader.height // factor), -(-reader.width // factor))
+        block_shape = (-(-shape[0] // self.block_cells), -(-shape[1] // self.block_cells))
+        metadata = {"width": reader.width, "height": reader.height,
+                    "tile_size": reader.tile_size, "factor": factor}
+
+        os.makedirs(path, exist_ok=True)
+        if self._read_metadata() == metadata:
+            self.minimum = self._open("min", "r+")
+            self.maximum = self._open("max", "r+")
+            self.built = self._open("built", "r+")
+        else:
+            self.minimum = self._open("min", "w+", shape, np.float64)
+            self.maximum = self._open("max", "w+", shape, np.float64)
+            self.built = self._open("built", "w+", block_shape, np.bool_)
+            self.built[:] = False
+            with open(os.path.join(path, self.METADATA_FILE), "w", encoding="utf-8") as f:
+                json.dump(metadata, f, indent=2)
+
+    def _read_metadata(self):
+        """Métadonnées d'une pyramide existante (None si absente)"""
+        try:
+            with open(os.path.join(self.path, self.METADATA_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _open(self, name, mode, shape=None, dtype=None):
+        """Ouvre ou crée un tableau de la pyramide en mémoire mappée"""
+        return np.lib.format.open_memmap(
+            os.path.join(self.path, f"{name}.npy"), mode=mode, dtype=dtype, shape=shape
+        )
+
+    def bounds(self, rows, cols):
+        """
+        Encadre l'altitude du MNT aux pixels demandés
+
+        Args:
+            rows, cols: Indices entiers des pixels dans la grille du MNT
+
+        Returns:
+            tuple: (minimum, maximum) par pixel ; nodata_value hors MNT
+        """
+        reader = self.reader
+        minimum = np.full(rows.shape, self.nodata_value)
+        maximum = np.full(rows.shape, self.nodata_value)
+        inside = (rows >= 0) & (rows < reader.height) & (cols >= 0) & (cols < reader.width)
+        cell_r = rows[inside] // self.factor
+        cell_c = cols[inside] // self.factor
+
+        blocks = np.unique(np.stack((cell_r // self.block_cells, cell_c // self.block_cells)), axis=1)
+        for block_r, block_c in blocks.T:
+            if not self.built[block_r, block_c]:
+                self._build_block(int(block_r), int(block_c))
+
+        minimum[inside] = self.minimum[cell_r, cell_c]
+        maximum[inside] = self.maximum[cell_r, cell_c]
+        return minimum, maximum
+
+    def _build_block(self, block_r, block_c):
+        """Calcule les cellules d'un bloc depuis la tuile correspondante du MNT"""
+        # Tuile partagée avec le cache du lecteur : ne pas la modifier
+        tile = self.reader.cached_tile(block_r, block_c)
+        values = np.where(np.isnan(tile), self.nodata_value, tile)
+        minimum, maximum = block_extrema(values, self.factor)
+
+        cells = (slice(block_r * self.block_cells, block_r * self.block_cells + minimum.shape[0]),
+                 slice(block_c * self.block_cells, block_c * self.block_cells + minimum.shape[1]))
+        self.minimum[cells] = minimum
+        self.maximum[cells] = maximum
+        self.built[block_r, block_c] = True
+        self.blocks_read += 1
+
+    def flush(self):
+        """Écrit sur disque les cellules calculées"""
+        for array in (self.minimum, self.maximum, self.built):
+            array.flush()
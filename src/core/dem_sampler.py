@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Échantillonnage vectorisé d'un MNT
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from qgis.core import Qgis, QgsRectangle
+
+from .sampling_kernels import (SAMPLING_METHODS, pixel_coordinates, interpolate,
+                               interpolation_pixels, gather_tiles, tile_keys,
+                               window_maximum)
+
+
+# Correspondance entre les types de données raster QGIS et NumPy
+_NUMPY_DTYPES = {
+    Qgis.DataType.Byte: np.uint8,
+    Qgis.DataType.Int8: np.int8,
+    Qgis.DataType.UInt16: np.uint16,
+    Qgis.DataType.Int16: np.int16,
+    Qgis.DataType.UInt32: np.uint32,
+    Qgis.DataType.Int32: np.int32,
+    Qgis.DataType.Float32: np.float32,
+    Qgis.DataType.Float64: np.float64,
+}
+
+
+def block_to_array(block):
+    """
+    Convertit un QgsRasterBlock en tableau NumPy float64
+
+    Args:
+        block: Bloc lu depuis un fournisseur raster
+
+    Returns:
+        np.ndarray: Tableau 2D (hauteur, largeur), NaN pour nodata
+    """
+    dtype = _NUMPY_DTYPES.get(block.dataType())
+    if dtype is None:
+        raise NotImplementedError(f"Type de données raster non supporté : {block.dataType()}")
+
+    array = np.frombuffer(bytes(block.data()), dtype=dtype)
+    array = array.reshape(block.height(), block.width()).astype(np.float64)
+    if block.hasNoDataValue():
+        array[array == block.noDataValue()] = np.nan
+    return array
+
+
+class DemTileReader:
+    """Lecture d'un MNT par tuiles de taille fixe avec cache LRU borné"""
+
+    def __init__(self, provider, band=1, tile_size=512, max_cache_bytes=256 * 1024 * 1024):
+        """
+        Initialise le lecteur de tuiles
+
+        Args:
+            provider: Fournisseur raster (de préférence un clone propre au lecteur)
+            band: Numéro de bande à lire
+            tile_size: Taille d'une tuile en pixels (côté)
+            max_cache_bytes: Mémoire maximale occupée par les tuiles en cache
+        """
+        self.provider = provider
+        self.band = band
+        self.tile_size = tile_size
+        self.max_cache_bytes = max_cache_bytes
+
+        extent = provider.extent()
+        self.width = provider.xSize()
+        self.height = provider.ySize()
+        self.xmin = extent.xMinimum()
+        self.ymax = extent.yMaximum()
+        self.xres = extent.width() / self.width
+        self.yres = extent.height() / self.height
+        self.tile_cols = -(-self.width // tile_size)
+
+        self._tiles = OrderedDict()
+        self._cache_bytes = 0
+        self.tiles_read = 0
+
+    def values_at(self, rows, cols):
+        """
+        Renvoie les valeurs des pixels demandés
+
+        Les pixels sont regroupés par tuile afin que chaque tuile ne soit
+        lue qu'une seule fois par appel.
+
+        Args:
+            rows, cols: Indices entiers des pixels dans la grille complète
+
+        Returns:
+            np.ndarray: Valeurs float64, NaN hors raster ou sur nodata
+        """
+        return gather_tiles(rows, cols, self.cached_tile, self.width, self.height,
+                            self.tile_size)
+
+    def tiles_for(self, rows, cols):
+        """
+        Renvoie les tuiles contenant les pixels demandés
+
+        Args:
+            rows, cols: Indices entiers des pixels dans la grille complète
+
+        Returns:
+            dict: {(tile_row, tile_col): tableau} pour chaque tuile utile
+        """
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        keys = np.unique(tile_keys(rows[inside], cols[inside], self.tile_size, self.tile_cols))
+        tiles = {}
+        for key in keys:
+            tile_row, tile_col = divmod(int(key), self.tile_cols)
+            tiles[(tile_row, tile_col)] = self.cached_tile(tile_row, tile_col)
+        return tiles
+
+    def clear(self):
+        """Vide le cache de tuiles"""
+        self._tiles.clear()
+        self._cache_bytes = 0
+
+    def cached_tile(self, tile_row, tile_col):
+        """
+        Renvoie une tuile depuis le cache ou la lit depuis le fournisseur
+
+        Le tableau renvoyé est partagé avec le cache : ne pas le modifier.
+        """
+        key = (tile_row, tile_col)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+
+        row0 = tile_row * self.tile_size
+        col0 = tile_col * self.tile_size
+        nrows = min(self.tile_size, self.height - row0)
+        ncols = min(self.tile_size, self.width - col0)
+        tile = self.read_tile(row0, col0, nrows, ncols)
+        self.tiles_read += 1
+
+        self._tiles[key] = tile
+        self._cache_bytes += tile.nbytes
+        while self._cache_bytes > self.max_cache_bytes and len(self._tiles) > 1:
+            _, evicted = self._tiles.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+        return tile
+
+    def read_tile(self, row0, col0, nrows, ncols):
+        """Produit les valeurs d'une tuile (lecture directe du MNT)"""
+        return self.read_block(row0, col0, nrows, ncols)
+
+    def read_block(self, row0, col0, nrows, ncols):
+        """Lit un bloc de pixels du MNT sous forme de tableau"""
+        # Un catalogue de tuiles (DemCatalog) fournit directement les tableaux
+        if hasattr(self.provider, "read_array"):
+            return self.provider.read_array(self.band, row0, col0, nrows, ncols)
+
+        rect = QgsRectangle(
+            self.xmin + col0 * self.xres,
+            self.ymax - (row0 + nrows) * self.yres,
+            self.xmin + (col0 + ncols) * self.xres,
+            self.ymax - row0 * self.yres
+        )
+        block = self.provider.block(self.band, rect, ncols, nrows)
+        return block_to_array(block)
+
+
+class MaxFilterTileReader(DemTileReader):
+    """
+    Lecture par tuiles d'un MNT filtré par maximum glissant
+
+    Chaque pixel vaut l'altitude maximale du MNT dans une fenêtre carrée
+    de (2 * radius + 1) pixels centrée sur lui. Les tuiles filtrées sont
+    calculées à la demande (avec une bordure de radius pixels lue dans le
+    MNT) et conservées dans le cache LRU comme des tuiles ordinaires.
+    """
+
+    def __init__(self, provider, radius, band=1, tile_size=512,
+                 max_cache_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            provider: Fournisseur raster (de préférence un clone propre au lecteur)
+            radius: Demi-côté de la fenêtre en pixels
+            band, tile_size, max_cache_bytes: Voir DemTileReader
+        """
+        super().__init__(provider, band, tile_size, max_cache_bytes)
+        self.radius = radius
+
+    def read_tile(self, row0, col0, nrows, ncols):
+        """Lit la tuile et sa bordure puis applique le maximum glissant"""
+        r = self.radius
+        top, left = max(0, row0 - r), max(0, col0 - r)
+        bottom = min(self.height, row0 + nrows + r)
+        right = min(self.width, col0 + ncols + r)
+
+        # Bordure hors du MNT à NaN : ignorée par le maximum
+        padded = np.full((nrows + 2 * r, ncols + 2 * r), np.nan)
+        padded[top - row0 + r:bottom - row0 + r, left - col0 + r:right - col0 + r] = \
+            self.read_block(top, left, bottom - top, right - left)
+        return window_maximum(padded, r)
+
+
+class DemSampler:
+    """Échantillonne un MNT sous un ensemble de points en une seule passe"""
+
+    def __init__(self, mnt_layer, band=1, method="nearest", nodata_value=0.0,
+                 tile_size=512, max_cache_bytes=256 * 1024 * 1024, max_filter_radius=0):
+        """
+        Initialise l'échantillonneur
+
+        Args:
+            mnt_layer: Couche raster du MNT ou catalogue de tuiles (DemCatalog)
+            band: Numéro de bande à échantillonner
+            method: "nearest" (plus proche voisin) ou "bilinear"
+            nodata_value: Altitude renvoyée hors MNT ou sur nodata
+            tile_size: Taille des tuiles lues dans le MNT (pixels)
+            max_cache_bytes: Mémoire maximale du cache de tuiles
+            max_filter_radius: Si > 0, échantillonne le maximum du MNT dans
+                une fenêtre carrée de ce demi-côté (pixels) autour de chaque point
+        """
+        if method not in SAMPLING_METHODS:
+            raise ValueError(f"Méthode d'échantillonnage inconnue : {method}")
+
+        self.crs = mnt_layer.crs()
+        self.method = method
+        self.nodata_value = nodata_value
+        provider = mnt_layer.dataProvider().clone()
+        if max_filter_radius > 0:
+            self.reader = MaxFilterTileReader(provider, max_filter_radius, band,
+                                              tile_size, max_cache_bytes)
+        else:
+            self.reader = DemTileReader(provider, band, tile_size, max_cache_bytes)
+
+    def sample(self, x, y):
+        """
+        Échantillonne le MNT aux coordonnées données
+
+        Seules les tuiles situées sous les points sont lues.
+
+        Args:
+            x, y: Tableaux des coordonnées dans le CRS du MNT
+
+        Returns:
+            np.ndarray: Altitudes du sol (float64)
+        """
+        col, row = self.pixel_coordinates(x, y)
+        values = interpolate(self.reader.values_at, col, row, self.method)
+        values[np.isnan(values)] = self.nodata_value
+        return values
+
+    def pixel_coordinates(self, x, y):
+        """Convertit des coordonnées du CRS du MNT en coordonnées pixel continues"""
+        reader = self.reader
+        return pixel_coordinates(x, y, reader.xmin, reader.ymax, reader.xres, reader.yres)
+
+    def tiles_for_points(self, col, row):
+        """
+        Renvoie les tuiles nécessaires pour échantillonner des points
+
+        Args:
+            col, row: Coordonnées pixel continues des points
+
+        Returns:
+            dict: {(tile_row, tile_col): tableau} (voir DemTileReader.tiles_for)
+        """
+        return self.reader.tiles_for(*interpolation_pixels(col, row, self.method))
+
+    @property
+    def grid(self):
+        """Description de la grille transmise aux processus de calcul"""
+        return self.reader.width, self.reader.height, self.reader.tile_size
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion directe entre géométries QGIS et tableaux NumPy
+
+Les coordonnées sont lues dans le WKB de la géométrie avec np.frombuffer,
+sans créer d'objet Python par sommet.
+"""
+
+import struct
+import sys
+
+import numpy as np
+from qgis.core import QgsGeometry
+
+
+# Types WKB de base (ISO)
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+
+_NATIVE_ENDIAN = "<" if sys.byteorder == "little" else ">"
+
+
+def _read_header(buf, pos):
+    """
+    Lit l'en-tête (ordre des octets + type) d'une géométrie WKB
+
+    Returns:
+        tuple: (endian, type_de_base, has_z, has_m, position_suivante)
+    """
+    endian = "<" if buf[pos] == 1 else ">"
+    (wkb_type,) = struct.unpack_from(endian + "I", buf, pos + 1)
+
+    # Drapeaux EWKB / 2.5D puis codes ISO (1000 = Z, 2000 = M, 3000 = ZM)
+    has_z = bool(wkb_type & 0x80000000)
+    has_m = bool(wkb_type & 0x40000000)
+    wkb_type &= 0x0FFFFFFF
+    has_z = has_z or wkb_type // 1000 in (1, 3)
+    has_m = has_m or wkb_type // 1000 in (2, 3)
+    return endian, wkb_type % 1000, has_z, has_m, pos + 5
+
+
+def _read_points(buf, pos, endian, dims, runs):
+    """Enregistre une série de points et renvoie la position suivante"""
+    (count,) = struct.unpack_from(endian + "I", buf, pos)
+    runs.append((pos + 4, count))
+    return pos + 4 + count * dims * 8
+
+
+def _read_polygon(buf, pos, endian, dims, runs):
+    """Enregistre les anneaux d'un polygone et renvoie la position suivante"""
+    (num_rings,) = struct.unpack_from(endian + "I", buf, pos)
+    pos += 4
+    for _ in range(num_rings):
+        pos = _read_points(buf, pos, endian, dims, runs)
+    return pos
+
+
+def wkb_layout(buf):
+    """
+    Décrit l'organisation des coordonnées dans un WKB
+
+    Args:
+        buf: WKB de la géométrie (bytes)
+
+    Returns:
+        tuple: (endian, type_de_base, has_z, has_m, runs) où runs est la liste
+        des séries de points (position_octet, nombre_de_points), une par
+        partie de ligne ou anneau de polygone
+    """
+    endian, base_type, has_z, has_m, pos = _read_header(buf, 0)
+    dims = 2 + has_z + has_m
+    runs = []
+
+    if base_type == WKB_LINESTRING:
+        _read_points(buf, pos, endian, dims, runs)
+    elif base_type == WKB_POLYGON:
+        _read_polygon(buf, pos, endian, dims, runs)
+    elif base_type in (WKB_MULTILINESTRING, WKB_MULTIPOLYGON):
+        (num_parts,) = struct.unpack_from(endian + "I", buf, pos)
+        pos += 4
+        for _ in range(num_parts):
+            part_endian, _, _, _, pos = _read_header(buf, pos)
+            if base_type == WKB_MULTILINESTRING:
+                pos = _read_points(buf, pos, part_endian, dims, runs)
+            else:
+                pos = _read_polygon(buf, pos, part_endian, dims, runs)
+    else:
+        raise NotImplementedError(f"Type WKB non supporté : {base_type}")
+
+    return endian, base_type, has_z, has_m, runs
+
+
+def geometry_to_arrays(geom):
+    """
+    Extrait les coordonnées d'une géométrie linéaire ou polygonale
+
+    Pour une LineStringZ en ordre natif, le tableau renvoyé est une vue en
+    lecture seule sur le WKB (aucune copie).
+
+    Args:
+        geom: QgsGeometry (LineString, MultiLineString, Polygon, MultiPolygon)
+
+    Returns:
+        tuple: (coords, offsets) avec coords un tableau (N, 3) float64
+        (Z à NaN si la géométrie est 2D) et offsets les indices de début
+        de chaque partie ou anneau, suivis de N
+    """
+    buf = bytes(geom.asWkb())
+    endian, _, has_z, has_m, runs = wkb_layout(buf)
+    dims = 2 + has_z + has_m
+    dtype = np.dtype(endian + "f8")
+
+    counts = [count for _, count in runs]
+    offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    if len(runs) == 1 and dims == 3 and has_z and endian == _NATIVE_ENDIAN:
+        pos, count = runs[0]
+        coords = np.frombuffer(buf, dtype=dtype, count=count * 3, offset=pos)
+        return coords.reshape(count, 3), offsets
+
+    coords = np.empty((offsets[-1], 3), dtype=np.float64)
+    if not has_z:
+        coords[:, 2] = np.nan
+    for (pos, count), start in zip(runs, offsets[:-1]):
+        values = np.frombuffer(buf, dtype=dtype, count=count * dims, offset=pos)
+        values = values.reshape(count, dims)
+        coords[start:start + count, :2] = values[:, :2]
+        if has_z:
+            coords[start:start + count, 2] = values[:, 2]
+    return coords, offsets
+
+
+def arrays_to_wkb(coords, offsets=None, multi=False, m=None):
+    """
+    Construit le WKB d'une LineStringZ ou MultiLineStringZ (ZM si m est donné)
+
+    Args:
+        coords: Tableau (N, 3) des coordonnées
+        offsets: Indices de début de chaque partie suivis de N (optionnel)
+        multi: Forcer une MultiLineStringZ même pour une seule partie
+        m: Valeurs M de chaque sommet (optionnel)
+
+    Returns:
+        bytes: WKB ISO petit-boutiste
+    """
+    if m is None:
+        coords = np.ascontiguousarray(coords[:, :3], dtype="<f8")
+        line_type, multi_type = 1002, 1005
+    else:
+        coords = np.ascontiguousarray(np.column_stack((coords[:, :3], m)), dtype="<f8")
+        line_type, multi_type = 3002, 3005
+    if offsets is None:
+        offsets = (0, len(coords))
+
+    num_parts = len(offsets) - 1
+    if num_parts == 1 and not multi:
+        return struct.pack("<BII", 1, line_type, len(coords)) + coords.tobytes()
+
+    chunks = [struct.pack("<BII", 1, multi_type, num_parts)]
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        chunks.append(struct.pack("<BII", 1, line_type, end - start))
+        chunks.append(coords[start:end].tobytes())
+    return b"".join(chunks)
+
+
+def arrays_to_geometry(coords, offsets=None, multi=False, m=None):
+    """
+    Construit une géométrie LineStringZ ou MultiLineStringZ depuis des tableaux
+
+    Args:
+        coords: Tableau (N, 3) des coordonnées
+        offsets: Indices de début de chaque partie suivis de N (optionnel)
+        multi: Forcer une MultiLineStringZ même pour une seule partie
+        m: Valeurs M de chaque sommet (optionnel, géométrie ZM)
+
+    Returns:
+        QgsGeometry: Nouvelle géométrie
+    """
+    geom = QgsGeometry()
+    geom.fromWkb(arrays_to_wkb(coords, offsets, multi, m))
+    return geom
+
+
+def transform_coords(coords, transform):
+    """
+    Reprojette un tableau de coordonnées en un seul appel à QGIS
+
+    Les points sont regroupés dans une unique ligne temporaire afin que la
+    transformation soit faite en bloc côté C++. Les Z ne sont pas modifiés.
+
+    Args:
+        coords: Tableau (N, 3) des coordonnées
+        transform: QgsCoordinateTransform à appliquer
+
+    Returns:
+        np.ndarray: Nouveau tableau (N, 3) float64
+    """
+    if len(coords) == 0:
+        return np.empty((0, 3), dtype=np.float64)
+    geom = arrays_to_geometry(coords)
+    geom.transform(transform)
+    transformed, _ = geometry_to_arrays(geom)
+    return np.array(transformed, dtype=np.float64)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Pool de processus pour les calculs parallèles
+
+Les fonctions exécutées dans les processus doivent se trouver dans des
+modules qui n'importent que NumPy (ex. sampling_kernels).
+"""
+
+import os
+import shutil
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def _python_executable():
+    """
+    Renvoie l'interpréteur Python utilisé pour lancer les processus
+
+    Dans QGIS, sys.executable désigne souvent l'exécutable de QGIS et non
+    celui de Python : on cherche alors l'interpréteur livré avec QGIS.
+    """
+    executable = sys.executable
+    if os.path.basename(executable).lower().startswith("python"):
+        return executable
+
+    candidates = [
+        os.path.join(sys.exec_prefix, "pythonw.exe"),
+        os.path.join(sys.exec_prefix, "python.exe"),
+        os.path.join(sys.exec_prefix, "bin", f"python{sys.version_info.major}.{sys.version_info.minor}"),
+        os.path.join(sys.exec_prefix, "bin", "python3"),
+    ]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return shutil.which("python3") or executable
+
+
+def create_process_pool(workers):
+    """
+    Crée un pool de processus utilisable depuis QGIS
+
+    Les processus sont démarrés en mode "spawn" (pas de fork du processus
+    QGIS et de ses threads).
+
+    Args:
+        workers: Nombre de processus
+
+    Returns:
+        ProcessPoolExecutor: Pool à utiliser comme gestionnaire de contexte
+    """
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(_python_executable())
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def chunk_bounds(offsets, num_chunks):
+    """
+    Découpe une suite d'entités en lots contigus de tailles comparables
+
+    Args:
+        offsets: Indices de début de chaque entité suivis du nombre de sommets
+        num_chunks: Nombre de lots souhaité
+
+    Returns:
+        list: Liste de (première_entité, dernière_entité + 1)
+    """
+    num_features = len(offsets) - 1
+    targets = offsets[-1] * np.arange(1, num_chunks) / num_chunks
+    cuts = np.searchsorted(offsets, targets).clip(0, num_features)
+    cuts = np.unique(np.concatenate(([0], cuts, [num_features])))
+    return [(int(start), int(end)) for start, end in zip(cuts[:-1], cuts[1:])]
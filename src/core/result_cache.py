@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistant des altitudes relatives déjà calculées
+
+Chaque entrée est indexée par une empreinte de la géométrie de l'entité
+combinée à une empreinte du MNT (chemin, taille, date de modification,
+bande) et des paramètres d'échantillonnage. La taille du cache est bornée
+en octets ; la base est en auto_vacuum incrémental pour que l'espace des
+entrées supprimées soit rendu au système.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+
+class AltitudeResultCache:
+    """Cache SQLite des résultats (alt_sol, alt_relative, Z relatifs) par entité"""
+
+    # Nombre maximal de paramètres par requête SQLite
+    _QUERY_CHUNK = 500
+
+    # Taille approximative d'une entrée hors Z relatifs (clé, valeurs, index)
+    _ROW_OVERHEAD = 80
+
+    def __init__(self, path, max_mb=256):
+        """
+        Ouvre (ou crée) le cache
+
+        Args:
+            path: Chemin du fichier SQLite
+            max_mb: Taille maximale des entrées conservées en Mo (les moins
+                récemment utilisées sont supprimées au-delà)
+        """
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+
+        # Ancien format sans taille des entrées : le cache est reconstruit
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(results)")]
+        if columns and "size" not in columns:
+            self.connection.execute("DROP TABLE results")
+
+        # auto_vacuum ne s'applique à une base existante qu'après un VACUUM
+        (auto_vacuum,) = self.connection.execute("PRAGMA auto_vacuum").fetchone()
+        if auto_vacuum != 2:
+            self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.connection.execute("VACUUM")
+
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key BLOB PRIMARY KEY, alt_sol REAL, alt_relative REAL, "
+            "new_z BLOB, size INTEGER, last_used REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def dem_fingerprint(mnt_layer, band, method, nodata_value, source_crs):
+        """
+        Calcule l'empreinte du MNT et des paramètres du calcul
+
+        Args:
+            mnt_layer: Couche raster du MNT
+            band: Bande échantillonnée
+            method: Méthode d'échantillonnage
+            nodata_value: Altitude utilisée hors MNT
+            source_crs: CRS des géométries (interprétation des coordonnées)
+
+        Returns:
+            bytes: Empreinte à combiner avec celle des géométries
+        """
+        source = mnt_layer.source()
+        path = source.split("|")[0]
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            file_state = f"{stat.st_size}:{stat.st_mtime_ns}"
+        else:
+            file_state = ""
+        description = "|".join([
+            source, file_state, str(band), method, repr(nodata_value),
+            mnt_layer.crs().authid(), source_crs.authid()
+        ])
+        return hashlib.blake2b(description.encode("utf-8"), digest_size=16).digest()
+
+    @staticmethod
+    def feature_key(fingerprint, geometry):
+        """Clé d'une entité : empreinte de sa géométrie et du MNT"""
+        digest = hashlib.blake2b(fingerprint, digest_size=16)
+        digest.update(bytes(geometry.asWkb()))
+        return digest.digest()
+
+    def get_many(self, keys):
+        """
+        Recherche les résultats en cache
+
+        Args:
+            keys: Liste des clés d'entités
+
+        Returns:
+            dict: {clé: (alt_sol, alt_relative, new_z)} pour les clés trouvées
+        """
+        found = {}
+        for start in range(0, len(keys), self._QUERY_CHUNK):
+            chunk = keys[start:start + self._QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT key, alt_sol, alt_relative, new_z FROM results WHERE key IN ({placeholders})",
+                chunk
+            )
+            for key, alt_sol, alt_relative, new_z in rows:
+                found[key] = (alt_sol, alt_relative, np.frombuffer(new_z, dtype="<f8"))
+
+        if found:
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE results SET last_used = ? WHERE key = ?",
+                ((now, key) for key in found)
+            )
+            self.connection.commit()
+        return found
+
+    def put_many(self, entries):
+        """
+        Enregistre des résultats puis applique la limite de taille
+
+        Args:
+            entries: Itérable de (clé, alt_sol, alt_relative, new_z)
+        """
+        now = time.time()
+        rows = []
+        for key, alt_sol, alt_relative, new_z in entries:
+            blob = np.ascontiguousarray(new_z, dtype="<f8").tobytes()
+            rows.append((key, float(alt_sol), float(alt_relative), blob,
+                         len(key) + len(blob) + self._ROW_OVERHEAD, now))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        self.evict()
+        self.connection.commit()
+
+    def evict(self):
+        """
+        Supprime les entrées les moins récemment utilisées au-delà de la
+        taille maximale, puis rend au système les pages libérées
+        """
+        (total,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        # Entrées les plus anciennes jusqu'à couvrir l'excédent
+        self.connection.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, "
+            "SUM(size) OVER (ORDER BY last_used, key) - size AS freed FROM results) "
+            "WHERE freed < ?)",
+            (excess,)
+        )
+        # executescript exécute le pragma jusqu'au bout (toutes les pages libres)
+        self.connection.executescript("PRAGMA incremental_vacuum;")
+
+    def close(self):
+        """Ferme la connexion au cache en annulant une transaction non validée"""
+        if self.connection.in_transaction:
+            self.connection.rollback()
+        self.connection.close()
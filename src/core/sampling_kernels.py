@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+Noyaux NumPy d'échantillonnage d'une grille raster
+
+Ce module ne dépend que de NumPy afin de pouvoir être utilisé aussi bien
+dans QGIS que dans des processus de calcul séparés.
+"""
+
+import numpy as np
+
+
+SAMPLING_METHODS = ("nearest", "bilinear")
+
+
+def pixel_coordinates(x, y, xmin, ymax, xres, yres):
+    """
+    Convertit des coordonnées cartographiques en coordonnées pixel continues
+
+    Le centre du pixel (0, 0) correspond aux coordonnées (0.0, 0.0).
+
+    Args:
+        x, y: Tableaux des coordonnées dans le CRS du raster
+        xmin, ymax: Coin supérieur gauche du raster
+        xres, yres: Taille d'un pixel (positive)
+
+    Returns:
+        tuple: (col, row) en pixels, tableaux float64
+    """
+    col = (np.asarray(x, dtype=np.float64) - xmin) / xres - 0.5
+    row = (ymax - np.asarray(y, dtype=np.float64)) / yres - 0.5
+    return col, row
+
+
+def interpolation_pixels(col, row, method="nearest"):
+    """
+    Renvoie les indices des pixels lus par interpolate
+
+    En mode bilinéaire, les indices du plus proche voisin sont suivis de
+    ceux des quatre voisins (haut-gauche, haut-droite, bas-gauche, bas-droite).
+
+    Args:
+        col, row: Coordonnées pixel continues (voir pixel_coordinates)
+        method: "nearest" ou "bilinear"
+
+    Returns:
+        tuple: (rows, cols) tableaux int64
+    """
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"Méthode d'échantillonnage inconnue : {method}")
+
+    near_r = np.floor(row + 0.5).astype(np.int64)
+    near_c = np.floor(col + 0.5).astype(np.int64)
+    if method == "nearest":
+        return near_r, near_c
+
+    c0 = np.floor(col).astype(np.int64)
+    r0 = np.floor(row).astype(np.int64)
+    rows = np.concatenate((near_r, r0, r0, r0 + 1, r0 + 1))
+    cols = np.concatenate((near_c, c0, c0 + 1, c0, c0 + 1))
+    return rows, cols
+
+
+def interpolate(fetch, col, row, method="nearest"):
+    """
+    Interpole les valeurs d'une grille aux coordonnées pixel données
+
+    En mode bilinéaire, les points dont un voisin est nodata ou hors grille
+    reprennent la valeur du plus proche voisin.
+
+    Args:
+        fetch: Fonction fetch(rows, cols) renvoyant les valeurs des pixels
+        col, row: Coordonnées pixel continues (voir pixel_coordinates)
+        method: "nearest" ou "bilinear"
+
+    Returns:
+        np.ndarray: Valeurs interpolées (NaN si aucune donnée)
+    """
+    # Une seule lecture pour le plus proche voisin et les quatre voisins
+    values = fetch(*interpolation_pixels(col, row, method))
+    if method == "nearest":
+        return values
+
+    nearest, v00, v01, v10, v11 = np.split(values, 5)
+    fc = col - np.floor(col)
+    fr = row - np.floor(row)
+
+    top = v00 + (v01 - v00) * fc
+    bottom = v10 + (v11 - v10) * fc
+    values = top + (bottom - top) * fr
+    return np.where(np.isnan(values), nearest, values)
+
+
+def tile_keys(rows, cols, tile_size, tile_cols):
+    """Renvoie l'identifiant de la tuile contenant chaque pixel"""
+    return (rows // tile_size) * tile_cols + cols // tile_size
+
+
+def gather_tiles(rows, cols, get_tile, width, height, tile_size):
+    """
+    Lit des pixels dans une grille découpée en tuiles
+
+    Les pixels sont regroupés par tuile afin que chaque tuile ne soit
+    demandée qu'une seule fois.
+
+    Args:
+        rows, cols: Indices entiers des pixels dans la grille complète
+        get_tile: Fonction get_tile(tile_row, tile_col) -> tableau 2D
+        width, height: Dimensions de la grille complète
+        tile_size: Taille d'une tuile en pixels (côté)
+
+    Returns:
+        np.ndarray: Valeurs float64, NaN hors grille ou sur nodata
+    """
+    values = np.full(rows.shape, np.nan)
+    inside = np.flatnonzero((rows >= 0) & (rows < height) &
+                            (cols >= 0) & (cols < width))
+    if inside.size == 0:
+        return values
+
+    tile_cols = -(-width // tile_size)
+    r = rows[inside]
+    c = cols[inside]
+    keys = tile_keys(r, c, tile_size, tile_cols)
+    order = np.argsort(keys, kind="stable")
+    starts = np.flatnonzero(np.diff(keys[order])) + 1
+    for group in np.split(order, starts):
+        tile_row, tile_col = divmod(int(keys[group[0]]), tile_cols)
+        tile = get_tile(tile_row, tile_col)
+        values[inside[group]] = tile[r[group] - tile_row * tile_size,
+                                     c[group] - tile_col * tile_size]
+    return values
+
+
+def relative_altitudes(z, ground_z, offsets):
+    """
+    Calcule les altitudes relatives par entité
+
+    Args:
+        z: Altitudes absolues de tous les sommets
+        ground_z: Altitudes du sol sous ces sommets
+        offsets: Indices de début de chaque entité suivis du nombre de sommets
+
+    Returns:
+        tuple: (alt_sol, alt_relative, new_z) avec les moyennes par entité
+        et les Z relatifs de chaque sommet
+    """
+    starts = offsets[:-1]
+    counts = np.diff(offsets)
+    alt_sol = np.add.reduceat(ground_z, starts) / counts
+    alt_absolue = np.add.reduceat(z, starts) / counts
+    return alt_sol, alt_absolue - alt_sol, z - ground_z
+
+
+def relative_altitude_chunk(z, col, row, offsets, tiles, grid, method, nodata_value):
+    """
+    Calcule les altitudes relatives d'un lot d'entités (processus de calcul)
+
+    Args:
+        z: Altitudes absolues des sommets du lot
+        col, row: Coordonnées pixel continues des sommets dans le MNT
+        offsets: Indices de début de chaque entité suivis du nombre de sommets
+        tiles: Dictionnaire {(tile_row, tile_col): tableau} des tuiles utiles
+        grid: (largeur, hauteur, taille_tuile) de la grille du MNT
+        method: Méthode d'échantillonnage
+        nodata_value: Altitude utilisée hors MNT ou sur nodata
+
+    Returns:
+        tuple: Voir relative_altitudes
+    """
+    width, height, tile_size = grid
+
+    def fetch(rows, cols):
+        return gather_tiles(rows, cols, lambda tr, tc: tiles[(tr, tc)],
+                            width, height, tile_size)
+
+    ground_z = interpolate(fetch, col, row, method)
+    ground_z[np.isnan(ground_z)] = nodata_value
+    return relative_altitudes(z, ground_z, offsets)
+
+
+def densify_counts(xy, offsets, step):
+    """
+    Calcule le nombre de points d'échantillonnage générés par chaque sommet
+
+    Chaque segment est découpé en pas d'au plus `step` ; le dernier sommet
+    de chaque entité compte pour un point.
+
+    Args:
+        xy: Coordonnées planes des sommets (N, 2)
+        offsets: Indices de début de chaque entité suivis de N
+        step: Pas d'échantillonnage maximal
+
+    Returns:
+        tuple: (counts, lengths) par sommet, lengths étant la longueur du
+        segment partant du sommet (0 pour le dernier sommet d'une entité)
+    """
+    is_last = np.zeros(len(xy), dtype=bool)
+    is_last[np.asarray(offsets[1:]) - 1] = True
+
+    lengths = np.zeros(len(xy))
+    if len(xy) > 1:
+        lengths[:-1] = np.hypot(*(xy[1:, :2] - xy[:-1, :2]).T)
+    lengths[is_last] = 0.0
+
+    counts = np.maximum(1, np.ceil(lengths / step)).astype(np.int64)
+    counts[is_last] = 1
+    return counts, lengths
+
+
+def densify_lines(coords, offsets, step):
+    """
+    Densifie des lignes à pas régulier sans boucle Python par point
+
+    Toutes les colonnes de coords (x, y, z...) sont interpolées linéairement
+    le long de chaque segment ; les sommets d'origine sont conservés.
+
+    Args:
+        coords: Coordonnées des sommets (N, k), x et y en premières colonnes
+        offsets: Indices de début de chaque entité suivis de N
+        step: Pas d'échantillonnage maximal (unités du CRS)
+
+    Returns:
+        tuple: (points (M, k), distance (M,) depuis le début de l'entité,
+        new_offsets (indices de début de chaque entité suivis de M))
+    """
+    offsets = np.asarray(offsets)
+    counts, lengths = densify_counts(coords, offsets, step)
+
+    # Vecteur de chaque segment (nul pour le dernier sommet d'une entité)
+    deltas = np.zeros_like(coords, dtype=np.float64)
+    if len(coords) > 1:
+        deltas[:-1] = coords[1:] - coords[:-1]
+    deltas[lengths == 0] = 0.0
+
+    # Distance cumulée au début de chaque segment, remise à zéro par entité
+    cumulative = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+    cumulative -= np.repeat(cumulative[offsets[:-1]], np.diff(offsets))
+
+    vertex = np.repeat(np.arange(len(coords)), counts)
+    first = np.cumsum(counts) - counts
+    t = (np.arange(vertex.size) - first[vertex]) / counts[vertex]
+
+    points = coords[vertex] + t[:, None] * deltas[vertex]
+    distance = cumulative[vertex] + t * lengths[vertex]
+
+    new_offsets = np.zeros(len(offsets), dtype=np.int64)
+    if len(offsets) > 1:
+        np.cumsum(np.add.reduceat(counts, offsets[:-1]), out=new_offsets[1:])
+    return points, distance, new_offsets
+
+
+def densify_parts(coords, part_offsets, feature_parts, step):
+    """
+    Densifie des entités multiples partie par partie
+
+    Aucun point n'est créé entre la fin d'une partie et le début de la
+    suivante ; la distance continue d'une partie à l'autre sans compter
+    l'écart qui les sépare.
+
+    Args:
+        coords: Coordonnées des sommets (N, k), x et y en premières colonnes
+        part_offsets: Indices de début de chaque partie suivis de N
+        feature_parts: Indice de la première partie de chaque entité suivi
+            du nombre de parties
+        step: Pas d'échantillonnage maximal (unités du CRS)
+
+    Returns:
+        tuple: (points (M, k), distance (M,) depuis le début de l'entité,
+        new_offsets (indices de début de chaque entité suivis de M))
+    """
+    feature_parts = np.asarray(feature_parts)
+    points, distance, point_offsets = densify_lines(coords, part_offsets, step)
+
+    # Longueur des parties précédentes de la même entité
+    part_length = distance[point_offsets[1:] - 1]
+    before = np.cumsum(part_length) - part_length
+    before -= np.repeat(before[feature_parts[:-1]], np.diff(feature_parts))
+    distance += np.repeat(before, np.diff(point_offsets))
+    return points, distance, point_offsets[feature_parts]
+
+
+def point_batches(counts, max_points):
+    """
+    Découpe une suite d'entités en lots contigus d'au plus max_points points
+
+    Une entité dépassant à elle seule max_points forme un lot.
+
+    Args:
+        counts: Nombre de points de chaque entité
+        max_points: Nombre maximal de points par lot
+
+    Returns:
+        list: Liste de (première_entité, dernière_entité + 1)
+    """
+    cumulative = np.cumsum(counts)
+    batches = []
+    start, done = 0, 0
+    while start < len(counts):
+        end = int(np.searchsorted(cumulative, done + max_points, side="right"))
+        end = max(end, start + 1)
+        batches.append((start, end))
+        done = cumulative[end - 1]
+        start = end
+    return batches
+
+
+def clearance_statistics(clearance, distance, offsets):
+    """
+    Résume la hauteur au-dessus du sol le long de chaque entité
+
+    Args:
+        clearance: Hauteur au-dessus du sol de chaque point densifié
+        distance: Distance de chaque point depuis le début de son entité
+        offsets: Début des points de chaque entité suivi du total
+
+    Returns:
+        tuple: (minimum, moyenne, distance du point le plus bas) par entité
+    """
+    starts = offsets[:-1]
+    counts = np.diff(offsets)
+    minimum = np.minimum.reduceat(clearance, starts)
+    mean = np.add.reduceat(clearance, starts) / counts
+
+    # Point le plus bas de chaque entité : premier point après tri par (entité, hauteur)
+    feature = np.repeat(np.arange(len(counts)), counts)
+    order = np.lexsort((clearance, feature))
+    worst = order[starts]
+    return minimum, mean, distance[worst]
+
+
+def sliding_maximum(values, size, axis=0):
+    """
+    Maximum glissant le long d'un axe (fenêtres entièrement contenues)
+
+    Le maximum sur des fenêtres de longueur doublée est obtenu à partir des
+    fenêtres précédentes : log2(size) passes au lieu de size. Les NaN
+    (nodata) sont ignorés.
+
+    Args:
+        values: Tableau de valeurs
+        size: Longueur de la fenêtre
+        axis: Axe du calcul
+
+    Returns:
+        np.ndarray: Tableau raccourci de size - 1 le long de l'axe
+    """
+    values = np.moveaxis(values, axis, 0)
+    n = values.shape[0]
+    result = values
+    length = 1
+    while length * 2 <= size:
+        result = np.fmax(result[:-length], result[length:])
+        length *= 2
+    if length < size:
+        result = np.fmax(result[:n - size + 1], result[size - length:n - length + 1])
+    return np.moveaxis(result, 0, axis)
+
+
+def window_maximum(values, radius):
+    """
+    Maximum sur une fenêtre carrée de (2 * radius + 1) pixels de côté
+
+    Args:
+        values: Grille 2D comprenant une bordure de radius pixels (NaN hors données)
+        radius: Demi-côté de la fenêtre en pixels
+
+    Returns:
+        np.ndarray: Grille sans la bordure, chaque pixel valant le maximum
+        de sa fenêtre
+    """
+    size = 2 * radius + 1
+    return sliding_maximum(sliding_maximum(values, size, axis=0), size, axis=1)
+
+
+def block_extrema(values, factor):
+    """
+    Altitudes minimale et maximale par bloc de factor x factor pixels
+
+    Args:
+        values: Grille 2D (les NaN sont ignorés)
+        factor: Côté d'un bloc en pixels
+
+    Returns:
+        tuple: (minimum, maximum) grilles de taille divisée par factor
+        (arrondie au supérieur)
+    """
+    height, width = values.shape
+    padded = np.full((-(-height // factor) * factor, -(-width // factor) * factor), np.nan)
+    padded[:height, :width] = values
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    minimum = np.fmin.reduce(np.fmin.reduce(blocks, axis=3), axis=1)
+    maximum = np.fmax.reduce(np.fmax.reduce(blocks, axis=3), axis=1)
+    return minimum, maximum
+
+
+def threshold_classes(z, ground_min, ground_max, threshold):
+    """
+    Classe des points par rapport à un seuil de hauteur à partir d'un encadrement du sol
+
+    La hauteur au-dessus du sol est comprise entre z - ground_max et
+    z - ground_min.
+
+    Args:
+        z: Altitudes des points
+        ground_min, ground_max: Encadrement de l'altitude du sol sous chaque point
+        threshold: Hauteur minimale au-dessus du sol
+
+    Returns:
+        tuple: (surely_below, uncertain) booléens par point : hauteur
+        sûrement sous le seuil, ou encadrement contenant le seuil (à
+        rééchantillonner à pleine résolution)
+    """
+    surely_below = z - ground_min < threshold
+    uncertain = (z - ground_max < threshold) & ~surely_below
+    return surely_below, uncertain
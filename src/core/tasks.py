@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Exécution des traitements du plugin en arrière-plan avec QgsTask
+"""
+
+import time
+
+from qgis.core import (QgsTask, QgsMessageLog, Qgis, QgsFeatureRequest,
+                       QgsVectorLayerFeatureSource, QgsWkbTypes)
+from qgis.PyQt.QtCore import QCoreApplication
+
+
+class TaskCanceledError(Exception):
+    """Levée dans le calcul lorsque l'utilisateur annule la tâche"""
+
+
+class ThrottledFeedback:
+    """
+    Callback de progression relié à une QgsTask
+
+    S'utilise comme les progress_callback(value, maximum=None) existants.
+    La mise à jour de la barre de progression est limitée en fréquence et
+    l'annulation de la tâche est remontée sous forme de TaskCanceledError.
+    """
+
+    def __init__(self, task, interval=0.2):
+        """
+        Args:
+            task: QgsTask à mettre à jour
+            interval: Délai minimal entre deux mises à jour (secondes)
+        """
+        self.task = task
+        self.interval = interval
+        self.maximum = 0
+        self._last_update = 0.0
+
+    def __call__(self, value, maximum=None):
+        if maximum is not None:
+            self.maximum = maximum
+        if self.task.isCanceled():
+            raise TaskCanceledError("Traitement annulé par l'utilisateur")
+
+        now = time.monotonic()
+        if now - self._last_update < self.interval and maximum is None:
+            return
+        self._last_update = now
+        if self.maximum:
+            self.task.setProgress(min(100.0, 100.0 * value / self.maximum))
+
+    def is_canceled(self):
+        """Indique si l'utilisateur a annulé la tâche"""
+        return self.task.isCanceled()
+
+
+def move_to_main_thread(qobject):
+    """
+    Transfère un objet Qt (ex. couche créée dans la tâche) vers le thread principal
+
+    À appeler depuis la tâche avant de renvoyer une couche qui sera
+    ajoutée au projet.
+    """
+    qobject.moveToThread(QCoreApplication.instance().thread())
+    return qobject
+
+
+class LayerSnapshot:
+    """
+    Instantané d'une couche vectorielle, lisible depuis une tâche
+
+    À créer dans le thread principal : les entités sont lues au travers
+    d'un QgsVectorLayerFeatureSource et les propriétés utiles de la couche
+    sont copiées. S'utilise à la place de la couche (getFeatures, id, name,
+    crs...) dans les calculs exécutés en arrière-plan, qui ne touchent
+    ainsi jamais à la couche du projet.
+    """
+
+    def __init__(self, layer):
+        """
+        Args:
+            layer: Couche vectorielle du projet
+        """
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._id = layer.id()
+        self._name = layer.name()
+        self._uri = layer.source()
+        self._crs = layer.crs()
+        self._fields = layer.fields()
+        self._wkb_type = layer.wkbType()
+        self._feature_count = layer.featureCount()
+
+    def getFeatures(self, request=None):
+        return self._source.getFeatures(request or QgsFeatureRequest())
+
+    def id(self):
+        return self._id
+
+    def name(self):
+        return self._name
+
+    def source(self):
+        return self._uri
+
+    def crs(self):
+        return self._crs
+
+    def fields(self):
+        return self._fields
+
+    def wkbType(self):
+        return self._wkb_type
+
+    def geometryType(self):
+        return QgsWkbTypes.geometryType(self._wkb_type)
+
+    def featureCount(self):
+        return self._feature_count
+
+
+class RasterSnapshot:
+    """
+    Instantané d'une couche raster (MNT), utilisable depuis une tâche
+
+    À créer dans le thread principal : le fournisseur est cloné et le CRS
+    et la source de la couche sont copiés. S'utilise à la place de la
+    couche dans les calculs exécutés en arrière-plan (même interface que
+    DemCatalog), qui restent valides si la couche est retirée du projet.
+    """
+
+    def __init__(self, layer):
+        """
+        Args:
+            layer: Couche raster du projet
+        """
+        self._provider = layer.dataProvider().clone()
+        self._name = layer.name()
+        self._uri = layer.source()
+        self._crs = layer.crs()
+
+    def dataProvider(self):
+        return self._provider
+
+    def name(self):
+        return self._name
+
+    def source(self):
+        return self._uri
+
+    def crs(self):
+        return self._crs
+
+
+class PluginTask(QgsTask):
+    """
+    Tâche exécutant une fonction de calcul hors du thread principal
+
+    La fonction reçoit un argument nommé progress_callback (ThrottledFeedback).
+    Son résultat est transmis à on_finished(result, exception), appelé dans
+    le thread principal une fois la tâche terminée ou annulée.
+    """
+
+    def __init__(self, description, function, on_finished, *args, **kwargs):
+        """
+        Args:
+            description: Libellé affiché dans le gestionnaire de tâches
+            function: Fonction de calcul à exécuter
+            on_finished: Callback appelé dans le thread principal
+            *args, **kwargs: Arguments transmis à la fonction
+        """
+        super().__init__(description, QgsTask.CanCancel)
+        self.function = function
+        self.on_finished = on_finished
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        """Exécute le calcul (thread de travail)"""
+        try:
+            self.result = self.function(
+                *self.args, progress_callback=ThrottledFeedback(self), **self.kwargs
+            )
+            return True
+        except TaskCanceledError:
+            return False
+        except Exception as e:
+            self.exception = e
+            QgsMessageLog.logMessage(f"Erreur tâche '{self.description()}': {str(e)}",
+                                     level=Qgis.Critical)
+            return False
+
+    def finished(self, result):
+        """Transmet le résultat au thread principal"""
+        self.on_finished(self.result if result else None, self.exception)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage sur disque des altitudes du sol échantillonnées
+
+Les données sont rangées par colonnes dans un dossier de fichiers .npy,
+ouverts en mémoire mappée : les outils qui les relisent n'ont pas besoin
+de rééchantillonner le MNT ni de charger tout le fichier.
+
+Contenu du dossier :
+    metadata.json        MNT, CRS, méthode d'échantillonnage...
+    fids.npy             Identifiant de chaque entité (F,)
+    offsets.npy          Début des sommets de chaque entité, suivi de N (F + 1,)
+    xy.npy               Coordonnées des sommets dans le CRS du MNT (N, 2)
+    ground_z.npy         Altitude du sol sous chaque sommet (N,)
+    profile_offsets.npy  Début du profil densifié de chaque entité (F + 1,)   [optionnel]
+    profile.npy          Profils densifiés : distance, x, y, altitude sol (M, 4) [optionnel]
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+class TerrainProfileStore:
+    """Accès aux altitudes du sol enregistrées pour une couche de trajectoires"""
+
+    METADATA_FILE = "metadata.json"
+
+    def __init__(self, path):
+        """
+        Ouvre un dossier existant (lecture paresseuse en mémoire mappée)
+
+        Args:
+            path: Dossier du stockage
+        """
+        self.path = path
+        with open(os.path.join(path, self.METADATA_FILE), encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self._arrays = {}
+        self._index = None
+
+    @classmethod
+    def write(cls, path, metadata, fids, offsets, xy, ground_z):
+        """
+        Enregistre les altitudes du sol par sommet
+
+        Args:
+            path: Dossier du stockage (créé si besoin)
+            metadata: Dictionnaire sérialisable en JSON
+            fids: Identifiants des entités
+            offsets: Début des sommets de chaque entité suivi du nombre total
+            xy: Coordonnées des sommets (N, 2)
+            ground_z: Altitude du sol de chaque sommet (N,)
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "fids.npy"), np.asarray(fids, dtype=np.int64))
+        np.save(os.path.join(path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        np.save(os.path.join(path, "xy.npy"), np.ascontiguousarray(xy[:, :2], dtype=np.float64))
+        np.save(os.path.join(path, "ground_z.npy"), np.asarray(ground_z, dtype=np.float64))
+
+        # Un ancien profil ne correspond plus aux nouveaux sommets
+        for name in ("profile_offsets.npy", "profile.npy"):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+
+        with open(os.path.join(path, cls.METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+
+    @staticmethod
+    def create_profile(path, profile_offsets):
+        """
+        Crée le fichier des profils densifiés, à remplir par lots
+
+        Args:
+            path: Dossier du stockage
+            profile_offsets: Début du profil de chaque entité suivi du total M
+
+        Returns:
+            np.memmap: Tableau (M, 4) inscriptible : distance, x, y, altitude sol
+        """
+        np.save(os.path.join(path, "profile_offsets.npy"), np.asarray(profile_offsets, dtype=np.int64))
+        return np.lib.format.open_memmap(
+            os.path.join(path, "profile.npy"), mode="w+",
+            dtype=np.float64, shape=(int(profile_offsets[-1]), 4)
+        )
+
+    def _array(self, name):
+        """Ouvre un tableau du stockage en mémoire mappée (une seule fois)"""
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return self._arrays[name]
+
+    @property
+    def fids(self):
+        return self._array("fids")
+
+    @property
+    def offsets(self):
+        return self._array("offsets")
+
+    @property
+    def xy(self):
+        return self._array("xy")
+
+    @property
+    def ground_z(self):
+        return self._array("ground_z")
+
+    @property
+    def has_profiles(self):
+        """Indique si des profils densifiés ont été enregistrés"""
+        return os.path.exists(os.path.join(self.path, "profile.npy"))
+
+    def _position(self, fid):
+        """Position d'une entité dans le stockage"""
+        if self._index is None:
+            self._index = {int(f): i for i, f in enumerate(self.fids)}
+        return self._index[fid]
+
+    def feature_ground_z(self, fid):
+        """Altitudes du sol sous les sommets d'une entité (vue sans copie)"""
+        i = self._position(fid)
+        return self.ground_z[self.offsets[i]:self.offsets[i + 1]]
+
+    def feature_profile(self, fid):
+        """
+        Profil densifié d'une entité
+
+        Returns:
+            np.ndarray: Tableau (M, 4) : distance, x, y, altitude sol
+        """
+        i = self._position(fid)
+        offsets = self._array("profile_offsets")
+        return self._array("profile")[offsets[i]:offsets[i + 1]]
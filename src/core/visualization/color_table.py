@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Table de couleurs quantifiée pour la coloration des segments par altitude
+
+La palette est calculée une seule fois ; les altitudes sont ensuite
+converties en indices de palette pour des tableaux entiers en un appel.
+"""
+
+import numpy as np
+
+
+class ColorTable:
+    """
+    Palette de couleurs indexée par altitude
+
+    Indices de la palette :
+        0              altitude inférieure ou égale au début du dégradé (noir)
+        1 .. levels    niveaux régulièrement espacés sur le dégradé
+        levels + 1     altitude inconnue (première couleur du dégradé)
+    """
+
+    BELOW_COLOR = (0, 0, 0)
+    # Nombre de niveaux par défaut : borne le nombre de catégories de la symbologie
+    DEFAULT_LEVELS = 64
+
+    def __init__(self, zmin, zmax, level_colors, nodata_color):
+        """
+        Args:
+            zmin, zmax: Altitudes du début et de la fin du dégradé
+            level_colors: Couleurs (levels, 3) des niveaux de zmin à zmax
+            nodata_color: Couleur des altitudes inconnues (r, g, b)
+        """
+        self.zmin = float(zmin)
+        self.zmax = float(zmax)
+        self.levels = len(level_colors)
+        self.colors = np.vstack((
+            self.BELOW_COLOR, level_colors, nodata_color
+        )).round().clip(0, 255).astype(np.uint8)
+
+        # Limites entre niveaux : milieu entre deux altitudes de niveau consécutives
+        level_altitudes = np.linspace(self.zmin, self.zmax, self.levels)
+        self.edges = (level_altitudes[1:] + level_altitudes[:-1]) / 2
+
+    @classmethod
+    def from_color_stops(cls, color_stops, levels=DEFAULT_LEVELS):
+        """
+        Construit la table à partir de points de contrôle (ColorStop)
+
+        Args:
+            color_stops: Points de contrôle triés par altitude
+            levels: Nombre de niveaux de la palette
+
+        Returns:
+            ColorTable: Table interpolant linéairement entre les points
+        """
+        altitudes = np.array([stop.altitude for stop in color_stops], dtype=np.float64)
+        colors = np.array([stop.color for stop in color_stops], dtype=np.float64)
+        level_altitudes = np.linspace(altitudes[0], altitudes[-1], levels)
+        level_colors = np.column_stack([
+            np.interp(level_altitudes, altitudes, colors[:, channel]) for channel in range(3)
+        ])
+        # Couleurs tronquées à l'entier comme dans l'ancienne interpolation
+        return cls(altitudes[0], altitudes[-1], np.floor(level_colors), colors[0])
+
+    @classmethod
+    def from_ramp(cls, ramp, zmin, zmax, levels=DEFAULT_LEVELS):
+        """
+        Construit la table à partir d'un dégradé QGIS (ex. QgsColorRampButton)
+
+        Args:
+            ramp: Dégradé (objet disposant de color(t) pour t dans [0, 1])
+            zmin, zmax: Altitudes correspondant au début et à la fin du dégradé
+            levels: Nombre de niveaux de la palette
+
+        Returns:
+            ColorTable: Table échantillonnant le dégradé
+        """
+        level_colors = []
+        for t in np.linspace(0.0, 1.0, levels):
+            color = ramp.color(float(t))
+            level_colors.append((color.red(), color.green(), color.blue()))
+        return cls(zmin, zmax, level_colors, level_colors[0])
+
+    def indices(self, z):
+        """
+        Convertit des altitudes en indices de palette
+
+        Args:
+            z: Tableau des altitudes
+
+        Returns:
+            np.ndarray: Indices (uint16) dans self.colors
+        """
+        z = np.asarray(z, dtype=np.float64)
+        indices = np.digitize(z, self.edges).astype(np.uint16) + 1
+        indices[z <= self.zmin] = 0
+        indices[np.isnan(z)] = self.levels + 1
+        return indices
+
+    def class_label(self, index):
+        """Libellé de la plage d'altitudes d'un indice de palette"""
+        if index == 0:
+            return f"≤ {self.zmin:g} m"
+        if index == self.levels + 1:
+            return "Altitude inconnue"
+        bounds = np.concatenate(([self.zmin], self.edges, [np.inf]))
+        low, high = bounds[index - 1], bounds[index]
+        if np.isinf(high):
+            return f"> {low:.0f} m"
+        return f"{low:.0f} - {high:.0f} m"
+
+    def hex_color(self, index):
+        """Couleur d'un indice de palette au format #RRGGBB"""
+        r, g, b = self.colors[index]
+        return f"#{r:02x}{g:02x}{b:02x}"
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Écriture par lots des entités d'une couche de sortie
+
+Les entités sont ajoutées à une couche mémoire ou écrites au fil de l'eau
+dans un fichier GeoPackage ou FlatGeobuf : seul le lot en cours est gardé
+en mémoire. L'index spatial du fichier est construit une fois toutes les
+entités écrites.
+"""
+
+import os
+
+import numpy as np
+from qgis.core import (QgsVectorLayer, QgsVectorFileWriter, QgsFeatureRequest,
+                       QgsCoordinateTransformContext, QgsWkbTypes, QgsVectorDataProvider)
+
+
+class LayerWriter:
+    """Destination par lots d'une couche de sortie (mémoire, GeoPackage ou FlatGeobuf)"""
+
+    FORMATS = {".gpkg": "GPKG", ".fgb": "FlatGeobuf"}
+
+    def __init__(self, name, fields, wkb_type, crs, path=None, batch_size=5000):
+        """
+        Args:
+            name: Nom de la couche
+            fields: Champs (QgsFields) de la couche
+            wkb_type: Type de géométrie (QgsWkbTypes)
+            crs: Système de coordonnées de la couche
+            path: Fichier .gpkg ou .fgb (None = couche mémoire)
+            batch_size: Nombre d'entités écrites par lot
+        """
+        self.name = name
+        self.path = path
+        self.batch_size = batch_size
+        self._batch = []
+        self._fids = []
+        self._layer = None
+        self._writer = None
+
+        if path is None:
+            self._layer = QgsVectorLayer(
+                f"{QgsWkbTypes.displayString(wkb_type)}?crs={crs.authid()}", name, "memory"
+            )
+            self._layer.dataProvider().addAttributes(fields.toList())
+            self._layer.updateFields()
+            return
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in self.FORMATS:
+            raise ValueError(f"Format de sortie non pris en charge : {path} (.gpkg ou .fgb)")
+        self.driver = self.FORMATS[extension]
+
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = self.driver
+        options.fileEncoding = "UTF-8"
+        if self.driver == "GPKG":
+            # Plusieurs couches par fichier ; index spatial construit à la fin
+            options.layerName = name
+            options.layerOptions = ["SPATIAL_INDEX=NO"]
+            options.actionOnExistingFile = (
+                QgsVectorFileWriter.CreateOrOverwriteLayer if os.path.exists(path)
+                else QgsVectorFileWriter.CreateOrOverwriteFile
+            )
+        else:
+            # L'index spatial FlatGeobuf est construit par le pilote à la fermeture
+            options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteFile
+
+        self._writer = QgsVectorFileWriter.create(
+            path, fields, wkb_type, crs, QgsCoordinateTransformContext(), options
+        )
+        if self._writer.hasError() != QgsVectorFileWriter.NoError:
+            raise RuntimeError(f"Impossible de créer {path} : {self._writer.errorMessage()}")
+
+    def add(self, features):
+        """Ajoute des entités, écrites dès que le lot est complet"""
+        self._batch.extend(features)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Écrit le lot en cours"""
+        if not self._batch:
+            return
+        if self._writer is not None:
+            if not self._writer.addFeatures(self._batch):
+                raise RuntimeError(f"Échec de l'écriture dans {self.path} : "
+                                   f"{self._writer.errorMessage()}")
+        else:
+            success, added = self._layer.dataProvider().addFeatures(self._batch)
+            if not success:
+                raise RuntimeError(f"Échec de l'ajout des entités à {self.name}")
+            self._fids.extend(feature.id() for feature in added)
+        self._batch.clear()
+
+    def finish(self):
+        """
+        Termine l'écriture et renvoie la couche
+
+        Returns:
+            QgsVectorLayer: Couche mémoire, ou couche ouverte sur le fichier écrit
+        """
+        self.flush()
+        if self._writer is None:
+            self._layer.updateExtents()
+            return self._layer
+
+        # Fermer le fichier (la destruction du writer termine l'écriture)
+        self._writer = None
+        uri = f"{self.path}|layername={self.name}" if self.driver == "GPKG" else self.path
+        self._layer = QgsVectorLayer(uri, self.name, "ogr")
+        if not self._layer.isValid():
+            raise RuntimeError(f"Impossible d'ouvrir la couche écrite : {uri}")
+        if self.driver == "GPKG":
+            self._layer.dataProvider().createSpatialIndex()
+        return self._layer
+
+    def fids(self):
+        """
+        Identifiants des entités dans l'ordre d'écriture (après finish)
+
+        Returns:
+            np.ndarray: Identifiants, ou None si la couche ne permet pas de
+            modifier les attributs (ex. FlatGeobuf, réordonné par son index)
+        """
+        provider = self._layer.dataProvider()
+        if not provider.capabilities() & QgsVectorDataProvider.ChangeAttributeValues:
+            return None
+        if self.path is not None:
+            # GeoPackage : identifiants attribués dans l'ordre d'écriture
+            request = QgsFeatureRequest().setNoAttributes().setFlags(QgsFeatureRequest.NoGeometry)
+            return np.array([feature.id() for feature in self._layer.getFeatures(request)],
+                            dtype=np.int64)
+        return np.array(self._fids, dtype=np.int64)
@@ -3,16 +3,28 @@
 Module de visualisation des segments de ligne avec colormap
 """
 
-import math
-from typing import List, Tuple, Dict, Any
+import hashlib
+import os
+from collections import deque
+from typing import List, Tuple, Dict, Any, Callable
 from dataclasses import dataclass
 
-from qgis.core import (QgsGeometry, QgsFeature, QgsPoint, QgsVectorLayer,
+import numpy as np
+from qgis.core import (QgsFeature, QgsVectorLayer, QgsFields, QgsFeatureRequest, QgsProject,
                       QgsField, QgsSimpleLineSymbolLayer, QgsSymbol,
-                      QgsRendererCategory, QgsCategorizedSymbolRenderer)
+                      QgsRendererCategory, QgsCategorizedSymbolRenderer,
+                      QgsLineSymbol, QgsSingleSymbolRenderer, QgsSymbolLayer,
+                      QgsGeometryGeneratorSymbolLayer, QgsGradientColorRamp, QgsGradientStop,
+                      QgsProperty, QgsColorRampTransformer, QgsWkbTypes)
 from qgis.PyQt.QtCore import QMetaType
 from qgis.PyQt.QtGui import QColor
 
+from ..geometry_arrays import geometry_to_arrays, arrays_to_geometry
+from ..parallel import create_process_pool, chunk_bounds
+from .segmentation import split_lines_3d, segment_features
+from .color_table import ColorTable
+from .layer_writer import LayerWriter
+
 
 @dataclass
 class ColorStop:
@@ -31,215 +43,458 @@ class LineSegmentVisualizer:
         ColorStop(1000, (0, 128, 0))     # vert
     ]
 
-    def __init__(self, segment_length: float = 5.0, color_stops: List[ColorStop] = None):
+    # Modes de sortie : segments de longueur fixe ou une entité par trace (altitude en M)
+    OUTPUT_MODES = ("segments", "track")
+
+    # Longueurs des niveaux de la pyramide, en multiples de segment_length
+    PYRAMID_FACTORS = (1, 10, 100)
+    # Échelle (dénominateur) à partir de laquelle un niveau remplace le précédent,
+    # par mètre de longueur de segment : 50 m -> 1:10 000, 500 m -> 1:100 000
+    SCALE_PER_METER = 200
+
+    # Couleur de chaque partie d'une trace : moyenne des M de ses deux extrémités
+    TRACK_COLOR_EXPRESSION = (
+        "with_variable('part', geometry_n($geometry, @geometry_part_num), "
+        "(m(start_point(@part)) + m(end_point(@part))) / 2)"
+    )
+
+    def __init__(self, segment_length: float = 5.0, color_stops: List[ColorStop] = None,
+                 output_mode: str = "segments", workers: int = 1, output_path: str = None,
+                 batch_size: int = 5000):
         """
         Initialise le visualiseur de segments
         
         Args:
             segment_length: Longueur des segments en mètres
             color_stops: Points de contrôle pour le dégradé de couleur
+            output_mode: "segments" (segments de longueur fixe) ou "track"
+                (une entité LineStringZM par trace)
+            workers: Nombre de processus de découpage (1 = découpage en série)
+            output_path: Fichier .gpkg ou .fgb de sortie (None = couche mémoire)
+            batch_size: Nombre d'entités écrites par lot
         """
         self.segment_length = segment_length
+        self.output_mode = output_mode
+        self.workers = workers
+        self.output_path = output_path
+        self.batch_size = batch_size
         self.color_stops = color_stops or self.DEFAULT_COLOR_STOPS
+        # Table de couleurs imposée (ex. dégradé du dialogue), sinon déduite de color_stops
+        self.color_table = None
+        # Découpages déjà calculés : {(id couche source, longueur): dict}, voir cached_segmentation
+        self._segmentation_cache = {}
 
-    def create_segment_layer(self, source_layer: QgsVectorLayer, name: str = None) -> QgsVectorLayer:
+    def create_segment_layer(self, source_layer: QgsVectorLayer, name: str = None,
+                             progress_callback: Callable = None) -> QgsVectorLayer:
         """
         Crée une nouvelle couche de segments colorés
         
         Args:
             source_layer: Couche source contenant les lignes à segmenter
             name: Nom de la nouvelle couche (optionnel)
+            progress_callback: Callback de progression (value, maximum) (optionnel)
             
         Returns:
             Nouvelle couche vectorielle avec les segments
         """
-        # Créer la couche 
-        # Utiliser MultiLineStringZ pour supporter à la fois les lignes simples et multiples avec Z
+        if self.output_mode not in self.OUTPUT_MODES:
+            raise ValueError(f"Mode de sortie inconnu : {self.output_mode}")
+        if self.output_mode == "track":
+            return self._create_track_layer(source_layer, name, progress_callback)
+        
         name = name or f"{source_layer.name()}_segments_{self.segment_length}m"
-        vl = QgsVectorLayer(
-            f"MultiLineStringZ?crs={source_layer.crs().authid()}",
-            name,
-            "memory"
-        )
+        return self._create_segment_layers(source_layer, [self.segment_length], [name],
+                                           progress_callback)[0]
+
+    def create_segment_pyramid(self, source_layer: QgsVectorLayer, lengths: List[float] = None,
+                               progress_callback: Callable = None) -> List[QgsVectorLayer]:
+        """
+        Crée des couches de segments de plusieurs longueurs, visibles selon l'échelle
         
-        # Ajouter les champs
-        provider = vl.dataProvider()
-        provider.addAttributes([
-            QgsField("z_avg", QMetaType.Double),
-            QgsField("length", QMetaType.Double),
-            QgsField("color", QMetaType.QString)
-        ])
-        vl.updateFields()
-
-        # Traiter toutes les entités
-        features = []
-        for feature in source_layer.getFeatures():
-            features.extend(self._process_feature(feature))
-            
-        # Ajouter les entités
-        provider.addFeatures(features)
-        vl.updateExtents()
+        Les coordonnées de chaque entité ne sont lues qu'une fois pour tous
+        les niveaux. Chaque niveau n'est affiché que dans sa plage d'échelles :
+        les segments courts en vue rapprochée, les longs en vue éloignée.
         
-        # Appliquer la symbologie
-        self._apply_symbology(vl)
+        Args:
+            source_layer: Couche source contenant les lignes à segmenter
+            lengths: Longueurs des segments par niveau (défaut : segment_length x 1, 10, 100)
+            progress_callback: Callback de progression (value, maximum) (optionnel)
+            
+        Returns:
+            Liste des couches, du niveau le plus fin au plus grossier
+        """
+        lengths = sorted(lengths or [self.segment_length * factor
+                                     for factor in self.PYRAMID_FACTORS])
+        names = [f"{source_layer.name()}_segments_{length:g}m" for length in lengths]
+        layers = self._create_segment_layers(source_layer, lengths, names, progress_callback)
         
-        return vl
+        # Limite entre deux niveaux : échelle proportionnelle à la longueur du niveau suivant
+        limits = [0.0] + [length * self.SCALE_PER_METER for length in lengths[1:]] + [0.0]
+        for i, layer in enumerate(layers):
+            layer.setScaleBasedVisibility(True)
+            layer.setMaximumScale(limits[i])       # vue la plus rapprochée
+            layer.setMinimumScale(limits[i + 1])   # vue la plus éloignée (0 = sans limite)
+        return layers
 
-    def _process_feature(self, feature: QgsFeature) -> List[QgsFeature]:
-        """Traite une entité et retourne les segments résultants"""
-        geom = feature.geometry()
-        segments = []
+    def _create_segment_layers(self, source_layer: QgsVectorLayer, lengths: List[float],
+                               names: List[str],
+                               progress_callback: Callable = None) -> List[QgsVectorLayer]:
+        """
+        Découpe la couche source en segments pour une ou plusieurs longueurs
+        
+        Args:
+            source_layer: Couche source contenant les lignes à segmenter
+            lengths: Longueur des segments de chaque couche
+            names: Nom de chaque couche
+            progress_callback: Callback de progression (value, maximum) (optionnel)
+            
+        Returns:
+            Liste des couches de segments, dans l'ordre de lengths
+        """
+        fields = QgsFields()
+        fields.append(QgsField("z_avg", QMetaType.Double))
+        fields.append(QgsField("length", QMetaType.Double))
+        fields.append(QgsField("color_idx", QMetaType.Int))
         
-        # Traiter les géométries Multi vs Simple en récupérant les points en 3D
-        if geom.isMultipart():
-            multi_geom = geom.constGet()
-            for i in range(multi_geom.numGeometries()):
-                part = multi_geom.geometryN(i)
-                line_z = []
-                for j in range(part.numPoints()):
-                    pt = part.pointN(j)
-                    line_z.append(QgsPoint(pt.x(), pt.y(), pt.z()))
-                g = QgsGeometry.fromPolyline(line_z)
-                segments.extend(self._create_segments(g))
+        # Utiliser MultiLineStringZ pour supporter à la fois les lignes simples et multiples avec Z
+        writers = [
+            LayerWriter(name, fields, QgsWkbTypes.MultiLineStringZ, source_layer.crs(),
+                        self._output_path(f"{length:g}m" if len(lengths) > 1 else None),
+                        self.batch_size)
+            for name, length in zip(names, lengths)
+        ]
+
+        # Traiter toutes les entités, une seule lecture des coordonnées pour tous les niveaux
+        color_table = self.get_color_table()
+        used_colors = [set() for _ in writers]
+        z_avgs = [[] for _ in writers]
+        geometry_hash = hashlib.blake2b(digest_size=16)
+        if self.workers > 1:
+            results = self._segment_parallel(source_layer, lengths, color_table,
+                                             geometry_hash, progress_callback)
         else:
-            single_geom = geom.constGet()
-            line_z = []
-            for i in range(single_geom.numPoints()):
-                pt = single_geom.pointN(i)
-                line_z.append(QgsPoint(pt.x(), pt.y(), pt.z()))
-            g = QgsGeometry.fromPolyline(line_z)
-            segments.extend(self._create_segments(g))
+            results = self._segment_serial(source_layer, lengths, color_table,
+                                           geometry_hash, progress_callback)
+        for level_results in results:
+            for level, (segments, z_avg, color_indices) in enumerate(level_results):
+                writers[level].add(segments)
+                z_avgs[level].append(z_avg)
+                used_colors[level].update(np.unique(color_indices).tolist())
             
-        return segments
+        # Terminer l'écriture et appliquer la symbologie à partir des couleurs relevées
+        layers = []
+        for writer, length, level_z, level_colors in zip(writers, lengths, z_avgs, used_colors):
+            vl = writer.finish()
+            self._apply_symbology(vl, color_table, level_colors)
+            layers.append(vl)
+            
+            # Conserver le découpage pour recolorer la couche sans la recalculer
+            fids = writer.fids()
+            if fids is None:
+                continue
+            self._segmentation_cache[(source_layer.id(), length)] = {
+                "geometry_hash": geometry_hash.digest(),
+                "layer_id": vl.id(),
+                "output_path": self.output_path,
+                "fids": fids,
+                "z_avg": np.concatenate(level_z) if level_z else np.empty(0),
+            }
+        
+        return layers
 
-    def _create_segments(self, geometry: QgsGeometry) -> List[QgsFeature]:
-        """Crée les segments à partir d'une géométrie"""
-        segments = []
-        for seg_pts, avg_z, length, color in self._split_line_3d(geometry):
-            feat = QgsFeature()
-            feat.setGeometry(QgsGeometry.fromPolyline(seg_pts))
-            feat.setAttributes([avg_z, length, color])
-            segments.append(feat)
-        return segments
+    def _output_path(self, suffix: str = None) -> str:
+        """
+        Fichier de sortie d'une couche (None = couche mémoire)
+        
+        Les couches d'une pyramide, écrites simultanément, ont chacune leur
+        fichier (suffixe ajouté au nom du fichier choisi).
+        """
+        if self.output_path is None or suffix is None:
+            return self.output_path
+        root, extension = os.path.splitext(self.output_path)
+        return f"{root}_{suffix}{extension}"
 
-    def _split_line_3d(self, geometry: QgsGeometry) -> List[Tuple[List[QgsPoint], float, float, str]]:
-        """Découpe une ligne 3D en segments de longueur fixe"""
-        vertices = list(geometry.vertices())
-        segments = []
+    def _segment_serial(self, source_layer: QgsVectorLayer, lengths: List[float],
+                        color_table: ColorTable, geometry_hash,
+                        progress_callback: Callable = None):
+        """
+        Découpe les entités une à une
         
-        if len(vertices) < 2:
-            return segments
+        Yields:
+            Pour chaque entité, liste par longueur de (segments, z_avg, color_idx)
+        """
+        if progress_callback:
+            progress_callback(0, source_layer.featureCount())
+        for i, feature in enumerate(source_layer.getFeatures()):
+            if progress_callback:
+                progress_callback(i, None)
+            geometry_hash.update(bytes(feature.geometry().asWkb()))
+            if feature.geometry().isEmpty():
+                continue
+            coords, offsets = geometry_to_arrays(feature.geometry())
+            yield [self._process_feature(coords, offsets, length, color_table)
+                   for length in lengths]
 
-        current_points = [vertices[0]]
-        dist_acc = 0
+    def _segment_parallel(self, source_layer: QgsVectorLayer, lengths: List[float],
+                          color_table: ColorTable, geometry_hash,
+                          progress_callback: Callable = None):
+        """
+        Découpe les entités par lots dans un pool de processus
         
-        for i in range(1, len(vertices)):
-            p_prev, p_curr = vertices[i-1], vertices[i]
-            d = self._distance_3d(p_prev, p_curr)
-            vec = QgsPoint(
-                p_curr.x() - p_prev.x(),
-                p_curr.y() - p_prev.y(),
-                p_curr.z() - p_prev.z()
-            )
-            
-            # Créer des segments de longueur fixe
-            while dist_acc + d >= self.segment_length:
-                t = (self.segment_length - dist_acc) / d
-                new_pt = QgsPoint(
-                    p_prev.x() + t * vec.x(),
-                    p_prev.y() + t * vec.y(),
-                    p_prev.z() + t * vec.z()
-                )
-                
-                current_points.append(new_pt)
-                avg_z = sum(v.z() for v in current_points) / len(current_points)
-                length = sum(self._distance_3d(current_points[j], current_points[j+1])
-                           for j in range(len(current_points)-1))
-                           
-                color = self._interpolate_color(avg_z)
-                segments.append((current_points.copy(), avg_z, length, color))
-                
-                current_points = [new_pt]
-                p_prev = new_pt
-                d = self._distance_3d(p_prev, p_curr)
-                vec = QgsPoint(
-                    p_curr.x() - p_prev.x(),
-                    p_curr.y() - p_prev.y(),
-                    p_curr.z() - p_prev.z()
-                )
-                dist_acc = 0
-                
-            current_points.append(p_curr)
-            dist_acc += d
-
-        # Traiter le dernier segment
-        if len(current_points) > 1:
-            avg_z = sum(v.z() for v in current_points) / len(current_points)
-            length = sum(self._distance_3d(current_points[j], current_points[j+1])
-                        for j in range(len(current_points)-1))
-            color = self._interpolate_color(avg_z)
-            segments.append((current_points, avg_z, length, color))
-            
-        return segments
+        Les coordonnées sont lues ici, puis chaque lot d'entités est découpé
+        et coloré dans un processus ; les entités segments sont créées à la
+        réception des lots, dans l'ordre des entités. Le résultat est
+        identique à celui du découpage en série.
+        
+        Yields:
+            Pour chaque lot, liste par longueur de (segments, z_avg, color_idx)
+        """
+        # Lecture des coordonnées de toutes les entités
+        coords, part_offsets, feature_parts = [], [0], [0]
+        if progress_callback:
+            progress_callback(0, source_layer.featureCount())
+        for i, feature in enumerate(source_layer.getFeatures()):
+            if progress_callback:
+                progress_callback(i, None)
+            geometry_hash.update(bytes(feature.geometry().asWkb()))
+            if feature.geometry().isEmpty():
+                continue
+            feature_coords, offsets = geometry_to_arrays(feature.geometry())
+            coords.append(feature_coords)
+            part_offsets.extend(offsets[1:] + part_offsets[-1])
+            feature_parts.append(len(part_offsets) - 1)
+        if not coords:
+            return
+        coords = np.concatenate(coords)
+        part_offsets = np.array(part_offsets, dtype=np.int64)
+        feature_parts = np.array(feature_parts, dtype=np.int64)
+        
+        # Lots d'entités de nombres de sommets comparables, de l'ordre d'un lot d'écriture
+        num_chunks = max(self.workers * 4, part_offsets[-1] // self.batch_size)
+        chunks = chunk_bounds(part_offsets[feature_parts], num_chunks)
+        if progress_callback:
+            progress_callback(0, len(chunks))
+        
+        done = 0
+        with create_process_pool(self.workers) as pool:
+            pending = deque()
+            try:
+                for start, end in chunks:
+                    first_part, last_part = feature_parts[start], feature_parts[end]
+                    first, last = part_offsets[first_part], part_offsets[last_part]
+                    pending.append(pool.submit(
+                        segment_features, coords[first:last],
+                        part_offsets[first_part:last_part + 1] - first,
+                        feature_parts[start:end + 1] - first_part, lengths, color_table
+                    ))
+                    # Limiter le nombre de lots en attente de création des entités
+                    if len(pending) >= self.workers * 2:
+                        yield self._chunk_segments(pending.popleft().result())
+                        done += 1
+                        if progress_callback:
+                            progress_callback(done, None)
+                while pending:
+                    yield self._chunk_segments(pending.popleft().result())
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, None)
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
 
-    def _distance_3d(self, p1: QgsPoint, p2: QgsPoint) -> float:
-        """Calcule la distance 3D entre deux points"""
-        return math.sqrt(
-            (p2.x() - p1.x()) ** 2 +
-            (p2.y() - p1.y()) ** 2 +
-            (p2.z() - p1.z()) ** 2
-        )
+    def _chunk_segments(self, level_results: list) -> list:
+        """Crée les entités segments d'un lot renvoyé par segment_features"""
+        return [(self._create_segments(points, seg_offsets, z_avg, length, color_indices),
+                 z_avg, color_indices)
+                for points, seg_offsets, z_avg, length, color_indices in level_results]
 
-    def _interpolate_color(self, z: float) -> str:
+    def cached_segmentation(self, source_layer: QgsVectorLayer, segment_length: float,
+                            verify: bool = True) -> Dict[str, Any]:
         """
-        Interpole la couleur en fonction de l'altitude
+        Retourne le découpage déjà calculé d'une couche s'il est toujours valide
         
         Args:
-            z: Altitude en mètres
+            source_layer: Couche source
+            segment_length: Longueur des segments
+            verify: Vérifier que les géométries sources n'ont pas changé
             
         Returns:
-            Code couleur au format hexadécimal (#RRGGBB)
+            Dictionnaire (layer, output_path, fids, z_avg...) ou None si le découpage doit être refait
+        """
+        entry = self._segmentation_cache.get((source_layer.id(), segment_length))
+        if entry is None:
+            return None
+        
+        # La couche de segments doit toujours être dans le projet
+        layer = QgsProject.instance().mapLayer(entry["layer_id"])
+        if layer is None:
+            del self._segmentation_cache[(source_layer.id(), segment_length)]
+            return None
+        
+        if verify:
+            geometry_hash = hashlib.blake2b(digest_size=16)
+            request = QgsFeatureRequest().setNoAttributes()
+            for feature in source_layer.getFeatures(request):
+                geometry_hash.update(bytes(feature.geometry().asWkb()))
+            if geometry_hash.digest() != entry["geometry_hash"]:
+                del self._segmentation_cache[(source_layer.id(), segment_length)]
+                return None
+        return dict(entry, layer=layer)
+
+    def recolor_segments(self, entry: Dict[str, Any], color_table: ColorTable = None) -> None:
         """
-        if z >= self.color_stops[-1].altitude:
-            r, g, b = self.color_stops[-1].color
-            return f"#{r:02x}{g:02x}{b:02x}"
+        Recalcule uniquement les couleurs d'une couche de segments existante
         
-        elif z <= self.color_stops[0].altitude:
-            r, g, b = 0, 0 ,0
-            return f"#{r:02x}{g:02x}{b:02x}"
+        Les indices de couleur de tous les segments sont calculés en un appel
+        puis écrits en un seul lot ; la géométrie n'est pas touchée.
+        
+        Args:
+            entry: Découpage renvoyé par cached_segmentation
+            color_table: Table de couleurs (défaut : get_color_table())
+        """
+        color_table = color_table or self.get_color_table()
+        layer = entry["layer"]
+        color_indices = color_table.indices(entry["z_avg"])
+        field = layer.fields().indexFromName("color_idx")
+        changes = {int(fid): {field: int(idx)} for fid, idx in zip(entry["fids"], color_indices)}
+        if not layer.dataProvider().changeAttributeValues(changes):
+            raise RuntimeError("Échec de la mise à jour des couleurs")
+        self._apply_symbology(layer, color_table, set(np.unique(color_indices).tolist()))
 
-        for i in range(len(self.color_stops) - 1):
-            stop1, stop2 = self.color_stops[i], self.color_stops[i + 1]
+    def _create_track_layer(self, source_layer: QgsVectorLayer, name: str = None,
+                            progress_callback: Callable = None) -> QgsVectorLayer:
+        """
+        Crée une couche avec une entité par trace, l'altitude étant recopiée en M
+        
+        La couleur est calculée au rendu, partie par partie le long de la
+        ligne, par un dégradé appliqué aux valeurs M (voir _apply_track_symbology).
+        
+        Args:
+            source_layer: Couche source contenant les traces
+            name: Nom de la nouvelle couche (optionnel)
+            progress_callback: Callback de progression (value, maximum) (optionnel)
             
-            if stop1.altitude <= z <= stop2.altitude:
-                t = (z - stop1.altitude) / (stop2.altitude - stop1.altitude)
-                r = int(stop1.color[0] + t * (stop2.color[0] - stop1.color[0]))
-                g = int(stop1.color[1] + t * (stop2.color[1] - stop1.color[1]))
-                b = int(stop1.color[2] + t * (stop2.color[2] - stop1.color[2]))
-                return f"#{r:02x}{g:02x}{b:02x}"
-
-        # Par défaut, retourner la première couleur
-        r, g, b = self.color_stops[0].color
-        return f"#{r:02x}{g:02x}{b:02x}"
-
-    def _apply_symbology(self, layer: QgsVectorLayer) -> None:
-        """Applique la symbologie catégorisée par couleur"""
-        categories = []
+        Returns:
+            Nouvelle couche vectorielle MultiLineStringZM
+        """
+        name = name or f"{source_layer.name()}_trace_altitude"
+        fields = QgsFields()
+        fields.append(QgsField("z_avg", QMetaType.Double))
+        fields.append(QgsField("z_min", QMetaType.Double))
+        fields.append(QgsField("length", QMetaType.Double))
+        writer = LayerWriter(name, fields, QgsWkbTypes.MultiLineStringZM, source_layer.crs(),
+                             self.output_path, self.batch_size)
+
+        if progress_callback:
+            progress_callback(0, source_layer.featureCount())
+        for i, feature in enumerate(source_layer.getFeatures()):
+            if progress_callback:
+                progress_callback(i, None)
+            geom = feature.geometry()
+            if geom.isEmpty():
+                continue
+            coords, offsets = geometry_to_arrays(geom)
+            
+            # Longueur 3D sans compter les sauts entre parties
+            steps = np.linalg.norm(np.diff(coords, axis=0), axis=1)
+            steps[offsets[1:-1] - 1] = 0.0
+            
+            track = QgsFeature()
+            track.setGeometry(arrays_to_geometry(coords, offsets, multi=True, m=coords[:, 2]))
+            track.setAttributes([float(coords[:, 2].mean()), float(coords[:, 2].min()),
+                                 float(steps.sum())])
+            writer.add([track])
+        
+        vl = writer.finish()
+        self._apply_track_symbology(vl, self.get_color_table())
+        return vl
+
+    def get_color_table(self) -> ColorTable:
+        """Table de couleurs utilisée pour colorer les segments"""
+        return self.color_table or ColorTable.from_color_stops(self.color_stops)
+
+    def _process_feature(self, coords: np.ndarray, offsets: np.ndarray, segment_length: float,
+                         color_table: ColorTable) -> Tuple[List[QgsFeature], np.ndarray, np.ndarray]:
+        """
+        Découpe les coordonnées d'une entité
         
-        # Créer une catégorie pour chaque couleur unique
-        unique_colors = set()
-        for feature in layer.getFeatures():
-            color = feature["color"]
-            if color not in unique_colors:
-                unique_colors.add(color)
-                sym = QgsSymbol.defaultSymbol(layer.geometryType())
-                sym.setColor(QColor(color))
-                # Épaissir le trait à 1.25
-                sym.setWidth(1.25)
-                cat = QgsRendererCategory(color, sym, color)
-                categories.append(cat)
+        Returns:
+            Segments créés, altitude moyenne et indice de couleur de chaque segment
+        """
+        # Découper toutes les parties (géométrie simple ou multiple) en une passe
+        points, seg_offsets, z_avg, lengths, _ = split_lines_3d(coords, offsets, segment_length)
+        color_indices = color_table.indices(z_avg)
+        segments = self._create_segments(points, seg_offsets, z_avg, lengths, color_indices)
+        return segments, z_avg, color_indices
+
+    def _create_segments(self, points: np.ndarray, seg_offsets: np.ndarray,
+                         z_avg: np.ndarray, lengths: np.ndarray,
+                         color_indices: np.ndarray) -> List[QgsFeature]:
+        """Crée les entités segments à partir des tableaux de split_lines_3d"""
+        segments = []
+        for start, end, avg_z, length, color_idx in zip(seg_offsets[:-1], seg_offsets[1:],
+                                                        z_avg, lengths, color_indices):
+            feat = QgsFeature()
+            feat.setGeometry(arrays_to_geometry(points[start:end], multi=True))
+            feat.setAttributes([float(avg_z), float(length), int(color_idx)])
+            segments.append(feat)
+        return segments
+
+    def _apply_symbology(self, layer: QgsVectorLayer, color_table: ColorTable,
+                         used_colors: set) -> None:
+        """
+        Applique la symbologie catégorisée par indice de couleur
+        
+        Une catégorie est créée par indice de palette utilisé : leur nombre
+        est borné par la taille de la palette, quel que soit le nombre
+        d'altitudes différentes.
+        """
+        categories = []
+        for color_idx in sorted(used_colors):
+            sym = QgsSymbol.defaultSymbol(layer.geometryType())
+            sym.setColor(QColor(color_table.hex_color(color_idx)))
+            # Épaissir le trait à 1.25
+            sym.setWidth(1.25)
+            categories.append(QgsRendererCategory(color_idx, sym, color_table.class_label(color_idx)))
 
         # Appliquer le rendu
-        renderer = QgsCategorizedSymbolRenderer("color", categories)
+        renderer = QgsCategorizedSymbolRenderer("color_idx", categories)
         layer.setRenderer(renderer)
-        layer.triggerRepaint()
\ No newline at end of file
+        layer.triggerRepaint()
+
+    def _apply_track_symbology(self, layer: QgsVectorLayer, color_table: ColorTable) -> None:
+        """
+        Applique un dégradé évalué le long des traces à partir des valeurs M
+        
+        Un générateur de géométrie découpe chaque trace en segments au rendu ;
+        la couleur de chaque segment est lue sur le dégradé de la table de
+        couleurs. Les altitudes sous le début du dégradé prennent sa première
+        couleur.
+        """
+        level_colors = [QColor(*map(int, rgb)) for rgb in color_table.colors[1:color_table.levels + 1]]
+        last = len(level_colors) - 1
+        ramp = QgsGradientColorRamp(
+            level_colors[0], level_colors[-1], False,
+            [QgsGradientStop(i / last, color) for i, color in enumerate(level_colors[1:-1], 1)]
+        )
+        
+        color_property = QgsProperty.fromExpression(self.TRACK_COLOR_EXPRESSION)
+        color_property.setTransformer(QgsColorRampTransformer(
+            color_table.zmin, color_table.zmax, ramp,
+            QColor(*map(int, color_table.colors[-1]))
+        ))
+        
+        sub_symbol = QgsSymbol.defaultSymbol(QgsWkbTypes.LineGeometry)
+        # Épaissir le trait à 1.25
+        sub_symbol.setWidth(1.25)
+        sub_symbol.symbolLayer(0).setDataDefinedProperty(QgsSymbolLayer.PropertyStrokeColor,
+                                                         color_property)
+        
+        generator = QgsGeometryGeneratorSymbolLayer.create({
+            "geometryModifier": "segments_to_lines($geometry)",
+            "SymbolType": "Line"
+        })
+        generator.setSubSymbol(sub_symbol)
+        
+        layer.setRenderer(QgsSingleSymbolRenderer(QgsLineSymbol([generator])))
+        layer.triggerRepaint()
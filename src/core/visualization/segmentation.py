@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Découpage vectorisé de lignes 3D en segments de longueur fixe
+
+Ce module ne dépend que de NumPy afin de pouvoir être utilisé aussi bien
+dans QGIS que dans des processus de calcul séparés.
+"""
+
+import numpy as np
+
+
+def split_lines_3d(coords, offsets, segment_length):
+    """
+    Découpe des lignes 3D en segments de longueur (3D) fixe
+
+    Les points de coupe sont placés par searchsorted sur la distance 3D
+    cumulée de chaque ligne ; chaque segment contient son point de départ,
+    les sommets d'origine qu'il traverse et son point d'arrivée. Le dernier
+    segment d'une ligne reçoit le reste de la longueur. Une ligne sans Z
+    forme un seul segment, d'altitude moyenne et de longueur NaN.
+
+    Args:
+        coords: Coordonnées des sommets (N, 3)
+        offsets: Indices de début de chaque ligne suivis de N
+        segment_length: Longueur des segments
+
+    Returns:
+        tuple: (points (M, 3), seg_offsets (S + 1,), z_avg (S,), length (S,),
+        line (S,)) où line est l'indice de la ligne d'origine de chaque segment
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_lines = len(offsets) - 1
+    starts, ends = offsets[:-1], offsets[1:]
+    counts = ends - starts
+
+    # Distance 3D cumulée, remise à zéro au début de chaque ligne
+    steps = np.zeros(len(coords))
+    if len(coords) > 1:
+        steps[1:] = np.linalg.norm(coords[1:] - coords[:-1], axis=1)
+    steps[starts[counts > 0]] = 0.0
+    line_of_vertex = np.repeat(np.arange(num_lines), counts)
+
+    # Lignes sans Z (2D ou Z manquant) : un seul segment d'altitude et de longueur
+    # inconnues ; le rang des sommets tient lieu de distance
+    unknown = np.zeros(num_lines, dtype=bool)
+    unknown[line_of_vertex[~np.isfinite(steps)]] = True
+    unknown_vertex = unknown[line_of_vertex]
+    steps[unknown_vertex] = 1.0
+    steps[starts[counts > 0]] = 0.0
+
+    cumulative = np.cumsum(steps)
+    cumulative -= np.repeat(cumulative[starts[counts > 0]], counts[counts > 0])
+    total = np.zeros(num_lines)
+    total[counts > 0] = cumulative[ends[counts > 0] - 1]
+
+    num_segments = np.where(counts >= 2, np.ceil(total / segment_length), 0).astype(np.int64)
+    num_segments[unknown & (counts >= 2)] = 1
+    num_segments[total <= 0] = 0
+
+    # Bornes des segments : 0, L, 2L... puis la longueur totale
+    num_bounds = np.where(num_segments > 0, num_segments + 1, 0)
+    bound_line = np.repeat(np.arange(num_lines), num_bounds)
+    bound_rank = np.arange(bound_line.size) - np.repeat(np.cumsum(num_bounds) - num_bounds, num_bounds)
+    bound_pos = np.minimum(bound_rank * segment_length, total[bound_line])
+
+    # Clé croissante sur toutes les lignes : distance + décalage propre à chaque ligne
+    base = np.cumsum(total + 1.0) - (total + 1.0)
+    vertex_key = cumulative + base[line_of_vertex]
+    bound_key = bound_pos + base[bound_line]
+
+    # Point de coupe interpolé sur le segment d'origine qui le contient
+    first = starts[bound_line]
+    index = np.searchsorted(vertex_key, bound_key, side="right") - 1
+    index = np.clip(index, first, ends[bound_line] - 2)
+    span = cumulative[index + 1] - cumulative[index]
+    t = np.divide(bound_pos - cumulative[index], span, out=np.zeros_like(span), where=span > 0)
+    bound_points = coords[index] + t[:, None] * (coords[index + 1] - coords[index])
+
+    # Sommets d'origine situés strictement à l'intérieur d'un segment
+    interior = np.ones(len(coords), dtype=bool)
+    interior[starts[counts > 0]] = False
+    interior[ends[counts > 0] - 1] = False
+    interior &= np.repeat(num_segments > 0, counts)
+    interior &= ~np.isin(vertex_key, bound_key)
+    interior = np.flatnonzero(interior)
+
+    # Fusion des bornes et des sommets dans l'ordre de la distance
+    keys = np.concatenate((bound_key, vertex_key[interior]))
+    order = np.argsort(keys, kind="stable")
+    points = np.concatenate((bound_points, coords[interior]))[order]
+
+    # Les bornes intérieures terminent un segment et commencent le suivant
+    repeats = np.ones(len(keys), dtype=np.int64)
+    inner = (bound_rank > 0) & (bound_rank < num_segments[bound_line])
+    repeats[:len(bound_key)][inner] = 2
+    repeats = repeats[order]
+    points = np.repeat(points, repeats, axis=0)
+
+    # Chaque borne sauf la dernière d'une ligne ouvre un segment (sa dernière copie)
+    is_bound = order < len(bound_key)
+    bound_order = order[is_bound]
+    opens = bound_rank[bound_order] < num_segments[bound_line[bound_order]]
+    seg_starts = (np.cumsum(repeats) - 1)[is_bound][opens]
+    seg_offsets = np.append(seg_starts, len(points)).astype(np.int64)
+    line = bound_line[bound_order][opens]
+
+    seg_counts = np.diff(seg_offsets)
+    if seg_counts.size == 0:
+        empty = np.empty(0)
+        return points, seg_offsets, empty, empty, line
+
+    z_avg = np.add.reduceat(points[:, 2], seg_offsets[:-1]) / seg_counts
+    # Les bornes dupliquées ont une distance nulle : somme directe par segment
+    point_steps = np.zeros(len(points))
+    point_steps[:-1] = np.linalg.norm(points[1:] - points[:-1], axis=1)
+    point_steps[seg_offsets[1:] - 1] = 0.0
+    length = np.add.reduceat(point_steps, seg_offsets[:-1])
+    return points, seg_offsets, z_avg, length, line
+
+
+def segment_features(coords, part_offsets, feature_parts, lengths, color_table):
+    """
+    Découpe un lot d'entités pour plusieurs longueurs (processus de calcul)
+
+    Chaque entité est découpée séparément par split_lines_3d, comme dans le
+    traitement en série, puis les résultats du lot sont concaténés.
+
+    Args:
+        coords: Coordonnées des sommets du lot (N, 3)
+        part_offsets: Indices de début de chaque partie suivis de N
+        feature_parts: Indice de la première partie de chaque entité suivi
+            du nombre de parties
+        lengths: Longueurs des segments, une par niveau
+        color_table: ColorTable utilisée pour les indices de couleur
+
+    Returns:
+        list: Pour chaque longueur, (points, seg_offsets, z_avg, length,
+        color_idx) des segments de toutes les entités, dans leur ordre
+    """
+    results = []
+    for segment_length in lengths:
+        points, starts, z_avg, length = [], [], [], []
+        num_points = 0
+        for start, end in zip(feature_parts[:-1], feature_parts[1:]):
+            first, last = part_offsets[start], part_offsets[end]
+            feature_points, seg_offsets, feature_z, feature_length, _ = split_lines_3d(
+                coords[first:last], part_offsets[start:end + 1] - first, segment_length
+            )
+            points.append(feature_points)
+            starts.append(seg_offsets[:-1] + num_points)
+            z_avg.append(feature_z)
+            length.append(feature_length)
+            num_points += len(feature_points)
+
+        seg_offsets = np.append(np.concatenate(starts), num_points).astype(np.int64)
+        z_avg = np.concatenate(z_avg)
+        results.append((np.concatenate(points).reshape(-1, 3), seg_offsets, z_avg,
+                        np.concatenate(length), color_table.indices(z_avg)))
+    return results
@@ -17,7 +17,7 @@ class AltitudeCheckDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Détecter segments sous altitude minimale")
-        self.setFixedSize(450, 250)
+        self.setFixedSize(450, 300)
         self.init_ui()
         
     def init_ui(self):
@@ -55,6 +55,14 @@ class AltitudeCheckDialog(QDialog):
         buffer_layout.addWidget(self.buffer_spin)
         layout.addLayout(buffer_layout)
         
+        # Détection seule : couche des groupes, captures générées plus tard
+        self.detection_only_check = QCheckBox("Détection seule (couche des groupes, sans captures)")
+        self.detection_only_check.setChecked(False)
+        self.detection_only_check.setToolTip(
+            "Analyser ensuite la couche des groupes pour capturer ses groupes sélectionnés (ou tous)"
+        )
+        layout.addWidget(self.detection_only_check)
+        
         # Sélection du dossier de sortie
         layout.addWidget(QLabel("Dossier de sortie pour les captures:"))
         output_layout = QHBoxLayout()
@@ -4,17 +4,18 @@ Interface utilisateur du plugin d'altitude relative
 """
 
 from qgis.PyQt.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton,
-                                QLabel, QComboBox, QProgressBar, QCheckBox)
-from qgis.gui import QgsMapLayerComboBox, QgsProjectionSelectionWidget
-from qgis.core import QgsMapLayerProxyModel, QgsCoordinateReferenceSystem
+                                QLabel, QComboBox, QCheckBox, QSpinBox, QDoubleSpinBox)
+from qgis.gui import QgsMapLayerComboBox, QgsProjectionSelectionWidget, QgsFileWidget
+from qgis.core import QgsMapLayerProxyModel, QgsCoordinateReferenceSystem, QgsProject
 from qgis.PyQt.QtCore import QVariant
+import os
 
 
 class AltitudeRelativeDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Calcul d'altitude relative")
-        self.setFixedSize(400, 350)
+        self.setFixedSize(400, 645)
         self.init_ui()
         
     def init_ui(self):
@@ -26,6 +27,12 @@ class AltitudeRelativeDialog(QDialog):
         self.mnt_combo.setFilters(QgsMapLayerProxyModel.RasterLayer)
         layout.addWidget(self.mnt_combo)
         
+        # Ou dossier de tuiles MNT (prioritaire sur la couche)
+        layout.addWidget(QLabel("Ou dossier de tuiles MNT (optionnel):"))
+        self.mnt_folder_widget = QgsFileWidget()
+        self.mnt_folder_widget.setStorageMode(QgsFileWidget.GetDirectory)
+        layout.addWidget(self.mnt_folder_widget)
+        
         # Sélection de la couche polyligne
         layout.addWidget(QLabel("Sélectionnez la couche polyligne:"))
         self.polyline_combo = QgsMapLayerComboBox()
@@ -38,6 +45,64 @@ class AltitudeRelativeDialog(QDialog):
         self.altitude_field_combo.addItem("(Utiliser coordonnée Z de la géométrie)", "")
         layout.addWidget(self.altitude_field_combo)
         
+        # Méthode d'échantillonnage du MNT
+        layout.addWidget(QLabel("Échantillonnage du MNT:"))
+        self.sampling_method_combo = QComboBox()
+        self.sampling_method_combo.addItem("Plus proche voisin", "nearest")
+        self.sampling_method_combo.addItem("Bilinéaire", "bilinear")
+        layout.addWidget(self.sampling_method_combo)
+        
+        # Hauteur au-dessus du sol entre les sommets
+        self.profile_clearance_check = QCheckBox("Profil densifié (altitude minimale réelle)")
+        self.profile_clearance_check.setChecked(False)
+        layout.addWidget(self.profile_clearance_check)
+        
+        # Couloir latéral : hauteur au-dessus du point le plus haut autour de la trace
+        corridor_layout = QHBoxLayout()
+        corridor_layout.addWidget(QLabel("Couloir latéral (m, 0 = désactivé):"))
+        self.corridor_radius_spin = QDoubleSpinBox()
+        self.corridor_radius_spin.setRange(0.0, 5000.0)
+        self.corridor_radius_spin.setSingleStep(50.0)
+        self.corridor_radius_spin.setValue(0.0)
+        self.corridor_radius_spin.setToolTip(
+            "Limité à 256 pixels du MNT (ex. 256 m pour un MNT à 1 m)"
+        )
+        corridor_layout.addWidget(self.corridor_radius_spin)
+        layout.addLayout(corridor_layout)
+        
+        # Seuil d'altitude minimale évalué sur une pyramide min/max du MNT
+        threshold_layout = QHBoxLayout()
+        threshold_layout.addWidget(QLabel("Seuil d'altitude minimale (m, 0 = désactivé):"))
+        self.threshold_spin = QDoubleSpinBox()
+        self.threshold_spin.setRange(0.0, 10000.0)
+        self.threshold_spin.setSingleStep(50.0)
+        self.threshold_spin.setValue(0.0)
+        threshold_layout.addWidget(self.threshold_spin)
+        layout.addLayout(threshold_layout)
+        
+        # Nombre de processus de calcul
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("Processus de calcul parallèles:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(1)
+        workers_layout.addWidget(self.workers_spin)
+        layout.addLayout(workers_layout)
+        
+        # Réutilisation des résultats des entités déjà calculées
+        self.use_cache_check = QCheckBox("Réutiliser les résultats déjà calculés (cache)")
+        self.use_cache_check.setChecked(False)
+        layout.addWidget(self.use_cache_check)
+        
+        # Enregistrement des altitudes du sol échantillonnées
+        self.store_terrain_check = QCheckBox("Enregistrer le terrain échantillonné (à côté du projet)")
+        self.store_terrain_check.setChecked(False)
+        layout.addWidget(self.store_terrain_check)
+        self.store_profiles_check = QCheckBox("Inclure les profils densifiés à la résolution du MNT")
+        self.store_profiles_check.setChecked(False)
+        self.store_profiles_check.setEnabled(False)
+        layout.addWidget(self.store_profiles_check)
+        
         # Option pour créer une nouvelle couche
         self.create_new_layer_check = QCheckBox("Créer une nouvelle couche")
         self.create_new_layer_check.setChecked(True)
@@ -51,11 +116,6 @@ class AltitudeRelativeDialog(QDialog):
         self.crs_selector.setCrs(lambert93)
         layout.addWidget(self.crs_selector)
         
-        # Barre de progression
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setVisible(False)
-        layout.addWidget(self.progress_bar)
-        
         # Boutons
         button_layout = QHBoxLayout()
         self.ok_button = QPushButton("OK")
@@ -70,6 +130,7 @@ class AltitudeRelativeDialog(QDialog):
         self.ok_button.clicked.connect(self.accept)
         self.cancel_button.clicked.connect(self.reject)
         self.polyline_combo.layerChanged.connect(self.update_altitude_fields)
+        self.store_terrain_check.toggled.connect(self.store_profiles_check.setEnabled)
         
         # Initialiser les champs
         self.update_altitude_fields()
@@ -86,4 +147,21 @@ class AltitudeRelativeDialog(QDialog):
             fields = layer.fields()
             for field in fields:
                 if field.type() in [QVariant.Double, QVariant.Int]:
-                    self.altitude_field_combo.addItem(field.name(), field.name())
\ No newline at end of file
+                    self.altitude_field_combo.addItem(field.name(), field.name())
+    
+    def get_mnt_source(self):
+        """Retourne le dossier de tuiles MNT s'il est renseigné, sinon la couche MNT"""
+        folder = self.mnt_folder_widget.filePath()
+        if folder and os.path.isdir(folder):
+            return folder
+        return self.mnt_combo.currentLayer()
+    
+    def get_terrain_store_path(self):
+        """Retourne le dossier de stockage du terrain échantillonné (None si désactivé)"""
+        layer = self.polyline_combo.currentLayer()
+        if not self.store_terrain_check.isChecked() or layer is None:
+            return None
+        return os.path.join(
+            QgsProject.instance().homePath() or os.path.expanduser("~"),
+            f"{layer.name()}_terrain"
+        )
\ No newline at end of file
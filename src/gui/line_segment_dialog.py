@@ -4,19 +4,27 @@ Widget de dialogue pour la visualisation des segments
 """
 
 from qgis.PyQt.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton,
-                                QLabel, QDoubleSpinBox, QCheckBox)
+                                QLabel, QDoubleSpinBox, QSpinBox, QCheckBox, QComboBox)
 from qgis.PyQt.QtGui import QColor
-from qgis.gui import QgsMapLayerComboBox, QgsColorRampButton
+from qgis.gui import QgsMapLayerComboBox, QgsColorRampButton, QgsFileWidget
 from qgis.core import QgsMapLayerProxyModel, QgsGradientColorRamp, QgsGradientStop, QgsProject, QgsMapLayer, QgsWkbTypes, QgsMessageLog, Qgis
+import os
 
 
 class LineSegmentDialog(QDialog):
     """Dialogue pour la configuration de la visualisation des segments"""
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, visualizer=None):
+        """
+        Args:
+            parent: Fenêtre parente
+            visualizer: LineSegmentVisualizer utilisé pour l'aperçu des couleurs (optionnel)
+        """
         super().__init__(parent)
+        self.visualizer = visualizer
+        self._preview_entry = None
         self.setWindowTitle("Visualisation des segments")
-        self.setFixedSize(400, 200)
+        self.setFixedSize(400, 370)
         self.init_ui()
         
     def init_ui(self):
@@ -36,6 +44,15 @@ class LineSegmentDialog(QDialog):
         layout.addWidget(self.layer_combo)
 
         
+        # Mode de sortie
+        mode_layout = QHBoxLayout()
+        mode_layout.addWidget(QLabel("Sortie:"))
+        self.output_mode_combo = QComboBox()
+        self.output_mode_combo.addItem("Segments de longueur fixe", "segments")
+        self.output_mode_combo.addItem("Une entité par trace (altitude en M)", "track")
+        mode_layout.addWidget(self.output_mode_combo)
+        layout.addLayout(mode_layout)
+        
         # Configuration de la longueur des segments
         length_layout = QHBoxLayout()
         length_layout.addWidget(QLabel("Longueur des segments (m):"))
@@ -46,30 +63,54 @@ class LineSegmentDialog(QDialog):
         length_layout.addWidget(self.length_spin)
         layout.addLayout(length_layout)
         
+        # Niveaux supplémentaires de segments plus longs, affichés selon l'échelle
+        self.pyramid_check = QCheckBox("Pyramide multi-échelle (longueur x1, x10, x100)")
+        self.pyramid_check.setChecked(False)
+        layout.addWidget(self.pyramid_check)
+        
+        # Nombre de processus de découpage
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("Processus de découpage parallèles:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(1)
+        workers_layout.addWidget(self.workers_spin)
+        layout.addLayout(workers_layout)
+        
         # Option pour créer une nouvelle couche
         self.create_new_layer_check = QCheckBox("Créer une nouvelle couche")
         self.create_new_layer_check.setChecked(True)
         layout.addWidget(self.create_new_layer_check)
         
+        # Fichier de sortie (vide = couche temporaire en mémoire)
+        layout.addWidget(QLabel("Fichier de sortie (optionnel, .gpkg ou .fgb):"))
+        self.output_file_widget = QgsFileWidget()
+        self.output_file_widget.setStorageMode(QgsFileWidget.SaveFile)
+        self.output_file_widget.setFilter("GeoPackage (*.gpkg);;FlatGeobuf (*.fgb)")
+        layout.addWidget(self.output_file_widget)
+        
         # Sélecteur de dégradé de couleurs
         layout.addWidget(QLabel("Configuration du dégradé de couleurs:"))
         
         color_layout = QHBoxLayout()
         self.color_ramp_button = QgsColorRampButton()
         
-        # Créer le dégradé par défaut
+        # Créer le dégradé par défaut : rouge à 0m (color1), vert à 1000m (color2)
         stops = [
-            QgsGradientStop(0.0, QColor(255, 0, 0)),      # rouge à 0m
             QgsGradientStop(0.5, QColor(255, 165, 0)),   # orange à 500m
             QgsGradientStop(0.8, QColor(255, 255, 0)),   # jaune à 800m
-            QgsGradientStop(1.0, QColor(0, 128, 0))      # vert à 1000m
         ]
-        ramp = QgsGradientColorRamp(stops=stops)
+        ramp = QgsGradientColorRamp(QColor(255, 0, 0), QColor(0, 128, 0), False, stops)
         self.color_ramp_button.setColorRamp(ramp)
         
         color_layout.addWidget(self.color_ramp_button)
         layout.addLayout(color_layout)
         
+        # Aperçu : recolorer la couche de segments déjà créée à chaque changement du dégradé
+        self.preview_check = QCheckBox("Aperçu en direct sur la couche existante")
+        self.preview_check.setChecked(False)
+        layout.addWidget(self.preview_check)
+        
         # Boutons
         button_layout = QHBoxLayout()
         self.ok_button = QPushButton("OK")
@@ -83,20 +124,90 @@ class LineSegmentDialog(QDialog):
         # Connexions
         self.ok_button.clicked.connect(self.accept)
         self.cancel_button.clicked.connect(self.reject)
+        self.output_mode_combo.currentIndexChanged.connect(
+            lambda: self.length_spin.setEnabled(self.output_mode_combo.currentData() == "segments")
+        )
+        self.output_mode_combo.currentIndexChanged.connect(
+            lambda: self.pyramid_check.setEnabled(self.output_mode_combo.currentData() == "segments")
+        )
+        self.output_mode_combo.currentIndexChanged.connect(
+            lambda: self.workers_spin.setEnabled(self.output_mode_combo.currentData() == "segments")
+        )
+        self.color_ramp_button.colorRampChanged.connect(self.update_preview)
+        self.preview_check.toggled.connect(self.update_preview)
+        # Le découpage en cache dépend de la couche et de la longueur
+        self.layer_combo.layerChanged.connect(self._reset_preview)
+        self.length_spin.valueChanged.connect(self._reset_preview)
+        
+    def _reset_preview(self):
+        """Oublie le découpage utilisé par l'aperçu"""
+        self._preview_entry = None
+        
+    def update_preview(self):
+        """Recolore la couche de segments existante avec le dégradé courant"""
+        if not self.preview_check.isChecked() or self.visualizer is None:
+            return
+        source_layer = self.layer_combo.currentLayer()
+        if source_layer is None:
+            return
+        
+        # Vérifier les géométries sources une seule fois par couche et longueur
+        if self._preview_entry is None:
+            self._preview_entry = self.visualizer.cached_segmentation(
+                source_layer, self.length_spin.value()
+            )
+            if self._preview_entry is None:
+                QgsMessageLog.logMessage(
+                    "Aperçu indisponible : aucune couche de segments à jour pour cette couche et cette longueur",
+                    level=Qgis.Info
+                )
+                self.preview_check.setChecked(False)
+                return
+        
+        table = self.get_color_table()
+        if table is not None:
+            self.visualizer.recolor_segments(self._preview_entry, table)
+        
+    def get_output_path(self):
+        """Retourne le fichier de sortie s'il est renseigné, sinon None (couche mémoire)"""
+        return self.output_file_widget.filePath() or None
         
     def get_color_stops(self):
-        """Retourne la liste des points de couleur configurés"""
+        """
+        Retourne les points de couleur du dégradé configuré (0-1000m)
+        
+        Les couleurs de début et de fin (color1, color2) sont ajoutées sauf si
+        un point se trouve déjà à 0 ou à 1 ; un dégradé qui n'est pas de type
+        QgsGradientColorRamp n'a pas de points.
+        """
         from ..core.visualization.line_segment_visualizer import ColorStop
         
         ramp = self.color_ramp_button.colorRamp()
-        if not ramp:
+        if not isinstance(ramp, QgsGradientColorRamp):
             return []
-            
-        stops = []
-        for stop in ramp.stops():
-            # Convertir la position relative (0-1) en altitude (0-1000m)
-            altitude = stop.offset * 1000
-            color = stop.color
-            stops.append(ColorStop(altitude, (color.red(), color.green(), color.blue())))
-            
-        return sorted(stops, key=lambda x: x.altitude)
\ No newline at end of file
+        
+        # Convertir les positions relatives (0-1) en altitudes (0-1000m)
+        stops = [(stop.offset, stop.color) for stop in ramp.stops()]
+        offsets = [offset for offset, _ in stops]
+        if 0.0 not in offsets:
+            stops.insert(0, (0.0, ramp.color1()))
+        if 1.0 not in offsets:
+            stops.append((1.0, ramp.color2()))
+        return sorted(
+            (ColorStop(offset * 1000, (color.red(), color.green(), color.blue()))
+             for offset, color in stops),
+            key=lambda x: x.altitude
+        )
+    
+    def get_color_table(self):
+        """
+        Retourne la table de couleurs du dégradé configuré (0-1000m)
+        
+        Le dégradé est échantillonné directement, quel que soit son type.
+        """
+        from ..core.visualization.color_table import ColorTable
+        
+        ramp = self.color_ramp_button.colorRamp()
+        if not ramp:
+            return None
+        return ColorTable.from_ramp(ramp, 0.0, 1000.0)
\ No newline at end of file
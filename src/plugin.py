@@ -3,11 +3,13 @@
 Plugin d'altitude relative pour QGIS
 """
 
+import copy
 import os
 from qgis.PyQt.QtGui import QIcon, QDesktopServices
-from qgis.PyQt.QtWidgets import QAction, QMessageBox, QPushButton, QVBoxLayout, QTextEdit, QDialog, QDialogButtonBox, QScrollArea, QWidget
-from qgis.PyQt.QtCore import QUrl
-from qgis.core import QgsProject, QgsMessageLog, Qgis
+from qgis.PyQt.QtWidgets import QAction, QMessageBox, QProgressBar, QPushButton, QVBoxLayout, QTextEdit, QDialog, QDialogButtonBox, QScrollArea, QWidget
+from qgis.PyQt.QtCore import QUrl, QTimer
+from qgis.PyQt import sip
+from qgis.core import QgsProject, QgsMessageLog, Qgis, QgsApplication
 
 from .gui.dialog import AltitudeRelativeDialog
 from .gui.line_segment_dialog import LineSegmentDialog
@@ -15,21 +17,25 @@ from .gui.altitude_check_dialog import AltitudeCheckDialog
 from .core.calculator import AltitudeCalculator
 from .core.visualization.line_segment_visualizer import LineSegmentVisualizer
 from .core.altitude_analyzer import AltitudeAnalyzer
+from .core.tasks import PluginTask, LayerSnapshot, RasterSnapshot, move_to_main_thread
 import os
 
 
 class AltitudeRelativePlugin:
     """Plugin principal"""
     
+    # Entités écrites par passage de la boucle d'événements (modification sur place)
+    IN_PLACE_BATCH_SIZE = 500
+    
     def __init__(self, iface):
         self.iface = iface
         self.plugin_dir = os.path.dirname(__file__)
-        self.calculator = AltitudeCalculator()
         self.visualizer = LineSegmentVisualizer()
         self.altitude_analyzer = AltitudeAnalyzer(iface)
         
         # Initialiser les variables
         self.actions = []
+        self.tasks = []
         self.menu = "Analyse Survol"
         self.toolbar = self.iface.addToolBar("Analyse Survol")
         self.toolbar.setObjectName("Analyse Survol")
@@ -91,6 +97,8 @@ class AltitudeRelativePlugin:
         
     def unload(self):
         """Nettoyer lors du déchargement du plugin"""
+        for task in list(self.tasks):
+            task.cancel()
         for action in self.actions:
             self.iface.removePluginVectorMenu(self.menu, action)
             self.iface.removeToolBarIcon(action)
@@ -104,22 +112,21 @@ class AltitudeRelativePlugin:
     def run_relative_altitude_computation(self):
         """Exécuter le calcul d'altitude relative"""
         dialog = AltitudeRelativeDialog(self.iface.mainWindow())
-        
-        # Vérifier qu'il y a des couches appropriées
-        if dialog.mnt_combo.currentLayer() is None:
-            self.iface.messageBar().pushMessage(
-                "Erreur", "Aucune couche raster (MNT) disponible", 
-                level=Qgis.Critical
-            )
-            return
             
         # Afficher le dialogue et traiter le résultat
         if dialog.exec_() == dialog.Accepted:
+            # Vérifier qu'un MNT est disponible (couche raster ou dossier de tuiles)
+            if dialog.get_mnt_source() is None:
+                self.iface.messageBar().pushMessage(
+                    "Erreur", "Aucune couche raster (MNT) ni dossier de tuiles disponible", 
+                    level=Qgis.Critical
+                )
+                return
             self.process_altitude_calculation(dialog)
             
     def run_visualization(self):
         """Exécuter la visualisation des segments colorés"""
-        dialog = LineSegmentDialog(self.iface.mainWindow())
+        dialog = LineSegmentDialog(self.iface.mainWindow(), self.visualizer)
         
         # Vérifier qu'il y a des couches appropriées
         if dialog.layer_combo.currentLayer() is None:
@@ -142,146 +149,398 @@ class AltitudeRelativePlugin:
             return
             
         if dialog.exec_() == dialog.Accepted:
-            try:
-                # Utiliser l'analyseur d'altitude dédié
-                low_segments = self.altitude_analyzer.analyze_segments(
-                    dialog.layer_combo.currentLayer(),
-                    dialog.min_altitude_spin.value(),
-                    dialog.buffer_spin.value(),
-                    dialog.get_output_folder()
-                )
-                
-                # Afficher les résultats
-                message = self.altitude_analyzer.format_results_message(
-                    low_segments, 
-                    dialog.min_altitude_spin.value(), 
-                    dialog.get_output_folder()
-                )
-                
-                info_dialog = QDialog(self.iface.mainWindow())
-                info_dialog.setWindowTitle("Analyse terminée")
-                info_dialog.resize(400, 300)
-
-                layout = QVBoxLayout()
-
-                # Message scrollable
-                text_edit = QTextEdit()
-                text_edit.setReadOnly(True)
-                text_edit.setText(message)
-                layout.addWidget(text_edit)
-
-                # Bouton "Ouvrir le dossier" pleine largeur
-                open_folder_button = QPushButton("Ouvrir le dossier")
-                open_folder_button.setMaximumWidth(16777215)  # Permet de s'étendre sur toute la largeur
-                open_folder_button.clicked.connect(lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(dialog.get_output_folder())))
-                layout.addWidget(open_folder_button)
-
-                # Bouton OK pour fermer
-                ok_button = QPushButton("OK")
-                ok_button.clicked.connect(info_dialog.accept)
-                layout.addWidget(ok_button)
-                info_dialog.setLayout(layout)
-                info_dialog.exec_()
-            except Exception as e:
-                self.iface.messageBar().pushMessage(
-                    "Erreur", f"Erreur lors de la détection: {str(e)}", level=Qgis.Critical)
-                QgsMessageLog.logMessage(f"Erreur détection segments: {str(e)}", level=Qgis.Critical)
+            self.process_altitude_check(dialog)
 
 ######################################################################################
 ####    Fonction de traitement pour les sous-modules altitude relative et visualisation
 ######################################################################################
+# Les calculs lourds sont exécutés dans des tâches de fond (core/tasks.py), les couches
+# résultats sont ajoutées au projet dans le thread principal à la fin de chaque tâche.
 # Le calcul des altitudes illicites est géré dans altitude_analyzer.py 
 
+    def _run_task(self, description, function, on_finished, *args, **kwargs):
+        """Lancer un calcul dans une tâche de fond QGIS"""
+        def finished(result, exception):
+            self.tasks.remove(task)
+            on_finished(result, exception)
+        
+        # Conserver une référence Python tant que la tâche est en cours
+        task = PluginTask(description, function, finished, *args, **kwargs)
+        self.tasks.append(task)
+        QgsApplication.taskManager().addTask(task)
+        return task
+
+    def _report_task_error(self, exception, message, log_prefix):
+        """Afficher et journaliser l'erreur d'une tâche de fond"""
+        self.iface.messageBar().pushMessage(
+            "Erreur", f"{message}: {str(exception)}", 
+            level=Qgis.Critical
+        )
+        QgsMessageLog.logMessage(f"{log_prefix}: {str(exception)}", 
+                               level=Qgis.Critical)
+
     def process_altitude_calculation(self, dialog):
         """Traiter le calcul d'altitude relative"""
         try:
             # Récupérer les couches sélectionnées
-            mnt_layer = dialog.mnt_combo.currentLayer()
+            mnt_layer = dialog.get_mnt_source()
             polyline_layer = dialog.polyline_combo.currentLayer()
             altitude_field = dialog.altitude_field_combo.currentData()
             use_z_coordinate = not altitude_field
             output_crs = dialog.crs_selector.crs()
+            sampling_method = dialog.sampling_method_combo.currentData()
+            create_new_layer = dialog.create_new_layer_check.isChecked()
             
-            # Créer ou modifier la couche
-            if dialog.create_new_layer_check.isChecked():
-                output_layer = self.calculator.create_output_layer(polyline_layer, output_crs)
-            else:
-                output_layer = polyline_layer
-                self.calculator.add_altitude_fields(output_layer)
-            
-            # Définir la fonction de callback pour la progression
-            def update_progress(value, maximum=None):
-                if maximum is not None:
-                    dialog.progress_bar.setRange(0, maximum)
-                dialog.progress_bar.setValue(value)
-            
-            # Afficher la barre de progression
-            dialog.progress_bar.setVisible(True)
-            
-            # Calculer les altitudes relatives
-            success, msg = self.calculator.calculate_relative_altitudes(
-                mnt_layer, output_layer, altitude_field, use_z_coordinate, update_progress
+            # Calculateur propre à la tâche : une tâche précédente peut encore utiliser le sien
+            calculator = AltitudeCalculator(
+                workers=dialog.workers_spin.value(),
+                use_cache=dialog.use_cache_check.isChecked()
             )
+            calculator.terrain_store_path = dialog.get_terrain_store_path()
+            calculator.store_terrain_profiles = dialog.store_profiles_check.isChecked()
+            calculator.profile_clearance = dialog.profile_clearance_check.isChecked()
+            calculator.corridor_radius = dialog.corridor_radius_spin.value()
+            calculator.clearance_threshold = dialog.threshold_spin.value()
+            
+            # Les champs d'une couche du projet sont ajoutés dans le thread principal ;
+            # la couche reste verrouillée jusqu'à l'écriture des résultats, à la fin de la tâche
+            in_place_layer = None
+            if not create_new_layer:
+                # Les résultats sont écrits dans le fournisseur : la session d'édition est
+                # fermée, ses modifications ne sont enregistrées qu'avec l'accord de l'utilisateur
+                if polyline_layer.isEditable():
+                    if polyline_layer.isModified():
+                        answer = QMessageBox.question(
+                            self.iface.mainWindow(), "Modifications non enregistrées",
+                            f"La couche « {polyline_layer.name()} » contient des modifications "
+                            "non enregistrées.\nLes enregistrer avant de calculer les "
+                            "altitudes relatives ?",
+                            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+                        )
+                        if answer != QMessageBox.Yes:
+                            self.iface.messageBar().pushMessage(
+                                "Annulé", "Calcul d'altitude relative annulé : "
+                                "modifications de la couche non enregistrées",
+                                level=Qgis.Warning
+                            )
+                            return
+                    if not polyline_layer.commitChanges():
+                        raise RuntimeError(
+                            "Impossible d'enregistrer les modifications de la couche : "
+                            + "; ".join(polyline_layer.commitErrors())
+                        )
+                calculator.add_altitude_fields(polyline_layer)
+                in_place_layer = polyline_layer
+            snapshot = LayerSnapshot(polyline_layer)
+            # MNT : fournisseur cloné, CRS et source copiés ici (dossier de tuiles : ouvert dans la tâche)
+            if not isinstance(mnt_layer, str):
+                mnt_layer = RasterSnapshot(mnt_layer)
             
-            if success:
-                # Ajouter la nouvelle couche au projet si nécessaire
-                if dialog.create_new_layer_check.isChecked():
-                    QgsProject.instance().addMapLayer(output_layer)
-                    
-                # Rafraîchir la couche
-                output_layer.triggerRepaint()
+            def compute(progress_callback):
+                # Nouvelle couche : créée et modifiée dans la tâche, qui en est propriétaire
+                output_layer = None
+                source = snapshot
+                if create_new_layer:
+                    output_layer = calculator.create_output_layer(
+                        snapshot, output_crs, progress_callback
+                    )
+                    source = output_layer
                 
-                self.iface.messageBar().pushMessage(
-                    "Succès", "Calcul d'altitude relative terminé", 
-                    level=Qgis.Success
+                # Calculer les altitudes relatives
+                success, msg, results = calculator.calculate_relative_altitudes(
+                    mnt_layer, source, altitude_field, use_z_coordinate, progress_callback,
+                    sampling_method=sampling_method
                 )
+                if create_new_layer:
+                    if success:
+                        calculator.write_altitude_results(output_layer, results, progress_callback)
+                        results = None
+                    move_to_main_thread(output_layer)
+                return output_layer, success, msg, results
+            
+            if in_place_layer is not None:
+                in_place_layer.setReadOnly(True)
+            try:
+                self._run_task(
+                    "Calcul d'altitude relative", compute,
+                    lambda result, exception: self._altitude_calculation_finished(
+                        result, exception, calculator, in_place_layer
+                    )
+                )
+            except Exception:
+                if in_place_layer is not None:
+                    in_place_layer.setReadOnly(False)
+                raise
+            
+        except Exception as e:
+            self._report_task_error(e, "Erreur lors du calcul", "Erreur altitude relative")
+
+    def _altitude_calculation_finished(self, result, exception, calculator, in_place_layer):
+        """
+        Finaliser le calcul d'altitude relative (thread principal)
+        
+        Les résultats d'une couche modifiée sur place y sont écrits ensuite
+        par lots (_write_in_place) ; la couche reste verrouillée jusque-là.
+        """
+        if exception is not None or result is None:
+            if in_place_layer is not None:
+                in_place_layer.setReadOnly(False)
+            if exception is not None:
+                self._report_task_error(exception, "Erreur lors du calcul", "Erreur altitude relative")
             else:
                 self.iface.messageBar().pushMessage(
-                    "Erreur", f"Le calcul a échoué : {msg}", 
-                    level=Qgis.Critical
+                    "Annulé", "Calcul d'altitude relative annulé", 
+                    level=Qgis.Warning
                 )
+            return
+        
+        output_layer, success, msg, results = result
+        if success and in_place_layer is not None:
+            self._write_in_place(calculator, in_place_layer, results)
+            return
+        if in_place_layer is not None:
+            in_place_layer.setReadOnly(False)
+        self._altitude_calculation_done(output_layer, success, msg,
+                                        add_to_project=in_place_layer is None)
+
+    def _write_in_place(self, calculator, layer, results):
+        """
+        Écrire les résultats dans une couche du projet depuis le thread principal
+        
+        Un lot d'entités est écrit à chaque passage de la boucle d'événements,
+        l'interface reste réactive ; l'avancement est affiché dans la barre
+        de messages.
+        """
+        writes = calculator.iter_altitude_writes(layer, results, self.IN_PLACE_BATCH_SIZE)
+        message = self.iface.messageBar().createMessage(
+            "Altitude relative", f"Écriture des résultats dans {layer.name()}..."
+        )
+        progress_bar = QProgressBar()
+        progress_bar.setMaximum(100)
+        message.layout().addWidget(progress_bar)
+        self.iface.messageBar().pushWidget(message, Qgis.Info)
+        
+        def write_batch():
+            # Couche retirée du projet pendant l'écriture
+            if sip.isdeleted(layer):
+                self.iface.messageBar().popWidget(message)
+                self._altitude_calculation_done(None, False, "couche supprimée pendant l'écriture",
+                                                add_to_project=False)
+                return
+            try:
+                written, total = next(writes)
+                progress_bar.setValue(int(100 * written / total))
+                QTimer.singleShot(0, write_batch)
+                return
+            except StopIteration:
+                success, msg = True, None
+            except Exception as e:
+                success, msg = False, str(e)
+            self.iface.messageBar().popWidget(message)
+            layer.setReadOnly(False)
+            self._altitude_calculation_done(layer, success, msg, add_to_project=False)
+        
+        QTimer.singleShot(0, write_batch)
+
+    def _altitude_calculation_done(self, output_layer, success, msg, add_to_project):
+        """Afficher le résultat du calcul d'altitude relative"""
+        if success:
+            # Ajouter la nouvelle couche au projet si nécessaire
+            if add_to_project:
+                QgsProject.instance().addMapLayer(output_layer)
+                
+            # Rafraîchir la couche
+            output_layer.triggerRepaint()
             
-        except Exception as e:
             self.iface.messageBar().pushMessage(
-                "Erreur", f"Erreur lors du calcul: {str(e)}", 
+                "Succès", "Calcul d'altitude relative terminé", 
+                level=Qgis.Success
+            )
+        else:
+            self.iface.messageBar().pushMessage(
+                "Erreur", f"Le calcul a échoué : {msg}", 
                 level=Qgis.Critical
             )
-            QgsMessageLog.logMessage(f"Erreur altitude relative: {str(e)}", 
-                                   level=Qgis.Critical)
-        finally:
-            dialog.progress_bar.setVisible(False)
 
-            
     def process_visualization(self, dialog):
         """Traiter la visualisation des segments"""
         try:
             source_layer = dialog.layer_combo.currentLayer()
             segment_length = dialog.length_spin.value()
+            add_to_project = dialog.create_new_layer_check.isChecked()
+            use_pyramid = (dialog.pyramid_check.isChecked()
+                           and dialog.output_mode_combo.currentData() == "segments")
             
-            # Configurer le visualiseur
-            self.visualizer.segment_length = segment_length
-            self.visualizer.color_stops = dialog.get_color_stops()  # Utiliser les couleurs configurées
+            # Configurer un visualiseur propre à la tâche (le cache des découpages reste partagé)
+            visualizer = copy.copy(self.visualizer)
+            visualizer.segment_length = segment_length
+            visualizer.output_mode = dialog.output_mode_combo.currentData()
+            visualizer.workers = dialog.workers_spin.value()
+            visualizer.output_path = dialog.get_output_path()
+            visualizer.color_stops = dialog.get_color_stops()  # Utiliser les couleurs configurées
+            visualizer.color_table = dialog.get_color_table()
             
-            # Créer la couche de segments
-            output_layer = self.visualizer.create_segment_layer(source_layer)
+            # Seules les couleurs ont changé : recolorer la couche existante sans la redécouper
+            # (une autre destination, mémoire ou fichier, impose de réécrire les segments)
+            if visualizer.output_mode == "segments" and not use_pyramid:
+                entry = visualizer.cached_segmentation(source_layer, segment_length)
+                if entry is not None and entry["output_path"] == visualizer.output_path:
+                    visualizer.recolor_segments(entry)
+                    self.iface.messageBar().pushMessage(
+                        "Succès", f"Couleurs de la couche {entry['layer'].name()} mises à jour", 
+                        level=Qgis.Success
+                    )
+                    return
             
-            # Ajouter la couche au projet
-            if dialog.create_new_layer_check.isChecked():
-                QgsProject.instance().addMapLayer(output_layer)
-                
-            # Message de succès
+            snapshot = LayerSnapshot(source_layer)
+            
+            def compute(progress_callback):
+                # Créer la couche de segments (ou une couche par niveau de la pyramide)
+                if use_pyramid:
+                    output_layers = visualizer.create_segment_pyramid(
+                        snapshot, progress_callback=progress_callback
+                    )
+                else:
+                    output_layers = [visualizer.create_segment_layer(
+                        snapshot, progress_callback=progress_callback
+                    )]
+                return [move_to_main_thread(layer) for layer in output_layers]
+            
+            self._run_task(
+                "Création des segments colorés", compute,
+                lambda result, exception: self._visualization_finished(
+                    result, exception, add_to_project
+                )
+            )
+            
+        except Exception as e:
+            self._report_task_error(e, "Erreur lors de la création des segments", 
+                                    "Erreur visualisation segments")
+
+    def _visualization_finished(self, output_layers, exception, add_to_project):
+        """Finaliser la visualisation des segments (thread principal)"""
+        if exception is not None:
+            self._report_task_error(exception, "Erreur lors de la création des segments", 
+                                    "Erreur visualisation segments")
+            return
+        if output_layers is None:
             self.iface.messageBar().pushMessage(
-                "Succès", "Segments créés avec succès", 
-                level=Qgis.Success
+                "Annulé", "Création des segments annulée", 
+                level=Qgis.Warning
             )
+            return
+        
+        # Ajouter les couches au projet
+        if add_to_project:
+            for output_layer in output_layers:
+                QgsProject.instance().addMapLayer(output_layer)
+            
+        # Message de succès
+        self.iface.messageBar().pushMessage(
+            "Succès", "Segments créés avec succès", 
+            level=Qgis.Success
+        )
+
+    def process_altitude_check(self, dialog):
+        """Traiter la détection des segments sous altitude minimale"""
+        try:
+            source_layer = dialog.layer_combo.currentLayer()
+            min_altitude = dialog.min_altitude_spin.value()
+            buffer_size = dialog.buffer_spin.value()
+            capture_folder = dialog.get_output_folder()
+            detection_only = dialog.detection_only_check.isChecked()
             
+            # Vérifier la correspondance des CRS avant de commencer
+            if not self.altitude_analyzer.check_crs_compatibility(source_layer):
+                raise ValueError("CRS de la couche source ne correspond pas au CRS du projet.")
+            
+            # Couche des groupes d'une détection précédente : captures seules
+            # (groupes sélectionnés, ou tous s'il n'y a pas de sélection)
+            if self.altitude_analyzer.is_group_layer(source_layer):
+                groups = self.altitude_analyzer.groups_from_layer(source_layer)
+                self._altitude_check_finished((groups, None), None, min_altitude,
+                                              buffer_size, capture_folder)
+                return
+            
+            snapshot = LayerSnapshot(source_layer)
+            group_layer_name = f"{source_layer.name()}_groupes_sous_{min_altitude:g}m"
+            
+            def detect(progress_callback):
+                # Phase de détection ; couche des groupes en mode détection seule
+                groups = self.altitude_analyzer.analyze_segments(
+                    snapshot, min_altitude, progress_callback=progress_callback
+                )
+                group_layer = None
+                if detection_only:
+                    group_layer = move_to_main_thread(self.altitude_analyzer.create_group_layer(
+                        groups, snapshot.crs(), group_layer_name
+                    ))
+                return groups, group_layer
+            
+            # Détection en arrière-plan, captures dans le thread principal
+            self._run_task(
+                "Détection des segments sous altitude minimale", detect,
+                lambda result, exception: self._altitude_check_finished(
+                    result, exception, min_altitude, buffer_size, capture_folder
+                )
+            )
         except Exception as e:
+            self._report_task_error(e, "Erreur lors de la détection", "Erreur détection segments")
+
+    def _altitude_check_finished(self, result, exception, min_altitude, buffer_size, capture_folder):
+        """Générer les captures et afficher le bilan de la détection (thread principal)"""
+        if exception is not None:
+            self._report_task_error(exception, "Erreur lors de la détection", "Erreur détection segments")
+            return
+        if result is None:
             self.iface.messageBar().pushMessage(
-                "Erreur", f"Erreur lors de la création des segments: {str(e)}", 
-                level=Qgis.Critical
+                "Annulé", "Détection des segments annulée", level=Qgis.Warning)
+            return
+        
+        groups, group_layer = result
+        if group_layer is not None:
+            # Détection seule : les captures seront faites depuis la couche des groupes
+            QgsProject.instance().addMapLayer(group_layer)
+            self.iface.messageBar().pushMessage(
+                "Succès", f"{len(groups)} groupe(s) sous l'altitude minimale de {min_altitude}m "
+                f"dans la couche {group_layer.name()}",
+                level=Qgis.Success
             )
-            QgsMessageLog.logMessage(
-                f"Erreur visualisation segments: {str(e)}", 
-                level=Qgis.Critical
+            return
+        
+        try:
+            low_segments = self.altitude_analyzer.capture_groups(groups, buffer_size, capture_folder)
+            
+            # Afficher les résultats
+            message = self.altitude_analyzer.format_results_message(
+                low_segments, 
+                min_altitude, 
+                capture_folder
             )
-    
\ No newline at end of file
+            
+            info_dialog = QDialog(self.iface.mainWindow())
+            info_dialog.setWindowTitle("Analyse terminée")
+            info_dialog.resize(400, 300)
+
+            layout = QVBoxLayout()
+
+            # Message scrollable
+            text_edit = QTextEdit()
+            text_edit.setReadOnly(True)
+            text_edit.setText(message)
+            layout.addWidget(text_edit)
+
+            # Bouton "Ouvrir le dossier" pleine largeur
+            open_folder_button = QPushButton("Ouvrir le dossier")
+            open_folder_button.setMaximumWidth(16777215)  # Permet de s'étendre sur toute la largeur
+            open_folder_button.clicked.connect(lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(capture_folder)))
+            layout.addWidget(open_folder_button)
+
+            # Bouton OK pour fermer
+            ok_button = QPushButton("OK")
+            ok_button.clicked.connect(info_dialog.accept)
+            layout.addWidget(ok_button)
+            info_dialog.setLayout(layout)
+            info_dialog.exec_()
+        except Exception as e:
+            self._report_task_error(e, "Erreur lors de la détection", "Erreur détection segments")
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Configuration des tests : les modules testés (noyaux NumPy) sont importés
+depuis la racine du plugin, sans QGIS
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des noyaux d'échantillonnage du MNT
+"""
+
+import unittest
+
+import numpy as np
+
+from src.core.sampling_kernels import block_extrema, threshold_classes
+
+
+class TestThresholdClasses(unittest.TestCase):
+
+    def test_isolated_peak_is_refined(self):
+        """Un pic isolé dans une cellule de pyramide ne classe pas la trace sous le seuil"""
+        ground = np.zeros((16, 16))
+        ground[3, 7] = 80.0
+        ground_min, ground_max = block_extrema(ground, 16)
+
+        # Trace à 150 m au-dessus d'un sol plat, loin du pic
+        z = np.array([150.0])
+        surely_below, uncertain = threshold_classes(z, ground_min[0], ground_max[0], 100.0)
+        self.assertFalse(surely_below[0])
+        self.assertTrue(uncertain[0])
+
+        # Affinage à pleine résolution : sol réel sous le point (pixel 10, 10)
+        below = surely_below | (uncertain & (z - ground[10, 10] < 100.0))
+        self.assertFalse(below[0])
+
+    def test_bounds(self):
+        """Points sûrement sous le seuil, sûrement au-dessus et incertains"""
+        z = np.array([50.0, 300.0, 150.0])
+        ground_min = np.zeros(3)
+        ground_max = np.full(3, 80.0)
+        surely_below, uncertain = threshold_classes(z, ground_min, ground_max, 100.0)
+        np.testing.assert_array_equal(surely_below, [True, False, False])
+        np.testing.assert_array_equal(uncertain, [False, False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
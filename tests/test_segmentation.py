@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du découpage des lignes 3D en segments de longueur fixe
+"""
+
+import unittest
+import warnings
+
+import numpy as np
+
+from src.core.visualization.segmentation import split_lines_3d
+
+
+class TestSplitLines3d(unittest.TestCase):
+
+    def test_fixed_length(self):
+        """Une ligne de 10 m donne deux segments de 5 m"""
+        coords = np.array([[0, 0, 100], [10, 0, 100]], dtype=float)
+        _, seg_offsets, z_avg, length, line = split_lines_3d(coords, [0, 2], 5.0)
+        np.testing.assert_array_equal(seg_offsets, [0, 2, 4])
+        np.testing.assert_allclose(z_avg, [100.0, 100.0])
+        np.testing.assert_allclose(length, [5.0, 5.0])
+        np.testing.assert_array_equal(line, [0, 0])
+
+    def test_line_without_z(self):
+        """Une ligne sans Z forme un seul segment NaN, sans perturber les suivantes"""
+        coords = np.array([
+            [0, 0, np.nan], [5, 0, np.nan], [9, 0, np.nan],
+            [0, 0, 50], [10, 0, 50],
+        ], dtype=float)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            points, seg_offsets, z_avg, length, line = split_lines_3d(coords, [0, 3, 5], 5.0)
+
+        np.testing.assert_array_equal(line, [0, 1, 1])
+        np.testing.assert_array_equal(seg_offsets[:2], [0, 3])
+        np.testing.assert_array_equal(points[:3, :2], coords[:3, :2])
+        self.assertTrue(np.isnan(z_avg[0]))
+        self.assertTrue(np.isnan(length[0]))
+        np.testing.assert_allclose(z_avg[1:], [50.0, 50.0])
+        np.testing.assert_allclose(length[1:], [5.0, 5.0])
+
+
+if __name__ == "__main__":
+    unittest.main()